@@ -3,21 +3,27 @@ import asyncio
 import aiofiles
 import hashlib
 import datetime
-import aiosqlite
+import time
+from collections import OrderedDict
 
 from aiohttp import web
-from pydub import AudioSegment
-from pydub.silence import detect_silence as pydub_detect_silence
 
 from env_keys import get_openai_api_key, get_hume_api_key
-from session_helpers import get_last_session_id, retrieve_face_emotions
+from database import db
+from session_helpers import retrieve_face_emotions
+from emotion_state import describe_emotion_state, update_emotion_state, warm_start_emotion_state
+from conversation_memory import load_memory, render_memory
+from conversation_search import format_recalled_turns, search_turns
 
 from openai_configs import (
     generate_openai_response,
     handle_conversation_starter, 
     save_conversation_data, 
+    show_fallback_reply,
     transcribe_audio
 )
+from prosody_analysis import analyze_prosody_chunks, save_prosody_analysis
+from replay import note_upload
 
 from config import (
     SESSION_TIMEOUT,
@@ -28,19 +34,52 @@ from config import (
     CHUNK_SIZE_MS,
     IMAGES_PER_BATCH,
     AUDIO_FILE_EXT,
+    AUDIO_SESSION_IDLE_TTL_S,
+    TURN_ANALYSIS_DEADLINE_S,
+    TURN_REPLY_DEADLINE_S,
+    FTS_RECALL_LIMIT,
+    MEMORY_RECENT_TURNS,
     UPLOAD_DIR,
-    PROCESSED_DIR, 
-    DB_FILE
+    PROCESSED_DIR
 )
 
+from lazy_imports import lazy_from
 from logger import logger
 
+AudioSegment = lazy_from("pydub", "AudioSegment")
+pydub_detect_silence = lazy_from("pydub.silence", "detect_silence")
+
 audio_file_counter = 0
 processed_hashes = set()
-silence_counter = 0
-leftover_segment = AudioSegment.empty()
-current_speech_chunks = []
-current_speech_range = []
+
+
+class AudioSessionState:
+    """Per-session audio buffers and counters, so concurrent sessions in one worker never mix audio."""
+
+    def __init__(self):
+        self.silence_counter = 0
+        self.leftover_segment = AudioSegment.empty()
+        self.current_speech_chunks = []
+        self.current_speech_range = []
+        self.lock = asyncio.Lock()  # a session's uploads are processed one at a time, in arrival order
+
+
+audio_sessions = OrderedDict()  # session_id -> AudioSessionState, least recently used first
+_last_upload = {}  # session_id -> time.monotonic() of its last upload
+
+
+def _touch(session_id):
+    """Mark the session as active and drop the audio state (and lock) of sessions idle for AUDIO_SESSION_IDLE_TTL_S."""
+    now = time.monotonic()
+    _last_upload[session_id] = now
+    audio_sessions.move_to_end(session_id)
+    while audio_sessions:
+        oldest = next(iter(audio_sessions))
+        if now - _last_upload[oldest] < AUDIO_SESSION_IDLE_TTL_S or audio_sessions[oldest].lock.locked():
+            break
+        audio_sessions.popitem(last=False)
+        del _last_upload[oldest]
+        logger.debug(f"Audio state of idle session {oldest} dropped.")
 
 
 # Path to a single combined WAV file that accumulates all valid (non-duplicate) audio
@@ -75,12 +114,13 @@ async def handle_audio_upload(request):
             await f.write(chunk)
 
     logger.info(f"Audio file uploaded: {save_path}")
+    await note_upload(request, field.filename or filename, "audio/webm", path=save_path)
     # Process in background
-    asyncio.create_task(process_uploaded_audio(save_path, base_filename))
+    asyncio.create_task(process_uploaded_audio(save_path, base_filename, request["session_id"]))
     return web.Response(text="Audio uploaded successfully")
 
 
-async def process_uploaded_audio(file_path, base_filename):
+async def process_uploaded_audio(file_path, base_filename, session_id):
     """
     1) Check duplicate (server side). If duplicate => remove, return.
     2) Convert upload to WAV (16kHz mono).
@@ -88,161 +128,170 @@ async def process_uploaded_audio(file_path, base_filename):
     4) While leftover_segment >= 5 seconds, export a 5-second chunk + process it.
     5) Remove original upload + temp WAV at the end.
     """
-    import datetime
+    if not session_id:
+        logger.error("No session ID for this upload. Cannot process audio.")
+        return
+    state = audio_sessions.setdefault(session_id, AudioSessionState())
+    _touch(session_id)
+    async with state.lock:
+        await _process_session_audio(state, file_path, base_filename, session_id)
 
-    global silence_counter, leftover_segment
 
+async def _process_session_audio(state, file_path, base_filename, session_id):
     try:
-        async with aiosqlite.connect(DB_FILE) as db_conn:
-            session_id = await get_last_session_id(db_conn)
-            if not session_id:
-                logger.error("No session ID found in users. Cannot process audio.")
-                return
-
-            # 1) Duplicate check
-            if await is_duplicate_audio(file_path):
-                logger.info(f"Duplicate audio. Removing: {file_path}")
-                os.remove(file_path)
-                return
-
-            # 2) Convert to WAV
-            wav_path = await convert_to_wav(file_path, base_filename)
-            if not wav_path or not os.path.exists(wav_path):
-                logger.error("WAV conversion failed. Removing original.")
-                os.remove(file_path)
-                return
-
-            # Load new WAV into memory
+        await warm_start_emotion_state(session_id)
+        await load_memory(session_id)
+
+        # 1) Duplicate check
+        if await is_duplicate_audio(file_path):
+            logger.info(f"Duplicate audio. Removing: {file_path}")
+            os.remove(file_path)
+            return
+
+        # 2) Convert to WAV
+        wav_path = await convert_to_wav(file_path, base_filename)
+        if not wav_path or not os.path.exists(wav_path):
+            logger.error("WAV conversion failed. Removing original.")
+            os.remove(file_path)
+            return
+
+        # Load new WAV into memory
+        try:
+            new_seg = AudioSegment.from_file(wav_path)
+        except Exception as e:
+            logger.error(f"Could not read newly converted WAV: {e}")
+            os.remove(file_path)
+            os.remove(wav_path)
+            return
+
+        # 3) Append to the session's leftover_segment (in-memory)
+        state.leftover_segment += new_seg
+
+        # 4) While leftover >= 5s, export chunk and process
+        while len(state.leftover_segment) >= CHUNK_SIZE_MS:  # 5000ms
+            # Slice out the first 5s
+            five_sec = state.leftover_segment[:CHUNK_SIZE_MS]
+            # Remove that 5s from the front of leftover_segment
+            state.leftover_segment = state.leftover_segment[CHUNK_SIZE_MS:]
+
+            # Export this chunk as a temporary WAV file
+            ts = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+            chunk_name = f"{base_filename}_session_{session_id}_chunk_{ts}.wav"
+            chunk_path = os.path.join(PROCESSED_DIR, chunk_name)
+            five_sec.export(chunk_path, format='wav')
+
+            logger.info(f"Created 5-second chunk: {chunk_path} (duration={len(five_sec)}ms)")
+
+            # -- Process the chunk (silence detection, counters, etc.) --
             try:
-                new_seg = AudioSegment.from_file(wav_path)
+                seg = AudioSegment.from_file(chunk_path)
             except Exception as e:
-                logger.error(f"Could not read newly converted WAV: {e}")
-                os.remove(file_path)
-                os.remove(wav_path)
-                return
-
-            # 3) Append to leftover_segment (in-memory)
-            leftover_segment += new_seg
-
-            # 4) While leftover >= 5s, export chunk and process
-            while len(leftover_segment) >= CHUNK_SIZE_MS:  # 5000ms
-                # Slice out the first 5s
-                five_sec = leftover_segment[:CHUNK_SIZE_MS]
-                # Remove that 5s from the front of leftover_segment
-                leftover_segment = leftover_segment[CHUNK_SIZE_MS:]
-
-                # Export this chunk as a temporary WAV file
-                ts = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                chunk_name = f"{base_filename}_session_{session_id}_chunk_{ts}.wav"
-                chunk_path = os.path.join(PROCESSED_DIR, chunk_name)
-                five_sec.export(chunk_path, format='wav')
-
-                logger.info(f"Created 5-second chunk: {chunk_path} (duration={len(five_sec)}ms)")
-
-                # -- Process the chunk (silence detection, counters, etc.) --
+                logger.warning(f"Unreadable chunk {chunk_path}: {e}")
+                if os.path.exists(chunk_path):
+                    os.remove(chunk_path)
+                continue
+
+            dur = len(seg)
+            if dur < MIN_AUDIO_DURATION_MS:
+                logger.info(f"Removing sub-min chunk {chunk_path} (duration={dur}ms)")
+                if os.path.exists(chunk_path):
+                    os.remove(chunk_path)
+                continue
+
+            # Check silence
+            is_silent = await detect_silence(chunk_path)
+            if is_silent:
+                state.silence_counter += 1
+                logger.info(f"Silent chunk detected. Counter: {state.silence_counter}")
+
+                base_noext, ext = os.path.splitext(chunk_path)
+                renamed_path = f"{base_noext}_silence{ext}"
                 try:
-                    seg = AudioSegment.from_file(chunk_path)
-                except Exception as e:
-                    logger.warning(f"Unreadable chunk {chunk_path}: {e}")
+                    os.rename(chunk_path, renamed_path)
+                    logger.info(f"Renamed silent chunk => {renamed_path}")
                     if os.path.exists(chunk_path):
                         os.remove(chunk_path)
-                    continue
-
-                dur = len(seg)
-                if dur < MIN_AUDIO_DURATION_MS:
-                    logger.info(f"Removing sub-min chunk {chunk_path} (duration={dur}ms)")
-                    if os.path.exists(chunk_path):
-                        os.remove(chunk_path)
-                    continue
-
-                # Check silence
-                is_silent = await detect_silence(chunk_path)
-                if is_silent:
-                    silence_counter += 1
-                    logger.info(f"Silent chunk detected. Counter: {silence_counter}")
-
-                    base_noext, ext = os.path.splitext(chunk_path)
-                    renamed_path = f"{base_noext}_silence{ext}"
-                    try:
-                        os.rename(chunk_path, renamed_path)
-                        logger.info(f"Renamed silent chunk => {renamed_path}")
-                        if os.path.exists(chunk_path):
-                            os.remove(chunk_path)
-                    except Exception as e:
-                        logger.error(f"Could not rename silent chunk: {e}")
-
-                    # If user was continuously speaking, now is the time to transcribe
-                    if current_speech_chunks:
-                        await transcribe_dynamic_chunks(current_speech_chunks, current_speech_range, session_id, db_conn)
-                        current_speech_chunks.clear()
-                        current_speech_range.clear()
-
-                else:
-                    # Reset silence counter since speech was detected
-                    silence_counter = 0
-                    current_speech_chunks.append(chunk_path)
-                    current_speech_range.append(len(current_speech_chunks))
-
-
-                    # ========== Silence Logic (1,2,4,6) ==========
-                    if silence_counter == 1:
-                        logger.info("User silent for 1 chunk. Transcribing...")
-                        # Save the concatenated audio to a temporary file
-                        temp_transcription_path = os.path.join(PROCESSED_DIR, f"temp_transcription_{session_id}.wav")
-                        combined_audio.export(temp_transcription_path, format='wav')
-
-                        # Transcribe using the saved file path
-                        transcription = await transcribe_audio(temp_transcription_path)
-
-                        # Remove temp file after transcription
-                        if os.path.exists(temp_transcription_path):
-                            os.remove(temp_transcription_path)
-
-                        if transcription:
-                            face_emotions = await retrieve_face_emotions(db_conn)
-                            prompt = (
-                                f"The user was silent. Face emotions: {face_emotions}.\n"
-                                f"User's last transcript: {transcription}\n"
-                                "Please generate a friendly, helpful response."
-                            )
-                            ai_resp = await generate_openai_response(prompt)
-                            if ai_resp:
-                                await save_conversation_data(db_conn, session_id,
-                                                             transcription, ai_resp) # bug fix
-
-                    elif silence_counter == 6:
-                        logger.info("User silent for 6 chunks. Starting conversation.")
-                        await handle_conversation_starter(session_id)
-
-                    elif silence_counter == 12:
-                        logger.info("User silent for 12 chunks. Calling user.")
-                        hey_prompt = (
-                            "User has been silent for 4 chunks (~20 seconds). "
-                            "Politely ask if they're still there."
+                except Exception as e:
+                    logger.error(f"Could not rename silent chunk: {e}")
+
+                # If user was continuously speaking, now is the time to transcribe
+                if state.current_speech_chunks:
+                    await transcribe_dynamic_chunks(state.current_speech_chunks, state.current_speech_range, session_id)
+                    state.current_speech_chunks.clear()
+                    state.current_speech_range.clear()
+
+            else:
+                # Reset silence counter since speech was detected
+                state.silence_counter = 0
+                state.current_speech_chunks.append(chunk_path)
+                state.current_speech_range.append(len(state.current_speech_chunks))
+
+
+                # ========== Silence Logic (1,2,4,6) ==========
+                if state.silence_counter == 1:
+                    logger.info("User silent for 1 chunk. Transcribing...")
+                    # Save the concatenated audio to a temporary file
+                    temp_transcription_path = os.path.join(PROCESSED_DIR, f"temp_transcription_{session_id}.wav")
+                    combined_audio.export(temp_transcription_path, format='wav')
+
+                    # Transcribe using the saved file path
+                    transcription = await transcribe_audio(temp_transcription_path)
+
+                    # Remove temp file after transcription
+                    if os.path.exists(temp_transcription_path):
+                        os.remove(temp_transcription_path)
+
+                    if transcription:
+                        face_emotions = describe_emotion_state(session_id, "face")
+                        if not face_emotions:
+                            async with db.connection() as db_conn:
+                                face_emotions = await retrieve_face_emotions(db_conn, session_id)
+                        prompt = (
+                            f"{render_memory(session_id)}\n"
+                            f"The user was silent. Face emotions: {face_emotions}.\n"
+                            f"Voice mood over the conversation: {describe_emotion_state(session_id, 'prosody') or 'Unavailable'}.\n"
+                            f"User's last transcript: {transcription}\n"
+                            "Please generate a friendly, helpful response."
                         )
-                        hey_resp = await generate_openai_response(hey_prompt)
-                        if hey_resp:
-                            await save_conversation_data(db_conn, session_id, 
-                                                         "Are you there?", 
-                                                         hey_resp) # bug fix
-                            logger.info(f"Sent 'Hey are you there?' => {hey_resp}")
-
-                    elif silence_counter == 20:
-                        logger.info("User silent for 6 chunks (~30 seconds). Shutting down the app.")
-                        os._exit(0)
-
-            # 5) Cleanup original files
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            if os.path.exists(wav_path):
-                os.remove(wav_path)
+                        ai_resp = await generate_openai_response(prompt)
+                        if ai_resp:
+                            save_conversation_data(session_id,
+                                                   transcription, ai_resp) # bug fix
+
+                elif state.silence_counter == 6:
+                    logger.info("User silent for 6 chunks. Starting conversation.")
+                    await handle_conversation_starter(session_id)
+
+                elif state.silence_counter == 12:
+                    logger.info("User silent for 12 chunks. Calling user.")
+                    hey_prompt = (
+                        f"{render_memory(session_id)}\n"
+                        "User has been silent for 4 chunks (~20 seconds). "
+                        "Politely ask if they're still there."
+                    )
+                    hey_resp = await generate_openai_response(hey_prompt)
+                    if hey_resp:
+                        save_conversation_data(session_id,
+                                               "Are you there?",
+                                               hey_resp) # bug fix
+                        logger.info(f"Sent 'Hey are you there?' => {hey_resp}")
+
+                elif state.silence_counter == 20:
+                    logger.info("User silent for 6 chunks (~30 seconds). Shutting down the app.")
+                    os._exit(0)
+
+        # 5) Cleanup original files
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
 
     except Exception as e:
         logger.error(f"Error in process_uploaded_audio: {e}")
 
 # ------Dynamic Chunking------------
 
-async def transcribe_dynamic_chunks(chunk_files, chunk_range, session_id, db_conn):
+async def transcribe_dynamic_chunks(chunk_files, chunk_range, session_id):
     """
     Dynamically concatenates all consecutive non-silent chunks before a silence,
     sends it for transcription, and records the chunk range in the database.
@@ -264,26 +313,57 @@ async def transcribe_dynamic_chunks(chunk_files, chunk_range, session_id, db_con
     temp_transcription_path = os.path.join(PROCESSED_DIR, f"temp_transcription_{session_id}.wav")
     combined_audio.export(temp_transcription_path, format='wav')
 
-    # Transcribe using the saved file path
-    transcription = await transcribe_audio(temp_transcription_path)
+    # Fan the same speech out to transcription and prosody under one shared deadline.
+    # Prosody stops shortly after the transcript lands, so it adds no turn latency.
+    # GPT gets whatever is left of the turn's reply budget.
+    now = asyncio.get_running_loop().time()
+    deadline = now + TURN_ANALYSIS_DEADLINE_S
+    reply_deadline = now + TURN_REPLY_DEADLINE_S
+    transcription_task = asyncio.ensure_future(transcribe_audio(temp_transcription_path, deadline=deadline))
+    transcription, prosody_turn = await asyncio.gather(
+        transcription_task,
+        analyze_prosody_chunks(chunk_files, deadline, until=transcription_task),
+    )
 
     # Remove the temp file after transcription
     if os.path.exists(temp_transcription_path):
         os.remove(temp_transcription_path)
 
+    if prosody_turn.analyzed_chunks:
+        update_emotion_state(session_id, "prosody", prosody_turn.scores())
+        save_prosody_analysis(session_id, chunk_range, prosody_turn)
+
     if transcription:
-        face_emotions = await retrieve_face_emotions(db_conn)
+        # In-memory rolling mood; the DB is only consulted before the first face result lands.
+        face_emotions = describe_emotion_state(session_id, "face")
+        async with db.connection() as db_conn:
+            if not face_emotions:
+                face_emotions = await retrieve_face_emotions(db_conn, session_id)
+            # Earlier turns of this user that match what they just said (FTS5, indexed)
+            recalled = await search_turns(
+                db_conn, transcription, same_user_as=session_id,
+                limit=FTS_RECALL_LIMIT, exclude_recent=MEMORY_RECENT_TURNS,
+            )
+        related = f"Related earlier topics:\n{format_recalled_turns(recalled)}\n" if recalled else ""
         prompt = (
+            f"{render_memory(session_id)}\n"
+            f"{related}"
             f"User spoke continuously for {len(chunk_files) * 5} seconds. "
             f"Face emotions: {face_emotions}.\n"
+            f"Voice emotions: {prosody_turn.summary()}.\n"
+            f"Voice mood over the conversation: {describe_emotion_state(session_id, 'prosody') or 'Unavailable'}.\n"
             f"Full transcript: {transcription}\n"
             "Provide a meaningful response with full context."
         )
-        ai_resp = await generate_openai_response(prompt)
+        ai_resp = await generate_openai_response(prompt, deadline=reply_deadline)
         if ai_resp:
-            await save_conversation_data(
-                db_conn, session_id, transcription, ai_resp, chunk_range
+            save_conversation_data(
+                session_id, transcription, ai_resp, chunk_range
             ) # check initial moood
+        else:
+            # The user spoke and is waiting: a canned reply beats silence when GPT is down or too slow.
+            # It is only shown, not stored, so it never becomes part of the conversation history.
+            show_fallback_reply(session_id)
 
     logger.info(f"Transcribed speech chunks {chunk_range} successfully.")
 
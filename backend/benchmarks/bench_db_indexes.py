@@ -0,0 +1,115 @@
+"""
+Benchmark of the hot-path queries on large tables, before and after the schema migrations.
+
+    python benchmarks/bench_db_indexes.py --rows 1000000
+
+Builds a throwaway database with --rows rows in users, conversation and face_analysis,
+times each query, applies migrations.MIGRATIONS and times them again. The last line
+times the cached SessionResolver hit path (one stat() of the session marker file).
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import apply_migrations_sync
+
+BASE_TABLES = [
+    '''CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, login_timestamp TEXT,
+       initial_mood TEXT, session_id TEXT)''',
+    '''CREATE TABLE conversation (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, session_id TEXT,
+       transcription TEXT, ai_response TEXT, chunk_range TEXT)''',
+    '''CREATE TABLE face_analysis (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, session_id TEXT,
+       face_file_name TEXT, face_emotions TEXT)''',
+    '''CREATE TABLE prosody_analysis (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, session_id TEXT,
+       chunk_range TEXT, complete INTEGER)''',
+]
+
+QUERIES = {
+    "latest session (get_last_session_id)":
+        ("SELECT session_id FROM users ORDER BY login_timestamp DESC LIMIT 1", False),
+    "initial mood by session":
+        ("SELECT initial_mood FROM users WHERE session_id = ? ORDER BY login_timestamp DESC LIMIT 1", True),
+    "last 10 turns of a session":
+        ("SELECT transcription, ai_response FROM conversation WHERE session_id = ? ORDER BY id DESC LIMIT 10", True),
+    "last face row of a session":
+        ("SELECT face_file_name FROM face_analysis WHERE session_id = ? ORDER BY id DESC LIMIT 1", True),
+}
+
+
+def populate(conn, rows, sessions):
+    start = 1_700_000_000
+    ts = lambda i: time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i))
+    conn.executemany(
+        "INSERT INTO users (username, login_timestamp, initial_mood, session_id) VALUES (?, ?, ?, ?)",
+        ((f"user{i % 50}", ts(i), "Calmness: 0.40", str(i % sessions)) for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO conversation (timestamp, session_id, transcription, ai_response, chunk_range) "
+        "VALUES (?, ?, ?, ?, ?)",
+        ((ts(i), str(random.randrange(sessions)), "hello there", "hi!", "[1, 2]") for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO face_analysis (timestamp, session_id, face_file_name) VALUES (?, ?, ?)",
+        ((ts(i), str(random.randrange(sessions)), f"face_{i}.jpg") for i in range(rows)),
+    )
+    conn.commit()
+
+
+def time_queries(conn, sessions, repeat):
+    results = {}
+    for name, (sql, takes_session) in QUERIES.items():
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            params = (str(random.randrange(sessions)),) if takes_session else ()
+            conn.execute(sql, params).fetchall()
+        results[name] = (time.perf_counter() - t0) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for sql in BASE_TABLES:
+            conn.execute(sql)
+
+        t0 = time.perf_counter()
+        populate(conn, args.rows, args.sessions)
+        print(f"Populated {args.rows:,} rows per table in {time.perf_counter() - t0:.1f}s")
+
+        before = time_queries(conn, args.sessions, args.repeat)
+        t0 = time.perf_counter()
+        apply_migrations_sync(conn)
+        print(f"Migrations applied in {time.perf_counter() - t0:.1f}s")
+        after = time_queries(conn, args.sessions, args.repeat)
+
+        print(f"\n{'query':<40}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+        for name in QUERIES:
+            print(f"{name:<40}{before[name]:>12.3f}{after[name]:>12.3f}{before[name] / after[name]:>9.0f}x")
+
+        marker = path + ".session"
+        open(marker, "a").close()
+        n = 100_000
+        t0 = time.perf_counter()
+        for _ in range(n):
+            os.stat(marker).st_mtime_ns
+        print(f"{'cached session resolver (stat only)':<40}{'':>12}{(time.perf_counter() - t0) / n * 1000:>12.4f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
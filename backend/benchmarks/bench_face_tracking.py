@@ -0,0 +1,110 @@
+"""
+Benchmark of face detection with and without tracking across consecutive frames.
+
+    python benchmarks/bench_face_tracking.py --source recording.mp4 --frames 300
+    python benchmarks/bench_face_tracking.py --source path/to/frames/ --redetect-every 5
+
+Reads --frames BGR frames from --source (a video file or a directory of images, as for
+LOGIN_FRAME_SOURCE) and runs both detection paths on one core (cv2.setNumThreads(1)):
+  - upload path: each frame JPEG-encoded, then face_detection.detect_largest_face;
+  - login path: login_capture.find_face_crop on the decoded frame.
+Each path runs full-frame on every frame, then with a FaceTrack. Reports frames per CPU-second,
+the share of frames answered by the region of interest, and how well the tracked boxes agree
+with the full-frame ones (mean IoU; frames where only one of the two found a face count as 0).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+import face_detection
+from face_tracking import FaceTrack
+from frame_sources import open_frame_source
+from login_capture import find_face_crop
+
+
+def read_frames(spec, limit):
+    frames = []
+    source = open_frame_source(spec)
+    try:
+        for frame in source:
+            frames.append(frame)
+            if len(frames) >= limit:
+                break
+    finally:
+        source.close()
+    return frames
+
+
+def iou(a, b):
+    if a is None or b is None:
+        return 1.0 if a == b else 0.0
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def run_upload(jpegs, track):
+    boxes = []
+    t0 = time.process_time()
+    for data in jpegs:
+        detection = face_detection.detect_largest_face(data, roi_box=track.roi() if track else None)
+        if track:
+            track.update(detection.box, detection.roi)
+        boxes.append(detection.box)
+    return boxes, time.process_time() - t0
+
+
+def run_login(cascade, frames, track):
+    boxes = []
+    t0 = time.process_time()
+    for frame in frames:
+        find_face_crop(cascade, frame, track)
+        boxes.append(track.box if track else None)
+    return boxes, time.process_time() - t0
+
+
+def report(name, frames, full, tracked, track):
+    (full_boxes, full_cpu), (tracked_boxes, tracked_cpu) = full, tracked
+    agreement = sum(iou(a, b) for a, b in zip(full_boxes, tracked_boxes)) / len(full_boxes)
+    found = sum(box is not None for box in full_boxes)
+    print(f"{name:<10}{frames / full_cpu:>14.1f}{frames / tracked_cpu:>14.1f}{full_cpu / tracked_cpu:>9.1f}x"
+          f"{track.roi_ratio:>10.0%}{agreement:>10.2f}{found:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="video file or image directory")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--redetect-every", type=int, default=None, help="default: FACE_TRACK_REDETECT_EVERY")
+    args = parser.parse_args()
+
+    face_detection._init_worker()  # sets cv2.setNumThreads(1) and loads the cascade
+    cascade = face_detection._face_cascade
+    frames = read_frames(args.source, args.frames)
+    if not frames:
+        sys.exit(f"No frames read from {args.source}")
+    jpegs = [cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes() for frame in frames]
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {w}x{h} from {args.source}")
+
+    new_track = lambda: FaceTrack(args.redetect_every) if args.redetect_every else FaceTrack()
+    login_full = run_login(cascade, frames, None)
+    # find_face_crop only returns the crop, so the full-frame login boxes come from a track that never uses its ROI.
+    login_boxes = run_login(cascade, frames, FaceTrack(redetect_every=0))[0]
+
+    print(f"\n{'path':<10}{'full fps/cpu':>14}{'ROI fps/cpu':>14}{'speedup':>10}{'ROI hits':>10}{'mean IoU':>10}"
+          f"{'faces':>8}")
+    track = new_track()
+    report("upload", len(frames), run_upload(jpegs, None), run_upload(jpegs, track), track)
+    track = new_track()
+    report("login", len(frames), (login_boxes, login_full[1]), run_login(cascade, frames, track), track)
+
+
+if __name__ == "__main__":
+    main()
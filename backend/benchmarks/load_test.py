@@ -0,0 +1,433 @@
+"""
+Load generator that replays the browser's traffic pattern (components/InteractiveAvatar.tsx) for N sessions.
+
+    python benchmarks/load_test.py --ramp 1,5,10,25 --stage-s 60      # starts benchmarks/stub_server.py
+    python benchmarks/load_test.py --url http://localhost:8000 --server-pid 1234 --ramp 10
+
+Per session (each with its own signed session token):
+  - a 5 s webm upload every 5 s: --speech-chunks speech chunks, then one silent chunk that ends the turn
+  - a JPEG every 1.5 s for 20 frames, one burst every --image-burst-s
+  - a /latest_ai_response poll every 3 s (plus a --probe-ms poll while a turn is waiting for its reply)
+
+Reports per ramp stage: throughput, p50/p95/p99, errors and throttled requests per endpoint (a 429 is
+admission control at work: counted apart, not as an error nor in the percentiles), end-to-end turn latency
+(silent chunk uploaded -> new AI response visible) and server RSS/CPU from /proc (process tree).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tokens are signed with the server's key: a spawned server inherits this one, with --url export the server's SECRET_KEY.
+os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+
+import aiohttp
+
+from session_tokens import TOKEN_HEADER, issue_token
+
+AUDIO_INTERVAL_S = 5.0
+IMAGE_INTERVAL_S = 1.5
+IMAGES_PER_BURST = 20
+POLL_INTERVAL_S = 3.0
+TURN_TIMEOUT_S = 60.0
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+# -------------------- Fixtures --------------------
+
+def make_fixtures(path):
+    """Tone (counts as speech) and silent 5 s webm chunks via ffmpeg, and 20 moving-face 640x480 JPEGs."""
+    os.makedirs(path, exist_ok=True)
+    for name, source in (("speech.webm", "sine=frequency=220:duration=5"),
+                         ("silence.webm", "anullsrc=r=48000:cl=mono:d=5")):
+        out = os.path.join(path, name)
+        if not os.path.exists(out):
+            subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i", source,
+                            "-t", "5", "-c:a", "libopus", out], check=True)
+
+    import cv2
+    import numpy as np
+
+    frames_dir = os.path.join(path, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    for i in range(IMAGES_PER_BURST):
+        img = np.full((480, 640, 3), 90, np.uint8)
+        img += rng.integers(0, 25, img.shape, dtype=np.uint8)
+        cx, cy = 280 + 6 * i, 220 + 3 * (i % 5)
+        cv2.ellipse(img, (cx, cy), (80, 105), 0, 0, 360, (150, 170, 200), -1)
+        for ex in (cx - 30, cx + 30):
+            cv2.circle(img, (ex, cy - 25), 10, (40, 40, 40), -1)
+        cv2.ellipse(img, (cx, cy + 45), (30, 10), 0, 0, 180, (60, 60, 120), 3)
+        cv2.imwrite(os.path.join(frames_dir, f"frame_{i:02d}.jpg"), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return path
+
+
+def unique_webm(data):
+    """
+    The fixture plus a trailing EBML Void element with random content. The server drops uploads whose
+    bytes it has already seen (audio_handling.is_duplicate_audio), so every upload must differ;
+    demuxers skip Void elements, so the audio itself is unchanged.
+    """
+    return data + b"\xec\x90" + os.urandom(16)  # Void ID, 1-byte size (16), payload
+
+
+def load_fixtures(path):
+    with open(os.path.join(path, "speech.webm"), "rb") as f:
+        speech = f.read()
+    with open(os.path.join(path, "silence.webm"), "rb") as f:
+        silence = f.read()
+    frames_dir = os.path.join(path, "frames")
+    frames = []
+    for name in sorted(os.listdir(frames_dir)):
+        with open(os.path.join(frames_dir, name), "rb") as f:
+            frames.append(f.read())
+    return speech, silence, frames
+
+
+# -------------------- Measurements --------------------
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+class Stats:
+    """Latencies, errors and throttled (429) requests for one ramp stage."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.errors = defaultdict(lambda: defaultdict(int))  # endpoint -> status/exception -> count
+        self.throttled = defaultdict(int)  # endpoint -> 429 responses
+        self.turns = []
+        self.turns_unanswered = 0
+        self.started = time.monotonic()
+
+    def record(self, endpoint, seconds, error=None):
+        if error == 429:
+            self.throttled[endpoint] += 1
+            return
+        self.latencies[endpoint].append(seconds)
+        if error is not None:
+            self.errors[endpoint][error] += 1
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        endpoints = {}
+        for name in sorted(self.latencies.keys() | self.throttled.keys()):
+            values = sorted(self.latencies[name])
+            errors = sum(self.errors[name].values())
+            requests = len(values) + self.throttled[name]
+            endpoints[name] = {
+                "requests": requests,
+                "rps": requests / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "error_rate": errors / requests,
+                "errors": dict(self.errors[name]),
+                "throttled": self.throttled[name],
+            }
+        turns = sorted(self.turns)
+        return {
+            "elapsed_s": elapsed,
+            "throughput_rps": sum(e["requests"] for e in endpoints.values()) / elapsed,
+            "endpoints": endpoints,
+            "turns": len(turns),
+            "turns_unanswered": self.turns_unanswered,
+            "turn_p50_s": percentile(turns, 50),
+            "turn_p95_s": percentile(turns, 95),
+            "turn_p99_s": percentile(turns, 99),
+        }
+
+
+def process_tree_usage(root_pid):
+    """(RSS bytes, CPU ticks) summed over root_pid and all its descendants (face detection pool included)."""
+    stats = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[0] is state; ppid, utime, stime, rss are stat fields 4, 14, 15, 24
+        stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21]) * PAGE_SIZE)
+
+    tree, frontier = set(), [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        if pid in stats and pid not in tree:
+            tree.add(pid)
+            frontier.extend(child for child, (ppid, _, _) in stats.items() if ppid == pid)
+    return sum(stats[p][2] for p in tree), sum(stats[p][1] for p in tree)
+
+
+class ServerMonitor:
+    """Samples the server's RSS every second; CPU% is the tick delta over the stage."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self._ticks = 0
+        self._t0 = time.monotonic()
+
+    def reset(self):
+        self.peak_rss, self._ticks = process_tree_usage(self.pid)
+        self._t0 = time.monotonic()
+
+    async def run(self):
+        while True:
+            rss, _ = process_tree_usage(self.pid)
+            self.peak_rss = max(self.peak_rss, rss)
+            await asyncio.sleep(1)
+
+    def summary(self):
+        rss, ticks = process_tree_usage(self.pid)
+        elapsed = time.monotonic() - self._t0
+        return {
+            "rss_mb": rss / 1024 ** 2,
+            "peak_rss_mb": max(self.peak_rss, rss) / 1024 ** 2,
+            "cpu_percent": (ticks - self._ticks) / CLK_TCK / elapsed * 100,
+        }
+
+
+# -------------------- Simulated browser session --------------------
+
+class SimulatedSession:
+    def __init__(self, runner, index):
+        self.runner = runner
+        self.session_id = f"load-{int(time.time())}-{index}"
+        self.headers = {TOKEN_HEADER: issue_token(self.session_id, f"load{index}")}
+        self.last_response = ""
+        self.turn_started = None
+
+    async def request(self, path, method, label=None, **kwargs):
+        """One timed request; recorded under `label` (default: the path)."""
+        stats, label = self.runner.stats, label or path
+        t0 = time.monotonic()
+        try:
+            async with self.runner.http.request(method, self.runner.url + path, headers=self.headers,
+                                                **kwargs) as resp:
+                body = await resp.read()
+                stats.record(label, time.monotonic() - t0, None if resp.status < 400 else resp.status)
+                return resp.status, body
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats.record(label, time.monotonic() - t0, type(e).__name__)
+            return None, b""
+
+    async def upload(self, path, data, filename, content_type):
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename=filename, content_type=content_type)
+        return await self.request(path, "POST", data=form)
+
+    async def check_response(self, label=None):
+        status, body = await self.request("/latest_ai_response", "GET", label=label)
+        if status != 200:
+            return
+        response = json.loads(body).get("ai_response") or ""
+        if response and response != self.last_response:
+            self.last_response = response
+            if self.turn_started is not None:
+                self.runner.stats.turns.append(time.monotonic() - self.turn_started)
+                self.turn_started = None
+
+    async def audio_loop(self):
+        speech, silence, _ = self.runner.fixtures
+        cycle = self.runner.args.speech_chunks + 1
+        next_at = time.monotonic()
+        for i in range(sys.maxsize):
+            ending_turn = i % cycle == cycle - 1
+            await self.upload("/upload_audio", unique_webm(silence if ending_turn else speech),
+                              f"{int(time.time() * 1000)}_{i}.webm", "audio/webm")
+            if ending_turn:
+                if self.turn_started is not None:
+                    self.runner.stats.turns_unanswered += 1
+                self.turn_started = time.monotonic()
+            next_at += AUDIO_INTERVAL_S
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+    async def image_loop(self):
+        """Bursts of frames paced by /capture_policy like the browser (re-read every refresh_ms, and on a 429)."""
+        _, _, frames = self.runner.fixtures
+        policy, policy_at = None, 0.0
+        while True:
+            burst_at = time.monotonic()
+            for i in range(IMAGES_PER_BURST):
+                if policy is None or time.monotonic() - policy_at > policy["refresh_ms"] / 1000:
+                    status, body = await self.request("/capture_policy", "GET")
+                    if status == 200:
+                        policy, policy_at = json.loads(body), time.monotonic()
+                status, body = await self.upload("/upload_image", frames[i % len(frames)],
+                                                 f"{int(time.time() * 1000)}_{i}_image.jpg", "image/jpeg")
+                if status == 429:
+                    policy = json.loads(body)
+                await asyncio.sleep(policy["interval_ms"] / 1000 if policy else IMAGE_INTERVAL_S)
+            await asyncio.sleep(max(0.0, burst_at + self.runner.args.image_burst_s - time.monotonic()))
+
+    async def poll_loop(self):
+        while True:
+            await self.check_response()
+            await asyncio.sleep(POLL_INTERVAL_S)
+
+    async def probe_loop(self):
+        """Fine-grained reply detection for turn latency (not part of the browser's pattern)."""
+        interval = self.runner.args.probe_ms / 1000
+        while True:
+            if self.turn_started is not None:
+                if time.monotonic() - self.turn_started > TURN_TIMEOUT_S:
+                    self.runner.stats.turns_unanswered += 1
+                    self.turn_started = None
+                else:
+                    await self.check_response(label="turn probe")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        loops = [self.audio_loop(), self.image_loop(), self.poll_loop()]
+        if self.runner.args.probe_ms > 0:
+            loops.append(self.probe_loop())
+        return [asyncio.create_task(loop) for loop in loops]
+
+
+# -------------------- Runner --------------------
+
+class LoadRunner:
+    def __init__(self, args, url, fixtures, server_pid):
+        self.args = args
+        self.url = url
+        self.fixtures = fixtures
+        self.monitor = ServerMonitor(server_pid) if server_pid else None
+        self.stats = Stats()
+        self.http = None
+        self.tasks = []
+
+    async def run(self):
+        results = []
+        self.http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0),
+                                          timeout=aiohttp.ClientTimeout(total=60))
+        monitor_task = asyncio.create_task(self.monitor.run()) if self.monitor else None
+        sessions = []
+        try:
+            for target in self.args.ramp:
+                self.stats = Stats()
+                if self.monitor:
+                    self.monitor.reset()
+                # Stagger new sessions over one audio interval, like users arriving independently.
+                for i in range(len(sessions), target):
+                    session = SimulatedSession(self, i)
+                    sessions.append(session)
+                    self.tasks.extend(session.start())
+                    await asyncio.sleep(random.uniform(0, AUDIO_INTERVAL_S / max(1, target - i)))
+                await asyncio.sleep(self.args.stage_s)
+
+                result = {"sessions": target, **self.stats.summary()}
+                if self.monitor:
+                    result["server"] = self.monitor.summary()
+                results.append(result)
+                print_stage(result)
+        finally:
+            for task in self.tasks + ([monitor_task] if monitor_task else []):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await self.http.close()
+        return results
+
+
+def print_stage(result):
+    server = result.get("server", {})
+    print(f"\n=== {result['sessions']} sessions | {result['throughput_rps']:.1f} req/s"
+          + (f" | RSS {server['rss_mb']:.0f} MB (peak {server['peak_rss_mb']:.0f}) | CPU {server['cpu_percent']:.0f}%"
+             if server else "") + " ===")
+    print(f"{'endpoint':<24}{'reqs':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'throttled':>11}{'errors':>9}")
+    for name, e in result["endpoints"].items():
+        print(f"{name:<24}{e['requests']:>8}{e['rps']:>8.1f}{e['p50_ms']:>9.1f}{e['p95_ms']:>9.1f}"
+              f"{e['p99_ms']:>9.1f}{e['throttled']:>11}{e['error_rate']:>8.1%} {e['errors'] or ''}")
+    print(f"turn latency: {result['turns']} turns, p50 {result['turn_p50_s']:.2f}s, p95 {result['turn_p95_s']:.2f}s, "
+          f"p99 {result['turn_p99_s']:.2f}s, unanswered {result['turns_unanswered']}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"stub server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ramp", default="1,5,10,25", type=lambda s: [int(n) for n in s.split(",")],
+                        help="concurrent sessions per stage (cumulative)")
+    parser.add_argument("--stage-s", type=float, default=60)
+    parser.add_argument("--speech-chunks", type=int, default=2, help="speech chunks per turn before the silent one")
+    parser.add_argument("--image-burst-s", type=float, default=60, help="seconds between 20-frame image bursts")
+    parser.add_argument("--probe-ms", type=float, default=250, help="reply probe while a turn is pending (0 = off)")
+    parser.add_argument("--url", help="target an already running server instead of starting the stub server")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS/CPU from when using --url")
+    parser.add_argument("--fixtures", help="directory with speech.webm, silence.webm and frames/ (generated if missing)")
+    parser.add_argument("--stt-ms", type=float, default=400)
+    parser.add_argument("--llm-ms", type=float, default=900)
+    parser.add_argument("--hume-ms", type=float, default=150)
+    parser.add_argument("--json", help="also write the per-stage results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="heygen-load-")
+    fixtures = load_fixtures(args.fixtures if args.fixtures and os.path.isdir(os.path.join(args.fixtures, "frames"))
+                             else make_fixtures(args.fixtures or os.path.join(workdir, "fixtures")))
+
+    server = None
+    url, server_pid = args.url, args.server_pid
+    if url is None:
+        port = free_port()
+        env = dict(os.environ, DB_FILE=os.path.join(workdir, "load.db"))
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_server.py"),
+             "--port", str(port), "--stt-ms", str(args.stt_ms), "--llm-ms", str(args.llm_ms),
+             "--hume-ms", str(args.hume_ms)],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        wait_for_port(port)
+        url, server_pid = f"http://127.0.0.1:{port}", server.pid
+
+    try:
+        results = asyncio.run(LoadRunner(args, url, fixtures, server_pid).run())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    # Without completed turns the audio and turn numbers only measure rejected or dropped uploads.
+    idle = [r["sessions"] for r in results if r["turns"] == 0]
+    if idle:
+        sys.exit(f"No turn completed in the stage(s) with {idle} sessions; the audio results are not meaningful.")
+
+
+if __name__ == "__main__":
+    main()
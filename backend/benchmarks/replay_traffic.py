@@ -0,0 +1,234 @@
+"""
+Replays a recorded traffic bundle (see replay.py) against the aiohttp service.
+
+    REPLAY_RECORD_DIR=recordings/ python main.py                       # record real sessions
+    python benchmarks/replay_traffic.py pack recordings/ bundle.zip       # compact bundle
+    python benchmarks/replay_traffic.py run bundle.zip --speed 4          # replay at 4x
+
+`run` starts main:init_app with Whisper, GPT and Hume answered from the bundle (matched by a
+hash of their input, GPT by session, purpose and call number, with the recorded latency divided by --speed), then sends every recorded
+request at its recorded offset / --speed, each session with its own token. With --url the
+requests go to an already running server (real upstreams) instead.
+
+Reports per-endpoint latency next to the recorded latency, status mismatches, and server RSS/CPU,
+so a change to audio_handling.py or image_handling.py can be compared on real traffic offline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+import time
+from collections import defaultdict, deque
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import aiohttp
+
+from load_test import ServerMonitor, Stats, free_port, percentile, print_stage, wait_for_port
+from replay import ReplayBundle, file_key, files_key, next_llm_key, pack_bundle, sha256
+from session_tokens import TOKEN_HEADER, issue_token
+
+
+# -------------------- Server side: upstreams served from the bundle --------------------
+
+class RecordedUpstreams:
+    """Recorded upstream results by (kind, input hash); unmatched calls get the next result of that kind."""
+
+    def __init__(self, bundle, speed):
+        self.speed = speed
+        self.by_key = defaultdict(deque)
+        self.by_kind = defaultdict(deque)
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        for event in bundle.upstream():
+            self.by_key[(event["kind"], event["key"])].append(event)
+            self.by_kind[event["kind"]].append(event)
+
+    async def serve(self, kind, key):
+        matches = self.by_key.get((kind, key))
+        if matches:
+            event = matches.popleft() if len(matches) > 1 else matches[0]
+            self.hits[kind] += 1
+        elif self.by_kind[kind]:
+            event = self.by_kind[kind][0]
+            self.by_kind[kind].rotate(-1)
+            self.misses[kind] += 1
+        else:
+            self.misses[kind] += 1
+            return None
+        await asyncio.sleep(event["duration_s"] / self.speed)
+        return event["result"]
+
+    def install(self):
+        import audio_handling
+        import hume_face_analysis
+        import openai_configs
+        import prosody_analysis
+
+        async def transcribe_audio(audio_file_path, deadline=None):
+            return await self.serve("stt", await file_key(audio_file_path)) or ""
+
+        async def generate_openai_response(prompt, deadline=None):
+            return await self.serve("llm", next_llm_key()) or ""
+
+        async def stream_chunks(chunk_files, turn):
+            result = await self.serve("prosody", await asyncio.to_thread(files_key, chunk_files))
+            if result:
+                turn._sums, turn._count, turn.analyzed_chunks = dict(result["sums"]), result["count"], result["chunks"]
+
+        async def analyze_face_batch(crops):
+            results = await asyncio.gather(*(self.serve("face", sha256(c)) for c in crops))
+            return [emotions or {} for emotions in results]
+
+        async def report(app):
+            print(f"Recorded upstreams: exact {dict(self.hits)}, fallback {dict(self.misses)}", flush=True)
+
+        audio_handling.transcribe_audio = transcribe_audio
+        audio_handling.generate_openai_response = generate_openai_response
+        openai_configs.generate_openai_response = generate_openai_response
+        prosody_analysis._stream_chunks = stream_chunks
+        hume_face_analysis.analyze_face_batch = analyze_face_batch
+        return report
+
+
+def serve(bundle_path, port, speed):
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    os.environ.setdefault("HUME_API_KEY", "replay")
+    from aiohttp import web
+    from main import init_app
+
+    report = RecordedUpstreams(ReplayBundle(bundle_path), speed).install()
+
+    async def app_factory():
+        app = await init_app()
+        app.on_cleanup.append(report)
+        return app
+
+    web.run_app(app_factory(), host="127.0.0.1", port=port)
+
+
+# -------------------- Client side: recorded requests at their offsets --------------------
+
+async def drive(bundle, url, speed, monitor):
+    requests = bundle.requests()
+    if not requests:
+        raise SystemExit("Bundle has no recorded requests.")
+    origin = requests[0]["t"]
+    stats = Stats()
+    recorded = defaultdict(list)
+    mismatches = defaultdict(int)
+    tokens = {}
+    if monitor:
+        monitor.reset()
+        monitor_task = asyncio.create_task(monitor.run())
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0),
+                                     timeout=aiohttp.ClientTimeout(total=120)) as http:
+        started = time.monotonic()
+
+        async def fire(event):
+            await asyncio.sleep(max(0.0, started + (event["t"] - origin) / speed - time.monotonic()))
+            path = event["path"].split("?", 1)[0]
+            session = event.get("session")
+            headers = {}
+            if session:
+                headers[TOKEN_HEADER] = tokens.setdefault(session, issue_token(session, "replay"))
+            data = None
+            if "blob" in event:
+                data = aiohttp.FormData()
+                data.add_field("file", bundle.blob(event["blob"]), filename=event["filename"],
+                               content_type=event["content_type"])
+            recorded[path].append(event["duration_s"])
+            t0 = time.monotonic()
+            try:
+                async with http.request(event["method"], url + event["path"], headers=headers, data=data) as resp:
+                    await resp.read()
+                    stats.record(path, time.monotonic() - t0, None if resp.status < 400 else resp.status)
+                    if resp.status != event["status"]:
+                        mismatches[path] += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats.record(path, time.monotonic() - t0, type(e).__name__)
+
+        await asyncio.gather(*(fire(event) for event in requests))
+
+    result = {"sessions": len({e.get("session") for e in requests}), **stats.summary()}
+    if monitor:
+        monitor_task.cancel()
+        result["server"] = monitor.summary()
+    for path, endpoint in result["endpoints"].items():
+        values = sorted(recorded[path])
+        endpoint["recorded_p50_ms"] = percentile(values, 50) * 1000
+        endpoint["recorded_p95_ms"] = percentile(values, 95) * 1000
+        endpoint["status_mismatches"] = mismatches[path]
+    return result
+
+
+def print_comparison(result):
+    print(f"\n{'endpoint':<24}{'recorded p50':>14}{'replayed p50':>14}{'recorded p95':>14}{'replayed p95':>14}"
+          f"{'status diff':>13}")
+    for name, e in result["endpoints"].items():
+        print(f"{name:<24}{e['recorded_p50_ms']:>14.1f}{e['p50_ms']:>14.1f}{e['recorded_p95_ms']:>14.1f}"
+              f"{e['p95_ms']:>14.1f}{e['status_mismatches']:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    pack = sub.add_parser("pack", help="zip a recording directory into a bundle")
+    pack.add_argument("directory")
+    pack.add_argument("out")
+    run = sub.add_parser("run", help="replay a bundle (directory or zip)")
+    run.add_argument("bundle")
+    run.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, 4 = four times faster")
+    run.add_argument("--url", help="replay against an already running server (its real upstreams)")
+    run.add_argument("--server-pid", type=int, help="PID to sample RSS/CPU from when using --url")
+    run.add_argument("--json", help="also write the results to this file")
+    run.add_argument("--serve-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack_bundle(args.directory, args.out)
+        return
+    bundle_path = os.path.abspath(args.bundle)
+    if args.serve_port:
+        serve(bundle_path, args.serve_port, args.speed)
+        return
+
+    bundle = ReplayBundle(bundle_path)
+    server, workdir = None, None
+    url, server_pid = args.url, args.server_pid
+    if url is None:
+        workdir = tempfile.mkdtemp(prefix="heygen-replay-")
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "run", bundle_path, "--speed", str(args.speed),
+             "--serve-port", str(port)],
+            cwd=workdir, env=dict(os.environ, DB_FILE=os.path.join(workdir, "replay.db")),
+            stderr=subprocess.DEVNULL,
+        )
+        wait_for_port(port)
+        url, server_pid = f"http://127.0.0.1:{port}", server.pid
+
+    try:
+        result = asyncio.run(drive(bundle, url, args.speed, ServerMonitor(server_pid) if server_pid else None))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_stage(result)
+    print_comparison(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+main:init_app with every upstream (Whisper, GPT, Hume face and prosody) replaced by a local stub
+that answers after a fixed latency, so load tests need no API keys and cost nothing.
+
+    python benchmarks/stub_server.py --port 8000 --stt-ms 400 --llm-ms 900 --hume-ms 150
+
+Everything else (upload handling, ffmpeg conversion, face detection pool, SQLite, write-behind,
+and the deadline / hedging / circuit breaker wrapper around Whisper and GPT) is the real code path.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_TRANSCRIPT = "I spent the weekend working in my garden and planting tomatoes"
+STUB_EMOTIONS = {"Calmness": 0.42, "Interest": 0.31, "Joy": 0.18, "Concentration": 0.12, "Tiredness": 0.05}
+STUB_PREDICTION = SimpleNamespace(emotions=[SimpleNamespace(name=n, score=s) for n, s in STUB_EMOTIONS.items()])
+
+
+def install_stubs(stt_ms, llm_ms, hume_ms):
+    """Swap the upstream calls for stubs at the names the handlers look them up by."""
+    import hume_face_analysis
+    import openai_configs
+    import prosody_analysis
+
+    replies = itertools.count(1)
+
+    async def whisper_transcribe(audio_file_path):
+        await asyncio.sleep(stt_ms / 1000)
+        return STUB_TRANSCRIPT
+
+    async def chat_completion(prompt):
+        await asyncio.sleep(llm_ms / 1000)
+        return f"Stub reply {next(replies)} to a {len(prompt)}-character prompt."
+
+    async def stream_chunks(chunk_files, turn):
+        for _ in chunk_files:
+            await asyncio.sleep(hume_ms / 1000)
+            turn.add_predictions([STUB_PREDICTION])
+            turn.analyzed_chunks += 1
+
+    async def analyze_face_batch(crops):
+        await asyncio.sleep(hume_ms / 1000)
+        return [dict(STUB_EMOTIONS) for _ in crops]
+
+    openai_configs.whisper_transcribe = whisper_transcribe
+    openai_configs.chat_completion = chat_completion
+    prosody_analysis._stream_chunks = stream_chunks
+    hume_face_analysis.analyze_face_batch = analyze_face_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--stt-ms", type=float, default=400)
+    parser.add_argument("--llm-ms", type=float, default=900)
+    parser.add_argument("--hume-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ.setdefault("HUME_API_KEY", "stub")
+
+    from aiohttp import web
+    from main import init_app
+
+    install_stubs(args.stt_ms, args.llm_ms, args.hume_ms)
+    web.run_app(init_app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
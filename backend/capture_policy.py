@@ -0,0 +1,108 @@
+import time
+
+from config import (
+    CAPTURE_ADMIT_SLACK,
+    CAPTURE_BASE_INTERVAL_MS,
+    CAPTURE_BUCKET_BURST,
+    CAPTURE_JPEG_QUALITY,
+    CAPTURE_JPEG_QUALITY_BUSY,
+    CAPTURE_MAX_HEIGHT,
+    CAPTURE_MAX_INTERVAL_MS,
+    CAPTURE_MAX_WIDTH,
+    CAPTURE_POLICY_REFRESH_MS,
+    CAPTURE_SHED_LOAD,
+    CAPTURE_STATIC_HIT_RATIO,
+)
+from face_detection import face_detector
+
+
+def capture_policy(tracker):
+    """
+    How often, how large and at what JPEG quality this session's browser should send frames.
+    - A good face was sent this window: nothing is analysed until the window ends, so wait for it.
+    - The camera sees a static scene (most frames are near-duplicates): halve the rate.
+    - The detection pool is queueing: stretch the interval by the load and lower the quality.
+    """
+    interval = CAPTURE_BASE_INTERVAL_MS
+    quality = CAPTURE_JPEG_QUALITY
+    reason = "collecting"
+
+    if tracker is not None and tracker.is_satisfied():
+        interval = max(interval, (tracker.satisfied_until - time.monotonic()) * 1000)
+        reason = "face_recent"
+    elif tracker is not None and tracker.frames_hashed >= 5 and tracker.hash_hit_ratio >= CAPTURE_STATIC_HIT_RATIO:
+        interval *= 2
+        reason = "static_scene"
+
+    load = face_detector.load()
+    if load > 1:
+        interval *= load
+        quality = CAPTURE_JPEG_QUALITY_BUSY
+        reason += "+busy"
+
+    return {
+        "interval_ms": int(min(interval, CAPTURE_MAX_INTERVAL_MS)),
+        "max_width": CAPTURE_MAX_WIDTH,
+        "max_height": CAPTURE_MAX_HEIGHT,
+        "jpeg_quality": quality,
+        "refresh_ms": CAPTURE_POLICY_REFRESH_MS,
+        "reason": reason,
+    }
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class CaptureAdmission:
+    """
+    Token-bucket admission for image uploads, checked before the body is read.
+    Each session may send CAPTURE_ADMIT_SLACK times the rate its current policy asks for
+    (bursts of CAPTURE_BUCKET_BURST); every frame is refused while the detection pool has
+    more than CAPTURE_SHED_LOAD jobs per worker.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # session_id -> TokenBucket
+        self.admitted = 0
+        self.rejected = 0
+
+    def admit(self, session_id, policy):
+        """Returns None if the frame is admitted, else the seconds the client should wait."""
+        rate = CAPTURE_ADMIT_SLACK * 1000 / policy["interval_ms"]
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            bucket = self._buckets[session_id] = TokenBucket(rate, CAPTURE_BUCKET_BURST)
+        bucket.rate = rate
+
+        if face_detector.load() > CAPTURE_SHED_LOAD:
+            retry_after = policy["interval_ms"] / 1000
+        elif bucket.take():
+            self.admitted += 1
+            return None
+        else:
+            retry_after = bucket.retry_after()
+        self.rejected += 1
+        return retry_after
+
+    def forget(self, session_id):
+        self._buckets.pop(session_id, None)
+
+
+capture_admission = CaptureAdmission()
@@ -1,7 +1,7 @@
-# config.py
-SECRET_KEY = "b'\x9c!hV\xfa\xea\xba\xcf\x1a\x84s\xa0A\xa3\xbeodw\xd2\x92P6\xdb\xd9'"
+import os
 
-DB_FILE = "/Users/Parzon/Downloads/Artificial_Consciousness/InteractiveAvatarNextJSDemo-main/HeyGenPersonalised/users.db"
+# config.py
+SECRET_KEY = os.getenv("SECRET_KEY")  # Signs Flask sessions and session tokens; required, never committed
 
 UPLOAD_DIR = "backend/uploaded_audio"
 
@@ -23,6 +23,186 @@ CHUNK_SIZE_MS = 5000           # Aim for 5-second chunks
 
 IMAGES_PER_BATCH = 40          # Once 40 images have arrived, detect face
 
+FACE_FLUSH_EVERY_N = 10        # Send the best face to Hume after this many frames...
+
+FACE_FLUSH_INTERVAL_S = 15     # ...or this many seconds after the window's first frame
+
+FACE_QUALITY_MIN_AREA_RATIO = 0.08  # Early stop: face covers >= 8% of the frame...
+
+FACE_QUALITY_MIN_SHARPNESS = 100.0  # ...and its Laplacian variance is at least this
+
+FACE_DETECT_WORKERS = int(os.getenv("FACE_DETECT_WORKERS", os.cpu_count() or 1))  # Face detection processes
+
+FACE_DETECT_TIMEOUT_S = 5      # Give up on a frame if no detector answers in time
+
+FACE_DETECT_MAX_WIDTH = 320    # Detection runs on a grayscale copy at most this wide
+
+FACE_CROP_MARGIN = 0.2         # Padding around the winning face box, as a fraction of its size
+
+FRAME_HASH_MAX_DISTANCE = 6    # dHash bits that may differ for a frame to count as a duplicate
+
+HUME_IDLE_TIMEOUT_S = 60       # Close the shared Hume stream socket after this long without traffic
+
+HUME_MAX_RETRIES = 3           # Reconnect attempts (exponential backoff) per Hume message
+
+HUME_BATCH_WINDOW_S = 0.5      # Collect face crops from all sessions this long before one Hume request...
+
+HUME_BATCH_MAX_FRAMES = 4      # ...or until this many are waiting
+
+FACE_MOSAIC_TILE_PX = 256      # Tile size for batched face crops
+
+FACE_EMOTION_WINDOW_S = 120    # Face emotions in the prompt are averaged over this window
+
+EMOTION_EMA_FAST_S = 30        # Time constant of the "current mood" moving average
+
+EMOTION_EMA_SLOW_S = 300       # Time constant of the baseline the trend is measured against
+
+EMOTION_TREND_MIN_DELTA = 0.05 # Fast-minus-slow score needed to call an emotion "trending up"
+
+EMOTION_STALE_S = 60           # Mood older than this is flagged as stale in the prompt
+
+EMOTION_WARM_START_S = 1800    # Samples replayed from SQLite when a session's state is rebuilt
+
+EMOTION_STATE_IDLE_TTL_S = 3600  # In-memory emotion state of a session idle this long is dropped (rebuilt on return)
+
+AUDIO_SESSION_IDLE_TTL_S = 3600  # Audio buffers of a session without uploads this long are dropped
+
 AUDIO_FILE_EXT = ".webm"       # Original uploads are .webm, converted to WAV
 
-DB_FILE = "users.db"
\ No newline at end of file
+TURN_ANALYSIS_DEADLINE_S = 8   # Shared deadline for transcription + prosody per speech turn
+
+PROSODY_GRACE_S = 0.5          # Extra wait for prosody once the transcript is back
+
+DB_FILE = os.getenv("DB_FILE", "users.db")
+
+DB_POOL_SIZE = 4               # Long-lived SQLite connections per aiohttp worker
+
+DB_CACHE_SIZE_KB = 16384       # Page cache per connection (PRAGMA cache_size, in KiB)
+
+DB_MMAP_SIZE = 268435456       # Memory-map up to 256 MB of the database file
+
+DB_BUSY_TIMEOUT_MS = 5000      # Wait this long for the write lock instead of failing
+
+DB_STATEMENT_CACHE = 256       # Prepared statements kept per connection
+
+SESSION_MARKER_FILE = DB_FILE + ".session"  # Touched on every login to invalidate cached session lookups
+
+WRITE_BEHIND_FLUSH_MS = 50     # Group-commit queued inserts at least this often...
+
+WRITE_BEHIND_MAX_ROWS = 200    # ...or as soon as this many rows are waiting
+
+MEMORY_RECENT_TURNS = 4        # Turns kept verbatim in the prompt; older ones are summarized
+
+MEMORY_SUMMARY_TOKENS = 200    # Cap on the rolling conversation summary
+
+MEMORY_TOKEN_BUDGET = 600      # Hard cap on summary + recent turns in every prompt
+
+MEMORY_BACKFILL_TURNS = 20     # Older turns folded into the summary when a session's memory is rebuilt from SQLite
+
+FTS_RECALL_LIMIT = 3           # Past turns recalled by full-text search into each speech prompt
+
+EXPORT_PAGE_SIZE = 1000        # Rows read per keyset page by the /export routes
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Required as X-Admin-Token on export/debug routes; unset disables them
+
+LOGIN_FRAME_SOURCE = os.getenv("LOGIN_FRAME_SOURCE", "0")  # Camera index, video file or image directory for login capture
+
+LOGIN_CAPTURE_TIMEOUT_S = 20   # Give up on the login face capture after this long
+
+LOGIN_JOB_HISTORY = 256        # Finished login capture jobs kept for the status endpoint
+
+MOOD_HISTORY_SIZE = 1000       # Login mood records kept in memory (oldest dropped first)
+
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", os.cpu_count() or 1))  # aiohttp worker processes behind dispatcher.py
+
+DISPATCH_BASE_PORT = 8100      # Worker i listens on 127.0.0.1:(DISPATCH_BASE_PORT + i)
+
+DISPATCH_VNODES = 64           # Virtual nodes per worker on the session hash ring
+
+DISPATCH_RESTART_BACKOFF_S = 1 # First restart delay for a crashed worker (doubles while it keeps crashing)
+
+SESSION_TOKEN_TTL_S = 12 * 3600  # Lifetime of the signed session token issued at login
+
+SESSION_TOKEN_CACHE_SIZE = 1024  # Verified tokens remembered per aiohttp worker
+
+SESSION_TOKENS_REQUIRED = os.getenv("SESSION_TOKENS_REQUIRED", "1") == "1"  # 0 = legacy clients without a token get the latest login's session
+
+FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")  # Next.js app: login redirect target, only origin allowed to fetch the token
+
+REPLAY_RECORD_DIR = os.getenv("REPLAY_RECORD_DIR")  # If set, session traffic is recorded there (see replay.py)
+
+ADMIN_FILE = os.getenv("ADMIN_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "admin.txt"))  # One admin username per line
+
+WORKER_WARMUP = os.getenv("WORKER_WARMUP", "1") == "1"  # Prime imports, face workers, DB and HTTP pools before serving
+
+REPROCESS_CONCURRENCY = 8      # Upstream (Hume) calls in flight during a reprocess.py batch
+
+REPROCESS_PROSODY_TIMEOUT_S = 120  # Budget for streaming one archived speech turn to Hume
+
+REPROCESS_BATCH_ROWS = 500     # reprocess.py commits results and checkpoints in transactions of up to this many rows
+
+REPROCESS_PROGRESS_S = 10      # reprocess.py logs throughput this often
+
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "1") == "1"  # Log event loop stalls with the blocking stack
+
+LOOP_LAG_THRESHOLD_MS = 100    # A heartbeat later than this counts as a stall
+
+LOOP_LAG_CHECK_MS = 20         # Heartbeat / watchdog period
+
+LOOP_LAG_HISTORY = 50          # Recent stalls kept for /debug/loop_lag
+
+PROFILE_MAX_SECONDS = 60       # Longest /debug/profile run
+
+PROFILE_DEFAULT_INTERVAL_MS = 5  # /debug/profile sampling period (200 Hz)
+
+CAPTURE_BASE_INTERVAL_MS = 1500  # Browser frame interval while a face window is still collecting
+
+CAPTURE_MAX_INTERVAL_MS = 10000  # Slowest interval the capture policy will ask for
+
+CAPTURE_MAX_WIDTH = 640        # Frames are scaled down to fit this box before upload (detection runs at 320 wide)
+
+CAPTURE_MAX_HEIGHT = 480
+
+CAPTURE_JPEG_QUALITY = 0.8     # Browser JPEG quality (canvas.toBlob) normally...
+
+CAPTURE_JPEG_QUALITY_BUSY = 0.6  # ...and while the detection pool is queueing
+
+CAPTURE_POLICY_REFRESH_MS = 5000  # How often the browser re-reads /capture_policy
+
+CAPTURE_STATIC_HIT_RATIO = 0.5 # Near-duplicate share above which the scene counts as static (half rate)
+
+CAPTURE_ADMIT_SLACK = 1.5      # Admission allows this multiple of the policy rate (timer jitter, retries)
+
+CAPTURE_BUCKET_BURST = 3       # Frames a session may send back to back
+
+CAPTURE_SHED_LOAD = 4          # Refuse every frame while detection has more than this many jobs per worker
+
+CAPTURE_SESSION_IDLE_TTL_S = 3600  # Face tracker and admission bucket of a session without frames this long are dropped
+
+TURN_REPLY_DEADLINE_S = 20     # Budget from the end of a speech turn to its AI reply (transcription + GPT)
+
+UPSTREAM_STT_TIMEOUT_S = 10    # Longest single Whisper call, hedging included
+
+UPSTREAM_LLM_TIMEOUT_S = 15    # Longest single GPT call, hedging included
+
+UPSTREAM_HUME_FACE_TIMEOUT_S = 10  # Longest Hume face request (its socket retries included)
+
+UPSTREAM_LATENCY_WINDOW = 200  # Recent latencies per upstream used for p95 / hedging
+
+UPSTREAM_HEDGE_MIN_SAMPLES = 20  # No hedging (and no percentiles) before this many samples
+
+UPSTREAM_HEDGE_MIN_DELAY_S = 0.3  # Never hedge sooner than this, however fast the p95
+
+UPSTREAM_BREAKER_FAILURES = 5  # Failed calls in a row that open an upstream's circuit
+
+UPSTREAM_BREAKER_COOLDOWN_S = 30  # Open circuit fails fast this long before one trial call
+
+UPSTREAM_FALLBACK_REPLY = "Sorry, I lost my train of thought for a moment. Could you say that again?"  # Turn reply when GPT is unavailable
+
+FACE_TRACK_REDETECT_EVERY = 10  # Frames searched around the last face box before a full-frame detection
+
+FACE_ROI_EXPAND = 0.5          # ROI margin on each side, in face-box sizes
+
+FACE_ROI_MIN_SCALE = 0.7       # Smallest face searched in the ROI, relative to the last box
+
+FACE_ROI_MAX_SCALE = 1.4       # Largest face searched in the ROI, relative to the last box
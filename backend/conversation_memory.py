@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+
+from config import MEMORY_BACKFILL_TURNS, MEMORY_RECENT_TURNS, MEMORY_SUMMARY_TOKENS, MEMORY_TOKEN_BUDGET
+from database import db
+from logger import logger
+from replay import llm_purpose
+
+
+def estimate_tokens(text):
+    """Rough GPT token count (~4 characters per token); good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, tokens):
+    max_chars = tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+
+class ConversationMemory:
+    """
+    Per-session prompt context: the last MEMORY_RECENT_TURNS turns verbatim plus a rolling summary
+    of everything older. Turns that fall out of the window are folded into the summary in the
+    background, so prompt size stays under MEMORY_TOKEN_BUDGET however long the session runs.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turns = deque()      # (user_text, ai_text)
+        self.summary = ""
+        self._evicted = []        # turns waiting to be folded into the summary
+        self._summarizing = None  # background summary task
+        self._rendered = None     # cached prompt text, rebuilt only after a change
+
+    def add_turn(self, user_text, ai_text):
+        self.turns.append((user_text or "", ai_text or ""))
+        self._evicted.extend(self._overflow())
+        self._changed()
+
+    def add_older_turns(self, turns):
+        """Turns from SQLite, older than any added so far; those beyond the window go to the summarizer."""
+        self.turns.extendleft(reversed(turns))
+        self._evicted[:0] = self._overflow()
+        self._changed()
+
+    def _overflow(self):
+        evicted = []
+        while len(self.turns) > MEMORY_RECENT_TURNS:
+            evicted.append(self.turns.popleft())
+        return evicted
+
+    def _changed(self):
+        self._rendered = None
+        if self._evicted and (self._summarizing is None or self._summarizing.done()):
+            self._summarizing = asyncio.create_task(self._refresh_summary())
+
+    async def _refresh_summary(self):
+        # Import here: openai_configs feeds every saved turn into this module.
+        from openai_configs import generate_openai_response
+
+        llm_purpose.set("summary")  # this task's own context: numbered apart from the turn replies
+        while self._evicted:
+            batch, self._evicted = self._evicted, []
+            lines = "\n".join(f"User: {u}\nAssistant: {a}" for u, a in batch)
+            prompt = (
+                f"Running summary of the conversation so far: {self.summary or '(empty)'}\n"
+                f"New turns to fold in:\n{lines}\n"
+                f"Rewrite the running summary to include the new turns, in at most "
+                f"{MEMORY_SUMMARY_TOKENS * 3 // 4} words. Keep names, topics and the user's feelings."
+            )
+            summary = await generate_openai_response(prompt)
+            if summary:
+                self.summary = truncate_to_tokens(summary, MEMORY_SUMMARY_TOKENS)
+                self._rendered = None
+                logger.info(f"Conversation summary refreshed for session {self.session_id}.")
+            else:
+                # Keep the turns for the next attempt rather than losing them.
+                self._evicted = batch + self._evicted
+                return
+
+    def render(self):
+        """Prompt text within MEMORY_TOKEN_BUDGET; newest turns win when the budget is tight."""
+        if self._rendered is not None:
+            return self._rendered
+
+        parts = []
+        budget = MEMORY_TOKEN_BUDGET
+        if self.summary:
+            summary = f"Summary of the earlier conversation: {self.summary}"
+            budget -= estimate_tokens(summary)
+            parts.append(summary)
+
+        recent = []
+        for user_text, ai_text in reversed(self.turns):
+            turn = f"User: {user_text}\nAssistant: {ai_text}"
+            cost = estimate_tokens(turn)
+            if cost > budget:
+                if budget > 20:
+                    recent.append(truncate_to_tokens(turn, budget))
+                break
+            recent.append(turn)
+            budget -= cost
+        if recent:
+            parts.append("Recent turns:\n" + "\n".join(reversed(recent)))
+
+        self._rendered = "\n".join(parts)
+        return self._rendered
+
+
+session_memories = {}  # session_id -> ConversationMemory
+_loading = {}          # session_id -> task seeding its memory from SQLite
+
+
+def remember_turn(session_id, user_text, ai_text):
+    session_memories.setdefault(session_id, ConversationMemory(session_id)).add_turn(user_text, ai_text)
+
+
+def render_memory(session_id):
+    """O(1) (cached) conversation context for the prompt; empty string for a new session."""
+    memory = session_memories.get(session_id)
+    return memory.render() if memory else ""
+
+
+async def load_memory(session_id):
+    """
+    Seed a session's memory from the conversation table the first time it is seen (e.g. after a restart):
+    the last MEMORY_RECENT_TURNS turns verbatim, up to MEMORY_BACKFILL_TURNS older ones into the summary.
+    Concurrent callers wait for the same load.
+    """
+    task = _loading.get(session_id)
+    if task is None:
+        if session_id in session_memories:
+            return
+        session_memories[session_id] = ConversationMemory(session_id)
+        task = _loading[session_id] = asyncio.create_task(_load_turns(session_id))
+    await asyncio.shield(task)
+
+
+async def _load_turns(session_id):
+    memory = session_memories[session_id]
+    try:
+        async with db.connection() as db_conn:
+            async with db_conn.execute(
+                "SELECT transcription, ai_response FROM conversation WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, MEMORY_RECENT_TURNS + MEMORY_BACKFILL_TURNS),
+            ) as cursor:
+                rows = await cursor.fetchall()
+    finally:
+        del _loading[session_id]
+    rows = [(user_text or "", ai_text or "") for user_text, ai_text in reversed(rows)]
+    # Turns remembered while the query ran are newer than every stored one, but may already be among them.
+    remembered = memory._evicted + list(memory.turns)
+    overlap = next(n for n in range(min(len(rows), len(remembered)), -1, -1)
+                   if rows[len(rows) - n:] == remembered[:n])
+    memory.add_older_turns(rows[:len(rows) - overlap])
+    logger.info(f"Conversation memory loaded for session {session_id}: {len(rows) - overlap} turns.")
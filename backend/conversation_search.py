@@ -0,0 +1,127 @@
+"""
+Full-text recall over past conversation turns (SQLite FTS5, see migrations.MIGRATIONS[1]).
+
+    python conversation_search.py rebuild              # (re)index an existing database
+    python conversation_search.py search "my garden" --username parzon
+"""
+import argparse
+import re
+import sqlite3
+import time
+
+from config import DB_FILE
+from logger import logger
+from migrations import apply_migrations_sync
+
+# Words that match almost every turn and only add noise to the ranking.
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "for", "from", "have", "he", "her",
+    "his", "how", "i", "if", "in", "is", "it", "its", "just", "me", "my", "no", "not", "of", "on",
+    "or", "our", "she", "so", "that", "the", "their", "them", "then", "there", "they", "this", "to",
+    "too", "was", "we", "were", "what", "when", "which", "who", "will", "with", "you", "your",
+}
+MAX_QUERY_TERMS = 12
+
+
+def build_match_query(text):
+    """Free text -> FTS5 query: distinct non-stopword terms OR'ed together, quoted so user text can't inject syntax."""
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) > 2 and word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return " OR ".join(f'"{t}"' for t in terms[:MAX_QUERY_TERMS])
+
+
+def _search_sql(session_id, username, same_user_as, exclude_recent):
+    sql = '''
+        SELECT c.id, c.timestamp, c.session_id, c.transcription, c.ai_response, bm25(conversation_fts) AS rank
+        FROM conversation_fts
+        JOIN conversation c ON c.id = conversation_fts.rowid
+        WHERE conversation_fts MATCH ?
+    '''
+    params = []
+    if session_id is not None:
+        sql += " AND c.session_id = ?"
+        params.append(session_id)
+    if username is not None:
+        sql += " AND c.session_id IN (SELECT session_id FROM users WHERE username = ?)"
+        params.append(username)
+    if same_user_as is not None:
+        sql += '''
+            AND c.session_id IN (
+                SELECT session_id FROM users
+                WHERE username = (SELECT username FROM users WHERE session_id = ? LIMIT 1)
+            )
+        '''
+        params.append(same_user_as)
+    if exclude_recent and (session_id or same_user_as):
+        # Those turns are already in the prompt verbatim (conversation_memory).
+        sql += " AND c.id NOT IN (SELECT id FROM conversation WHERE session_id = ? ORDER BY id DESC LIMIT ?)"
+        params.extend([session_id or same_user_as, exclude_recent])
+    sql += " ORDER BY rank LIMIT ?"
+    return sql, params
+
+
+async def search_turns(db_conn, text, session_id=None, username=None, same_user_as=None, limit=3, exclude_recent=0):
+    """
+    Best-matching past turns for `text`, as (id, timestamp, session_id, transcription, ai_response, rank) rows.
+    Scope with session_id, username, or same_user_as (every session of that session's user).
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+    sql, params = _search_sql(session_id, username, same_user_as, exclude_recent)
+    async with db_conn.execute(sql, [match] + params + [limit]) as cursor:
+        return await cursor.fetchall()
+
+
+def format_recalled_turns(rows, max_chars=240):
+    lines = []
+    for _, ts, _, user_text, ai_text, _ in rows:
+        turn = f"- ({(ts or '')[:10]}) User: {user_text} / Assistant: {ai_text}"
+        lines.append(turn if len(turn) <= max_chars else turn[:max_chars] + " ...")
+    return "\n".join(lines)
+
+
+def rebuild_index(path=DB_FILE):
+    """Create the FTS table/triggers if missing and re-index every conversation row."""
+    conn = sqlite3.connect(path)
+    try:
+        apply_migrations_sync(conn)
+        t0 = time.perf_counter()
+        conn.execute("INSERT INTO conversation_fts (conversation_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO conversation_fts (conversation_fts) VALUES ('optimize')")
+        conn.commit()
+        count = conn.execute("SELECT COUNT(*) FROM conversation").fetchone()[0]
+        logger.info(f"Rebuilt conversation_fts over {count} rows in {time.perf_counter() - t0:.2f}s.")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="create/refresh the FTS index for an existing database")
+    search = sub.add_parser("search", help="print the best-matching past turns")
+    search.add_argument("text")
+    search.add_argument("--session")
+    search.add_argument("--username")
+    search.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rebuild_index(args.db)
+    else:
+        conn = sqlite3.connect(args.db)
+        match = build_match_query(args.text)
+        sql, params = _search_sql(args.session, args.username, None, 0)
+        t0 = time.perf_counter()
+        rows = conn.execute(sql, [match] + params + [args.limit]).fetchall() if match else []
+        print(format_recalled_turns(rows) or "No matches.")
+        print(f"({len(rows)} results in {(time.perf_counter() - t0) * 1000:.2f} ms)")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
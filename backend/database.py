@@ -1,34 +1,132 @@
+import asyncio
+import contextlib
+import sqlite3
+import threading
 import aiosqlite
 from logger import logger
 import datetime
 
-from config import DB_FILE
+from migrations import (
+    CONVERSATION_TABLE_SQL,
+    EMOTION_SAMPLES_TABLE_SQL,
+    FACE_ANALYSIS_TABLE_SQL,
+    PROSODY_ANALYSIS_TABLE_SQL,
+    apply_migrations,
+)
+from config import (
+    DB_FILE,
+    DB_POOL_SIZE,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    DB_BUSY_TIMEOUT_MS,
+    DB_STATEMENT_CACHE,
+)
+
+# Applied to every connection, async or sync. journal_mode=WAL is persistent in the file,
+# the rest is per connection.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA mmap_size={DB_MMAP_SIZE}",
+    f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+)
+
+# -------------------- Connection Pool --------------------
+
+class Database:
+    """
+    Small pool of long-lived aiosqlite connections shared by the whole aiohttp worker.
+    Connections are opened once in main.init_app; sqlite3's per-connection statement cache
+    (DB_STATEMENT_CACHE) means repeated queries reuse their prepared statements.
+    """
+
+    def __init__(self, path=DB_FILE, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = None
+        self._all = []
+
+    async def open(self):
+        if self._all:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path, cached_statements=DB_STATEMENT_CACHE)
+            for pragma in CONNECTION_PRAGMAS:
+                await conn.execute(pragma)
+            self._all.append(conn)
+            self._idle.put_nowait(conn)
+        logger.info(f"Database pool opened: {self.size} connections to {self.path} (WAL).")
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """Borrow a connection. Keep the block short: don't hold it across upstream calls."""
+        if not self._all:
+            await self.open()
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                logger.warning("Connection returned to pool with an open transaction. Rolling back.")
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    async def warm_up(self, statements):
+        """Run (sql, params) `statements` once on every pooled connection: fills each statement cache and the page cache."""
+        if not self._all:
+            await self.open()
+        held = [await self._idle.get() for _ in range(self.size)]
+        try:
+            for conn in held:
+                for sql, params in statements:
+                    async with conn.execute(sql, params) as cursor:
+                        await cursor.fetchall()
+        finally:
+            for conn in held:
+                self._idle.put_nowait(conn)
+
+    async def close(self):
+        conns, self._all = self._all, []
+        for conn in conns:
+            await conn.close()
+        logger.info("Database pool closed.")
+
+
+db = Database()
+
+_sync_local = threading.local()
+
+def sync_connection():
+    """
+    Per-thread sqlite3 connection with the same pragmas, for the Flask login app.
+    Each gunicorn thread gets its own long-lived connection instead of sharing one.
+    """
+    conn = getattr(_sync_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, cached_statements=DB_STATEMENT_CACHE)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        _sync_local.conn = conn
+    return conn
 
 # -------------------- DB Initialization --------------------
 
 async def initialize_db():
     """Initialize the database and create tables if needed."""
-    async with aiosqlite.connect(DB_FILE) as db_conn:
-        # Conversation table
-        await db_conn.execute('''
-            CREATE TABLE IF NOT EXISTS conversation (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                session_id TEXT,
-                transcription TEXT,
-                ai_response TEXT, 
-                chunk_range TEXT
-            )
-        ''')
-        # Face analysis table
+    async with db.connection() as db_conn:
+        await db_conn.execute(CONVERSATION_TABLE_SQL)
+        await db_conn.execute(FACE_ANALYSIS_TABLE_SQL)
+        # Prosody (voice emotion) analysis
+        await db_conn.execute(PROSODY_ANALYSIS_TABLE_SQL)
+        # Emotion time series: one float32 vector (emotion_store.EMOTION_NAMES order) per reading
+        await db_conn.execute(EMOTION_SAMPLES_TABLE_SQL)
         await db_conn.execute('''
-            CREATE TABLE IF NOT EXISTS face_analysis (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                session_id TEXT,
-                face_file_name TEXT,
-                face_emotions TEXT
-            )
+            CREATE INDEX IF NOT EXISTS idx_emotion_samples_session_ts
+            ON emotion_samples (session_id, timestamp)
         ''')
         await db_conn.commit()
-        logger.info("Database initialized (conversation & face_analysis tables exist).")
+        await apply_migrations(db_conn)
+        logger.info("Database initialized (conversation, face_analysis, prosody_analysis & emotion_samples tables exist).")
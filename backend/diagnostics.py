@@ -0,0 +1,178 @@
+"""
+Event-loop diagnostics for production workers.
+
+LoopLagMonitor: a heartbeat task on the loop plus a watchdog thread. When the heartbeat is late
+by more than LOOP_LAG_THRESHOLD_MS, the watchdog grabs the loop thread's stack *while it is still
+blocked* (sys._current_frames), so the log names the blocking call, not just the fact of a stall.
+
+/debug/profile?seconds=N: samples the loop thread's stack from a helper thread every
+interval_ms and returns collapsed stacks ("frame;frame;frame count" per line), the input format
+of flamegraph.pl, speedscope and inferno. Nothing is instrumented, so the overhead is one stack
+walk per sample in the sampler thread.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+from aiohttp import web
+
+from config import (
+    LOOP_LAG_CHECK_MS,
+    LOOP_LAG_HISTORY,
+    LOOP_LAG_THRESHOLD_MS,
+    PROFILE_DEFAULT_INTERVAL_MS,
+    PROFILE_MAX_SECONDS,
+)
+from export import check_admin_token
+from logger import logger
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def collapse_stack(frame):
+    """Root-first 'a;b;c' of a frame and its callers."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class LoopLagMonitor:
+    """Records event-loop stalls above `threshold_ms` with the stack that caused them."""
+
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, check_ms=LOOP_LAG_CHECK_MS, history=LOOP_LAG_HISTORY):
+        self.threshold = threshold_ms / 1000
+        self.interval = check_ms / 1000
+        self.stalls = deque(maxlen=history)  # most recent stalls, newest last
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self.loop_thread_id = None
+        self._beat = 0.0
+        self._current = None  # stall being observed by the watchdog, finished by the heartbeat
+        self._task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Loop lag monitor started (threshold {self.threshold * 1000:.0f} ms).")
+
+    async def stop(self, app=None):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = now - expected
+            self.max_lag = max(self.max_lag, lag)
+            stall, self._current = self._current, None
+            if stall is not None:
+                stall["lag_ms"] = round(lag * 1000, 1)
+                logger.warning(f"⚠️ Event loop blocked for {stall['lag_ms']:.0f} ms in:\n{stall['stack']}")
+
+    def _watch(self):
+        while not self._stop.wait(self.interval / 2):
+            late = time.monotonic() - self._beat - self.interval
+            if late < self.threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None or time.monotonic() - self._beat - self.interval < self.threshold:
+                continue  # the loop caught up while we were looking
+            stall = {"at": time.time(), "lag_ms": None, "stack": "".join(traceback.format_stack(frame))}
+            self._current = stall
+            self.stalls.append(stall)
+            self.stall_count += 1
+
+    def to_dict(self):
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "stall_count": self.stall_count,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "recent_stalls": list(self.stalls),
+        }
+
+
+loop_monitor = LoopLagMonitor()
+
+
+def sample_stacks(thread_ids, seconds, interval):
+    """Runs in a helper thread: Counter of collapsed stacks of `thread_ids` (None = all but this one)."""
+    own = threading.get_ident()
+    counts = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own and (thread_ids is None or thread_id in thread_ids):
+                counts[collapse_stack(frame)] += 1
+        samples += 1
+        time.sleep(interval)
+    return counts, samples
+
+
+_profile_lock = asyncio.Lock()
+
+
+async def handle_profile(request):
+    """
+    GET /debug/profile?seconds=N[&interval_ms=5][&threads=all]
+    Samples this worker for N seconds (at most PROFILE_MAX_SECONDS) and returns collapsed stacks.
+    By default only the event loop thread is sampled; threads=all includes executor threads.
+    One profile at a time per worker (409 otherwise).
+    """
+    check_admin_token(request)
+    try:
+        seconds = min(float(request.query.get("seconds", 10)), PROFILE_MAX_SECONDS)
+        interval = max(float(request.query.get("interval_ms", PROFILE_DEFAULT_INTERVAL_MS)), 1.0) / 1000
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds and interval_ms must be numbers")
+    if _profile_lock.locked():
+        raise web.HTTPConflict(text="A profile is already running in this worker")
+
+    thread_ids = None if request.query.get("threads") == "all" else {threading.get_ident()}
+    async with _profile_lock:
+        logger.info(f"Profiling worker {os.getpid()} for {seconds:.0f} s every {interval * 1000:.0f} ms.")
+        counts, samples = await asyncio.to_thread(sample_stacks, thread_ids, seconds, interval)
+
+    body = "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    return web.Response(
+        text=body,
+        content_type="text/plain",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{os.getpid()}-{int(time.time())}.folded"',
+            "X-Worker-PID": str(os.getpid()),
+            "X-Profile-Samples": str(samples),
+        },
+    )
+
+
+async def handle_loop_lag(request):
+    """GET /debug/loop_lag: recent event loop stalls of this worker, with their stacks."""
+    check_admin_token(request)
+    return web.json_response({"pid": os.getpid(), **loop_monitor.to_dict()})
@@ -0,0 +1,228 @@
+"""
+Session-affine front dispatcher for the aiohttp service.
+
+    python dispatcher.py --port 8001 --workers 4
+
+Starts one main:init_app process per worker on 127.0.0.1 (DISPATCH_BASE_PORT + i) and proxies
+every request to the worker that owns its session on a consistent-hash ring, so one user's
+audio buffers, face tracker, emotion state and conversation memory stay in one process.
+A worker that dies is taken off the ring (only its sessions move), restarted, and put back
+once it accepts connections again.
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import os
+import sys
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, client_exceptions, web
+
+from config import DISPATCH_BASE_PORT, DISPATCH_RESTART_BACKOFF_S, DISPATCH_VNODES, DISPATCH_WORKERS
+from logger import logger
+from session_tokens import TOKEN_HEADER
+
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "session_id"
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring with DISPATCH_VNODES virtual nodes per worker."""
+
+    def __init__(self, vnodes=DISPATCH_VNODES):
+        self.vnodes = vnodes
+        self._keys = []   # sorted vnode hashes
+        self._nodes = {}  # vnode hash -> node
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            h = _hash(f"{node}#{i}")
+            if h not in self._nodes:
+                bisect.insort(self._keys, h)
+                self._nodes[h] = node
+
+    def remove(self, node):
+        self._keys = [h for h in self._keys if self._nodes[h] != node]
+        self._nodes = {h: n for h, n in self._nodes.items() if n != node}
+
+    def get(self, key):
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[self._keys[i]]
+
+    def __contains__(self, node):
+        return node in self._nodes.values()
+
+
+def session_key(request):
+    """
+    Session token header (one per login, so it pins the session without verifying it here),
+    else session ID from header or cookie; the client address when the request carries none.
+    Never the query string: IDs there end up in access logs.
+    """
+    return (
+        request.headers.get(TOKEN_HEADER)
+        or request.headers.get(SESSION_HEADER)
+        or request.cookies.get(SESSION_COOKIE)
+        or f"ip:{request.remote}"
+    )
+
+
+class WorkerSupervisor:
+    """
+    Runs the aiohttp workers as child processes and keeps the ring in sync with the ones that are up.
+    Each worker gets an equal share of the cores for its face detection pool unless FACE_DETECT_WORKERS is set.
+    """
+
+    def __init__(self, workers=DISPATCH_WORKERS, base_port=DISPATCH_BASE_PORT):
+        self.ports = [base_port + i for i in range(workers)]
+        self.ring = HashRing()
+        self._procs = {}
+        self._tasks = []
+        self._stopping = False
+
+    def _worker_env(self):
+        env = dict(os.environ)
+        env.setdefault("FACE_DETECT_WORKERS", str(max(1, (os.cpu_count() or 1) // len(self.ports))))
+        return env
+
+    async def _wait_ready(self, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                _, w = await asyncio.open_connection("127.0.0.1", port)
+                w.close()
+                return True
+            except OSError:
+                await asyncio.sleep(0.2)
+        return False
+
+    async def _supervise(self, port):
+        backoff = DISPATCH_RESTART_BACKOFF_S
+        while not self._stopping:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "--serve-worker", "--port", str(port),
+                env=self._worker_env(),
+            )
+            self._procs[port] = proc
+            started = time.monotonic()
+            if await self._wait_ready(port):
+                self.ring.add(port)
+                logger.info(f"Worker :{port} (pid {proc.pid}) joined the ring.")
+            returncode = await proc.wait()
+            self.ring.remove(port)
+            if self._stopping:
+                return
+            # Only this worker's sessions move to its ring neighbours until it is back.
+            logger.error(f"Worker :{port} exited with {returncode}; its sessions are rebalanced while it restarts.")
+            backoff = DISPATCH_RESTART_BACKOFF_S if time.monotonic() - started > 60 else min(backoff * 2, 30)
+            await asyncio.sleep(backoff)
+
+    async def readmit(self, port):
+        """Put a worker that refused a connection back on the ring once it accepts again (if it is still running)."""
+        self.ring.remove(port)
+        proc = self._procs.get(port)
+        if await self._wait_ready(port) and proc is self._procs.get(port) and proc.returncode is None:
+            self.ring.add(port)
+
+    async def start(self, app):
+        self._tasks = [asyncio.create_task(self._supervise(port)) for port in self.ports]
+
+    async def stop(self, app):
+        self._stopping = True
+        for proc in self._procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+        await asyncio.gather(*(p.wait() for p in self._procs.values()), return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        logger.info("All workers stopped.")
+
+
+async def proxy(request):
+    """
+    Forward the request to the session's worker; on a dead worker, drop it from the ring and retry once.
+    The body is streamed, not buffered: a worker that refuses an upload before reading it (429) costs
+    the dispatcher no memory. A refused connection fails before any of it is sent, so the retry still has it all.
+    """
+    supervisor = request.app["supervisor"]
+    key = session_key(request)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+    headers["X-Forwarded-For"] = request.remote or ""
+
+    for _ in range(2):
+        port = supervisor.ring.get(key)
+        if port is None:
+            raise web.HTTPServiceUnavailable(text="No workers available")
+        try:
+            async with request.app["client"].request(
+                request.method, f"http://127.0.0.1:{port}{request.rel_url}", headers=headers,
+                data=request.content if request.body_exists else None,
+                allow_redirects=False,
+            ) as upstream:
+                response = web.StreamResponse(status=upstream.status, reason=upstream.reason)
+                for k, v in upstream.headers.items():
+                    if k.lower() not in HOP_BY_HOP:
+                        response.headers.add(k, v)
+                response.headers["X-Worker"] = str(port)
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_chunked(64 * 1024):
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+        except client_exceptions.ClientConnectorError:
+            logger.warning(f"Worker :{port} unreachable; removing it from the ring.")
+            supervisor.ring.remove(port)
+            asyncio.create_task(supervisor.readmit(port))
+    raise web.HTTPBadGateway(text="Worker unavailable")
+
+
+async def init_dispatcher(workers=DISPATCH_WORKERS, base_port=DISPATCH_BASE_PORT):
+    app = web.Application()
+    supervisor = WorkerSupervisor(workers, base_port)
+    app["supervisor"] = supervisor
+
+    async def open_client(app):
+        # Worker turns can take a while (transcription + LLM); only connecting is bounded.
+        app["client"] = ClientSession(
+            connector=TCPConnector(limit=0), timeout=ClientTimeout(total=None, sock_connect=5), auto_decompress=False
+        )
+
+    async def close_client(app):
+        await app["client"].close()
+
+    app.on_startup.append(supervisor.start)
+    app.on_startup.append(open_client)
+    app.on_cleanup.append(close_client)
+    app.on_cleanup.append(supervisor.stop)
+    app.router.add_route("*", "/{tail:.*}", proxy)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=DISPATCH_WORKERS)
+    parser.add_argument("--base-port", type=int, default=DISPATCH_BASE_PORT)
+    parser.add_argument("--serve-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_worker:
+        from main import init_app
+        web.run_app(init_app(), host="127.0.0.1", port=args.port, print=None)
+    else:
+        web.run_app(init_dispatcher(args.workers, args.base_port), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import (
+    EMOTION_EMA_FAST_S,
+    EMOTION_EMA_SLOW_S,
+    EMOTION_STALE_S,
+    EMOTION_STATE_IDLE_TTL_S,
+    EMOTION_TREND_MIN_DELTA,
+    EMOTION_WARM_START_S,
+)
+from database import db
+from emotion_store import EMOTION_NAMES, read_emotion_window, top_emotions, vectorize
+from logger import logger
+
+# Login readings come from the same face model, so they seed the face state.
+SOURCE_ALIASES = {"login": "face"}
+
+
+class EmotionState:
+    """
+    Time-aware exponential moving averages of one emotion source (face or prosody).
+    The fast EMA is the current mood; fast minus slow is the trend.
+    """
+
+    def __init__(self):
+        self.fast = None
+        self.slow = None
+        self.updated_at = None
+        self._text = None  # prompt text, rebuilt only after an update
+
+    def update(self, vec, ts):
+        if self.fast is None:
+            self.fast = vec.copy()
+            self.slow = vec.copy()
+        else:
+            dt = max(ts - self.updated_at, 1.0)
+            self.fast += (1 - math.exp(-dt / EMOTION_EMA_FAST_S)) * (vec - self.fast)
+            self.slow += (1 - math.exp(-dt / EMOTION_EMA_SLOW_S)) * (vec - self.slow)
+        self.updated_at = ts
+        self._text = None
+
+    def dominant(self):
+        return EMOTION_NAMES[int(np.argmax(self.fast))]
+
+    def rising(self):
+        """Emotion growing fastest relative to the long-term average, or None if nothing stands out."""
+        delta = self.fast - self.slow
+        i = int(np.argmax(delta))
+        return EMOTION_NAMES[i] if delta[i] >= EMOTION_TREND_MIN_DELTA else None
+
+    def describe(self, now=None):
+        if self._text is None:
+            rising = self.rising()
+            self._text = f"{top_emotions(self.fast)} (dominant: {self.dominant()}"
+            if rising:
+                self._text += f", trending up: {rising}"
+        age = int((now or time.time()) - self.updated_at)
+        stale = ", stale" if age > EMOTION_STALE_S else ""
+        return f"{self._text}, updated {age}s ago{stale})"
+
+
+session_states = OrderedDict()  # session_id -> {source: EmotionState}, least recently used first
+_last_used = {}  # session_id -> time.monotonic() of its last update or read
+_warm_started = set()  # sessions whose stored history was replayed (a live update may create the state first)
+
+
+def _touch(session_id):
+    """Mark the session as used and drop states idle for EMOTION_STATE_IDLE_TTL_S (oldest first)."""
+    now = time.monotonic()
+    _last_used[session_id] = now
+    session_states.move_to_end(session_id)
+    while session_states:
+        oldest = next(iter(session_states))
+        if now - _last_used[oldest] < EMOTION_STATE_IDLE_TTL_S:
+            break
+        session_states.popitem(last=False)
+        del _last_used[oldest]
+        _warm_started.discard(oldest)
+        logger.debug(f"Emotion state of idle session {oldest} dropped.")
+
+
+def update_emotion_state(session_id, source, emotions, ts=None):
+    """Fold one Hume result ({name: score}) into the session's rolling state."""
+    if not emotions:
+        return
+    source = SOURCE_ALIASES.get(source, source)
+    state = session_states.setdefault(session_id, {}).setdefault(source, EmotionState())
+    _touch(session_id)
+    state.update(vectorize(emotions), ts if ts is not None else time.time())
+
+
+def describe_emotion_state(session_id, source):
+    """O(1) prompt text for the session's current mood ('face' or 'prosody'), or None if nothing has been seen yet."""
+    if session_id in session_states:
+        _touch(session_id)
+    state = session_states.get(session_id, {}).get(source)
+    if state is None or state.fast is None:
+        return None
+    return state.describe()
+
+
+async def warm_start_emotion_state(session_id):
+    """
+    Rebuild the session's state from the last EMOTION_WARM_START_S of stored samples (e.g. after a restart).
+    Only queries once per session in this process. Live updates that arrived first are folded in after the
+    history (their state counts as one reading), unless the history already ends with them.
+    """
+    if session_id in _warm_started:
+        return
+    _warm_started.add(session_id)
+    warm = {}
+    async with db.connection() as db_conn:
+        for stored_source in ("login", "face", "prosody"):
+            timestamps, scores = await read_emotion_window(
+                db_conn, session_id, start=time.time() - EMOTION_WARM_START_S, source=stored_source
+            )
+            source = SOURCE_ALIASES.get(stored_source, stored_source)
+            for ts, vec in zip(timestamps, scores):
+                warm.setdefault(source, EmotionState()).update(vec.copy(), float(ts))
+    states = session_states.setdefault(session_id, {})
+    _touch(session_id)
+    for source, state in warm.items():
+        live = states.get(source)
+        if live is not None and live.fast is not None and live.updated_at > state.updated_at:
+            state.update(live.fast.copy(), live.updated_at)
+        states[source] = state
+    logger.info(f"Emotion state warm-started for session {session_id}: {list(states)}")
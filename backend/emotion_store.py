@@ -0,0 +1,122 @@
+import datetime
+import re
+import time
+
+import numpy as np
+
+from logger import logger
+from write_behind import writer
+
+# Fixed column order for every stored emotion vector (Hume's 48 expression dimensions).
+# Never reorder or resize without migrating stored blobs: they are decoded by position.
+EMOTION_NAMES = [
+    "Admiration", "Adoration", "Aesthetic Appreciation", "Amusement", "Anger", "Anxiety",
+    "Awe", "Awkwardness", "Boredom", "Calmness", "Concentration", "Confusion",
+    "Contemplation", "Contempt", "Contentment", "Craving", "Desire", "Determination",
+    "Disappointment", "Disgust", "Distress", "Doubt", "Ecstasy", "Embarrassment",
+    "Empathic Pain", "Entrancement", "Envy", "Excitement", "Fear", "Guilt",
+    "Horror", "Interest", "Joy", "Love", "Nostalgia", "Pain",
+    "Pride", "Realization", "Relief", "Romance", "Sadness", "Satisfaction",
+    "Shame", "Surprise (negative)", "Surprise (positive)", "Sympathy", "Tiredness", "Triumph",
+]
+EMOTION_INDEX = {name: i for i, name in enumerate(EMOTION_NAMES)}
+NUM_EMOTIONS = len(EMOTION_NAMES)
+
+
+def vectorize(emotions):
+    """{name: score} -> float32 vector in EMOTION_NAMES order (unknown names are ignored)."""
+    vec = np.zeros(NUM_EMOTIONS, np.float32)
+    for name, score in emotions.items():
+        idx = EMOTION_INDEX.get(name)
+        if idx is None:
+            logger.debug(f"Ignoring unknown emotion dimension: {name}")
+            continue
+        vec[idx] = score
+    return vec
+
+
+_PARTIAL_SUFFIX = re.compile(r"\s*\(partial, \d+/\d+ chunks\)$")
+
+
+def parse_emotion_text(text):
+    """
+    Legacy 'Name: 0.12, Name: 0.34' strings (face_analysis.face_emotions, prosody_analysis.voice_emotions)
+    back to {name: score}. Returns {} for empty, 'Unavailable' or unparseable text.
+    """
+    emotions = {}
+    for part in _PARTIAL_SUFFIX.sub("", text or "").split(", "):
+        name, sep, score = part.rpartition(": ")
+        if not sep:
+            continue
+        try:
+            emotions[name.strip()] = float(score)
+        except ValueError:
+            continue
+    return emotions
+
+
+def legacy_sample_rows(rows, source):
+    """(session_id, iso_timestamp, text) rows -> emotion_samples rows; unparseable rows are skipped."""
+    samples = []
+    for session_id, timestamp, text in rows:
+        emotions = parse_emotion_text(text)
+        if not emotions:
+            continue
+        try:
+            ts = datetime.datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            continue
+        samples.append(sample_row(session_id, source, emotions, ts))
+    return samples
+
+
+def top_emotions(vec, n=5):
+    """Format the n strongest dimensions as 'name: 0.12, ...' for prompts and logs."""
+    if vec is None or not np.any(vec):
+        return "Neutral"
+    order = np.argsort(vec)[::-1][:n]
+    return ", ".join(f"{EMOTION_NAMES[i]}: {vec[i]:.2f}" for i in order)
+
+
+INSERT_SAMPLE_SQL = '''
+    INSERT INTO emotion_samples (session_id, timestamp, source, scores)
+    VALUES (?, ?, ?, ?)
+'''
+
+
+def sample_row(session_id, source, emotions, ts=None):
+    return (session_id, ts if ts is not None else time.time(), source, vectorize(emotions).tobytes())
+
+
+def save_emotion_sample(session_id, source, emotions, ts=None):
+    """
+    Queue one emotion reading ('face', 'prosody' or 'login') as a float32 blob.
+    Returns the write-behind future, resolved once the row is committed.
+    """
+    return writer.submit(INSERT_SAMPLE_SQL, sample_row(session_id, source, emotions, ts))
+
+
+async def read_emotion_window(db_conn, session_id, start=None, end=None, source=None):
+    """
+    All samples of a session inside [start, end] (epoch seconds), oldest first.
+    Returns (timestamps float64 array of shape (n,), scores float32 array of shape (n, NUM_EMOTIONS)).
+    """
+    sql = "SELECT timestamp, scores FROM emotion_samples WHERE session_id = ?"
+    params = [session_id]
+    if start is not None:
+        sql += " AND timestamp >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND timestamp <= ?"
+        params.append(end)
+    if source is not None:
+        sql += " AND source = ?"
+        params.append(source)
+    sql += " ORDER BY timestamp"
+
+    async with db_conn.execute(sql, params) as cursor:
+        rows = await cursor.fetchall()
+
+    timestamps = np.fromiter((r[0] for r in rows), np.float64, count=len(rows))
+    scores = np.frombuffer(b"".join(r[1] for r in rows), np.float32).reshape(-1, NUM_EMOTIONS)
+    return timestamps, scores
@@ -0,0 +1,165 @@
+import bisect
+import csv
+import datetime
+import io
+import json
+import hmac
+
+import numpy as np
+from aiohttp import web
+
+from config import ADMIN_TOKEN, EXPORT_PAGE_SIZE
+from database import db
+from emotion_store import EMOTION_NAMES, NUM_EMOTIONS
+from logger import logger
+
+EXPORT_TABLES = {
+    "conversation": ["id", "timestamp", "session_id", "transcription", "ai_response", "chunk_range"],
+    "face_analysis": ["id", "timestamp", "session_id", "face_file_name"],
+}
+
+# A face_analysis row and its emotion_samples row share a timestamp (older rows: written microseconds apart).
+FACE_SAMPLE_MATCH_S = 1.0
+
+
+def check_admin_token(request):
+    """
+    Admin/debug routes require X-Admin-Token matching ADMIN_TOKEN.
+    Without a configured ADMIN_TOKEN they do not exist (404), so they are never open by default.
+    """
+    if not ADMIN_TOKEN:
+        raise web.HTTPNotFound()
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise web.HTTPForbidden(text="Missing or invalid admin token")
+
+
+def _page_query(table, columns, query):
+    """Keyset pagination on id plus optional session/time filters."""
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE id > ?"
+    params = []
+    if query.get("session_id"):
+        sql += " AND session_id = ?"
+        params.append(query["session_id"])
+    if query.get("since"):
+        sql += " AND timestamp >= ?"
+        params.append(query["since"])
+    if query.get("until"):
+        sql += " AND timestamp < ?"
+        params.append(query["until"])
+    sql += " ORDER BY id LIMIT ?"
+    return sql, params
+
+
+def _epoch(timestamp):
+    try:
+        return datetime.datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+async def _with_face_emotions(db_conn, rows):
+    """
+    Appends one column per emotion (EMOTION_NAMES order) to face_analysis rows, decoded from the
+    session's 'face' emotion_samples vector nearest in time; empty when there is none.
+    """
+    times = [_epoch(row[1]) for row in rows]
+    samples = {}  # session_id -> ([timestamps], [scores blobs]), sorted by time
+    for session_id in {row[2] for row in rows}:
+        window = [t for t, row in zip(times, rows) if t is not None and row[2] == session_id]
+        if not window:
+            continue
+        async with db_conn.execute(
+            "SELECT timestamp, scores FROM emotion_samples "
+            "WHERE session_id = ? AND timestamp BETWEEN ? AND ? AND source = 'face' ORDER BY timestamp",
+            (session_id, min(window) - FACE_SAMPLE_MATCH_S, max(window) + FACE_SAMPLE_MATCH_S),
+        ) as cursor:
+            found = await cursor.fetchall()
+        samples[session_id] = ([r[0] for r in found], [r[1] for r in found])
+
+    enriched = []
+    for row, t in zip(rows, times):
+        ts_list, blobs = samples.get(row[2], ([], []))
+        best = None
+        if t is not None and ts_list:
+            i = bisect.bisect_left(ts_list, t)
+            near = [j for j in (i - 1, i) if 0 <= j < len(ts_list)]
+            j = min(near, key=lambda k: abs(ts_list[k] - t))
+            if abs(ts_list[j] - t) <= FACE_SAMPLE_MATCH_S:
+                best = np.frombuffer(blobs[j], np.float32)
+        scores = [round(float(v), 4) for v in best] if best is not None else [None] * NUM_EMOTIONS
+        enriched.append(tuple(row) + tuple(scores))
+    return enriched
+
+
+# Extra columns computed per page (from other tables) after the table's own columns.
+EXPORT_EXTRA = {
+    "face_analysis": (EMOTION_NAMES, _with_face_emotions),
+}
+
+
+def _encode_page(rows, columns, fmt, with_header):
+    if fmt == "ndjson":
+        return "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows).encode()
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    if with_header:
+        out.writerow(columns)
+    out.writerows(rows)
+    return buf.getvalue().encode()
+
+
+async def stream_export(request, table):
+    """
+    Streams a table as CSV (default) or NDJSON, EXPORT_PAGE_SIZE rows at a time.
+    Query params: format=csv|ndjson, session_id, since/until (ISO timestamps), after_id (resume point).
+    Memory stays constant: one page is read (holding a pooled connection only for that read),
+    written, and awaited for the client to drain before the next one. Gzip when the client accepts it.
+    """
+    check_admin_token(request)
+    columns = EXPORT_TABLES[table]
+    extra_columns, add_extra = EXPORT_EXTRA.get(table, ([], None))
+    fmt = request.query.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        raise web.HTTPBadRequest(text="format must be csv or ndjson")
+    try:
+        last_id = int(request.query.get("after_id", 0))
+    except ValueError:
+        raise web.HTTPBadRequest(text="after_id must be an integer")
+
+    sql, params = _page_query(table, columns, request.query)
+    resp = web.StreamResponse(headers={
+        "Content-Type": "application/x-ndjson" if fmt == "ndjson" else "text/csv; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="{table}.{fmt}"',
+    })
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp.enable_compression(web.ContentCoding.gzip)
+    await resp.prepare(request)
+
+    exported = 0
+    while True:
+        async with db.connection() as db_conn:
+            async with db_conn.execute(sql, [last_id] + params + [EXPORT_PAGE_SIZE]) as cursor:
+                rows = await cursor.fetchall()
+            if rows and add_extra is not None:
+                rows = await add_extra(db_conn, rows)
+        if not rows and exported:
+            break
+        await resp.write(_encode_page(rows, columns + extra_columns, fmt, with_header=(exported == 0)))
+        if not rows:
+            break
+        exported += len(rows)
+        last_id = rows[-1][0]
+        if len(rows) < EXPORT_PAGE_SIZE:
+            break
+
+    await resp.write_eof()
+    logger.info(f"Exported {exported} rows from {table} ({fmt}).")
+    return resp
+
+
+async def handle_export_conversations(request):
+    return await stream_export(request, "conversation")
+
+
+async def handle_export_face_analysis(request):
+    return await stream_export(request, "face_analysis")
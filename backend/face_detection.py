@@ -0,0 +1,204 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    FACE_CROP_MARGIN,
+    FACE_DETECT_MAX_WIDTH,
+    FACE_DETECT_TIMEOUT_S,
+    FACE_DETECT_WORKERS,
+    FACE_MOSAIC_TILE_PX,
+    FRAME_HASH_MAX_DISTANCE,
+)
+from face_tracking import find_face
+from frame_hash import hamming, thumbnail_dhash
+from lazy_imports import lazy_import
+from logger import logger
+
+cv2 = lazy_import("cv2")
+
+# Loaded once per pool worker by _init_worker, never on the event loop process.
+_face_cascade = None
+
+
+def _init_worker():
+    global _face_cascade
+    cv2.setNumThreads(1)  # one core per worker, the pool provides the parallelism
+    _face_cascade = cv2.CascadeClassifier(
+        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+    )
+
+
+class FaceDetection(NamedTuple):
+    face_area: int = 0
+    frame_area: int = 0
+    sharpness: float = 0.0
+    box: Optional[Tuple[int, int, int, int]] = None  # full-resolution pixels, None when no face was found
+    frame_hash: Optional[int] = None
+    duplicate: bool = False  # near-identical to the last analysed frame, detection skipped
+    roi: bool = False        # found by searching around the previous box only
+
+
+def detect_largest_face(data, last_hash=None, roi_box=None):
+    """
+    Runs inside a pool worker.
+    1) dHash of a 1/8-size thumbnail; if within FRAME_HASH_MAX_DISTANCE of `last_hash`, stop there.
+    2) Otherwise decode at reduced size (JPEG DCT scaling) straight to grayscale,
+       downscale to FACE_DETECT_MAX_WIDTH and detect the largest face there,
+       only around `roi_box` (the session's previous full-resolution box) when given.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    frame_hash = thumbnail_dhash(buf)
+    if frame_hash is None:
+        return FaceDetection()
+    if last_hash is not None and hamming(frame_hash, last_hash) <= FRAME_HASH_MAX_DISTANCE:
+        return FaceDetection(frame_hash=frame_hash, duplicate=True)
+
+    gray = cv2.imdecode(buf, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if gray is None:
+        return FaceDetection(frame_hash=frame_hash)
+
+    scale = 2.0  # reduced decode halves each side
+    if gray.shape[1] > FACE_DETECT_MAX_WIDTH:
+        shrink = FACE_DETECT_MAX_WIDTH / gray.shape[1]
+        gray = cv2.resize(gray, None, fx=shrink, fy=shrink, interpolation=cv2.INTER_AREA)
+        scale /= shrink
+    frame_area = int(gray.shape[0] * gray.shape[1] * scale * scale)
+
+    roi = tuple(v / scale for v in roi_box) if roi_box is not None else None
+    face, used_roi = find_face(_face_cascade, gray, roi)
+    if face is None:
+        return FaceDetection(frame_area=frame_area, frame_hash=frame_hash)
+
+    (x, y, w, h) = face
+    sharpness = cv2.Laplacian(gray[y:y + h, x:x + w], cv2.CV_64F).var()
+    box = tuple(int(round(v * scale)) for v in (x, y, w, h))
+    return FaceDetection(box[2] * box[3], frame_area, float(sharpness), box, frame_hash, roi=used_roi)
+
+
+def _warm_worker():
+    """
+    Runs inside a pool worker: one decode and one detection, so the first real frame pays neither.
+    Sleeps briefly so concurrent warm-up jobs land on different workers.
+    """
+    ok, encoded = cv2.imencode(".jpg", np.full((480, 640), 128, np.uint8))
+    detect_largest_face(encoded.tobytes())
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def crop_face(data, box):
+    """
+    Runs inside a pool worker.
+    Full-resolution decode of the winning frame only, crops the face box plus FACE_CROP_MARGIN
+    and returns it JPEG-encoded (or None if the frame cannot be decoded).
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    x, y, w, h = box
+    mx, my = int(w * FACE_CROP_MARGIN), int(h * FACE_CROP_MARGIN)
+    x0, y0 = max(0, x - mx), max(0, y - my)
+    x1, y1 = min(img.shape[1], x + w + mx), min(img.shape[0], y + h + my)
+    ok, crop = cv2.imencode(".jpg", img[y0:y1, x0:x1], [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return crop.tobytes() if ok else None
+
+
+def build_face_mosaic(crops, tile=FACE_MOSAIC_TILE_PX):
+    """
+    Runs inside a pool worker.
+    Letterboxes each JPEG crop into a `tile` x `tile` square and lays them out in a grid,
+    so several faces can go to Hume in one message.
+    Returns (jpeg_bytes, cols, tile), or None if nothing could be decoded.
+    """
+    cols = int(np.ceil(np.sqrt(len(crops))))
+    rows = int(np.ceil(len(crops) / cols))
+    mosaic = np.zeros((rows * tile, cols * tile, 3), np.uint8)
+    placed = 0
+    for i, data in enumerate(crops):
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        shrink = tile / max(img.shape[:2])
+        img = cv2.resize(img, None, fx=shrink, fy=shrink, interpolation=cv2.INTER_AREA)
+        r, c = divmod(i, cols)
+        y0 = r * tile + (tile - img.shape[0]) // 2
+        x0 = c * tile + (tile - img.shape[1]) // 2
+        mosaic[y0:y0 + img.shape[0], x0:x0 + img.shape[1]] = img
+        placed += 1
+    if not placed:
+        return None
+    ok, encoded = cv2.imencode(".jpg", mosaic, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return (encoded.tobytes(), cols, tile) if ok else None
+
+
+class FaceDetectionExecutor:
+    """
+    Process pool for OpenCV face detection so the aiohttp event loop never blocks on it.
+    Each worker loads the Haar cascade once when it starts.
+    """
+
+    def __init__(self, workers=FACE_DETECT_WORKERS):
+        self.workers = workers
+        self.in_flight = 0  # jobs submitted and not yet answered (or timed out)
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            logger.info(f"Face detection pool started with {self.workers} workers.")
+
+    async def warm_up(self):
+        """Spawn every worker and run one detection in each; returns how many workers answered."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._pool, _warm_worker) for _ in range(self.workers)))
+        return len(set(pids))
+
+    def load(self):
+        """Jobs in flight per worker: below 1 the pool keeps up, above 1 frames are queueing."""
+        return self.in_flight / self.workers
+
+    async def _run(self, timeout, fn, *args):
+        self.start()
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._pool, fn, *args), timeout)
+        finally:
+            self.in_flight -= 1
+
+    async def detect(self, data, last_hash=None, roi_box=None, timeout=FACE_DETECT_TIMEOUT_S):
+        """
+        Detect the largest face in encoded image bytes (around `roi_box` if given),
+        unless the frame is a near-duplicate of `last_hash`.
+        Raises asyncio.TimeoutError if no worker answers in time (the job itself is not interrupted).
+        """
+        return await self._run(timeout, detect_largest_face, data, last_hash, roi_box)
+
+    async def crop(self, data, box, timeout=FACE_DETECT_TIMEOUT_S):
+        """JPEG crop of `box` from the full-resolution frame."""
+        return await self._run(timeout, crop_face, data, box)
+
+    async def mosaic(self, crops, timeout=FACE_DETECT_TIMEOUT_S):
+        """Tile several JPEG face crops into one image for a batched Hume request."""
+        return await self._run(timeout, build_face_mosaic, crops)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("Face detection pool stopped.")
+
+
+face_detector = FaceDetectionExecutor()
@@ -0,0 +1,97 @@
+import time
+
+from config import (
+    FACE_FLUSH_EVERY_N,
+    FACE_FLUSH_INTERVAL_S,
+    FACE_QUALITY_MIN_AREA_RATIO,
+    FACE_QUALITY_MIN_SHARPNESS,
+)
+from face_tracking import FaceTrack
+
+
+class BestFaceTracker:
+    """
+    Running best-of-N face selection for one session.
+    Only the current best frame (encoded bytes + face box) is kept in memory;
+    every other frame is dropped as soon as it is scored.
+    """
+
+    def __init__(self):
+        self.flush_handle = None      # asyncio TimerHandle for the time-based flush
+        self.satisfied_until = 0.0    # early stop: skip detection until this time
+        self.last_hash = None         # dHash of the last frame that went through detection
+        self.last_detection = None    # its FaceDetection, reused for near-duplicate frames
+        self.frames_hashed = 0
+        self.hash_hits = 0
+        self.track = FaceTrack()      # ROI for the next detection; kept across windows
+        self.reset()
+
+    def reset(self):
+        self.best_frame = None
+        self.best_box = None
+        self.best_name = None
+        self.best_area = 0
+        self.frames_seen = 0
+        self.window_started = None
+
+    def is_satisfied(self, now=None):
+        """True while a quality frame was already sent this window."""
+        return (now or time.monotonic()) < self.satisfied_until
+
+    def record_hash(self, detection):
+        """
+        Track duplicate-skip stats; only frames that were actually analysed move `last_hash`,
+        `last_detection` and the face track.
+        """
+        self.frames_hashed += 1
+        if detection.duplicate:
+            self.hash_hits += 1
+        elif detection.frame_hash is not None:
+            self.last_hash = detection.frame_hash
+            self.last_detection = detection
+            self.track.update(detection.box, detection.roi)
+
+    @property
+    def hash_hit_ratio(self):
+        return self.hash_hits / self.frames_hashed if self.frames_hashed else 0.0
+
+    def offer(self, name, area, frame_area, sharpness, frame_bytes, box):
+        """
+        Score one frame. Returns True if it clears the quality bar,
+        meaning the caller should flush now instead of waiting for more frames.
+        """
+        if self.window_started is None:
+            self.window_started = time.monotonic()
+        self.frames_seen += 1
+
+        if box is not None and area > self.best_area:
+            self.best_area = area
+            self.best_name = name
+            self.best_frame = frame_bytes
+            self.best_box = box
+
+        return (
+            box is not None
+            and frame_area > 0
+            and area / frame_area >= FACE_QUALITY_MIN_AREA_RATIO
+            and sharpness >= FACE_QUALITY_MIN_SHARPNESS
+        )
+
+    def count_reached(self):
+        return self.frames_seen >= FACE_FLUSH_EVERY_N
+
+    def take_best(self, early_stop=False):
+        """
+        Hand over (name, frame_bytes, box, area) of the best frame and start a new window.
+        After an early stop, detection is skipped for the rest of the flush interval.
+        """
+        best = None
+        if self.best_frame is not None:
+            best = (self.best_name, self.best_frame, self.best_box, self.best_area)
+        self.reset()
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if early_stop:
+            self.satisfied_until = time.monotonic() + FACE_FLUSH_INTERVAL_S
+        return best
@@ -0,0 +1,65 @@
+from config import FACE_ROI_EXPAND, FACE_ROI_MAX_SCALE, FACE_ROI_MIN_SCALE, FACE_TRACK_REDETECT_EVERY
+
+
+def _largest(faces):
+    return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3])) if len(faces) else None
+
+
+def find_face(cascade, gray, roi=None, scale_factor=1.3, min_neighbors=5):
+    """
+    Largest face in `gray` as (x, y, w, h) in `gray` pixels, and whether it was found in the ROI.
+    With `roi` (the previous face box, same pixels) only a window FACE_ROI_EXPAND box-sizes wider on
+    each side is searched, for faces FACE_ROI_MIN_SCALE..FACE_ROI_MAX_SCALE times the previous size.
+    A miss there falls back to the full frame.
+    """
+    if roi is not None:
+        x, y, w, h = roi
+        mx, my = w * FACE_ROI_EXPAND, h * FACE_ROI_EXPAND
+        x0, y0 = max(0, int(x - mx)), max(0, int(y - my))
+        x1, y1 = min(gray.shape[1], int(x + w + mx)), min(gray.shape[0], int(y + h + my))
+        size = max(w, h)
+        min_size = max(1, int(size * FACE_ROI_MIN_SCALE))
+        max_size = int(size * FACE_ROI_MAX_SCALE)
+        if x1 - x0 >= min_size and y1 - y0 >= min_size:
+            face = _largest(cascade.detectMultiScale(
+                gray[y0:y1, x0:x1], scale_factor, min_neighbors,
+                minSize=(min_size, min_size), maxSize=(max_size, max_size),
+            ))
+            if face is not None:
+                return (face[0] + x0, face[1] + y0, face[2], face[3]), True
+
+    return _largest(cascade.detectMultiScale(gray, scale_factor, min_neighbors)), False
+
+
+class FaceTrack:
+    """
+    Where one session's face was last seen (full-resolution box) and how many frames ago
+    the last full-frame detection ran. Frames in between are searched around that box only.
+    """
+
+    def __init__(self, redetect_every=FACE_TRACK_REDETECT_EVERY):
+        self.redetect_every = redetect_every
+        self.box = None
+        self.since_full = 0
+        self.roi_hits = 0
+        self.full_detects = 0
+
+    def roi(self):
+        """Box to search around in the next frame, or None when a full-frame detection is due."""
+        if self.box is None or self.since_full >= self.redetect_every:
+            return None
+        return self.box
+
+    def update(self, box, used_roi):
+        self.box = box
+        if used_roi:
+            self.roi_hits += 1
+            self.since_full += 1
+        else:
+            self.full_detects += 1
+            self.since_full = 0
+
+    @property
+    def roi_ratio(self):
+        total = self.roi_hits + self.full_detects
+        return self.roi_hits / total if total else 0.0
@@ -0,0 +1,27 @@
+import numpy as np
+
+from lazy_imports import lazy_import
+
+cv2 = lazy_import("cv2")
+
+
+def dhash(gray, hash_size=8):
+    """
+    64-bit difference hash of a grayscale image.
+    Shrinks to (hash_size + 1) x hash_size and records whether each pixel is brighter than its right neighbour.
+    """
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def thumbnail_dhash(buf):
+    """dHash straight from encoded bytes, decoded at 1/8 size (JPEG DCT scaling). None if undecodable."""
+    thumb = cv2.imdecode(buf, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumb is None:
+        return None
+    return dhash(thumb)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
@@ -0,0 +1,57 @@
+import os
+
+from lazy_imports import lazy_import
+from logger import logger
+
+cv2 = lazy_import("cv2")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def camera_frames(index):
+    cap = cv2.VideoCapture(index)
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                logger.warning(f"Camera {index}: failed to capture frame.")
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def video_frames(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def image_dir_frames(path):
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(os.path.join(path, name), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield frame
+
+
+def open_frame_source(spec):
+    """
+    BGR frames for login capture, from LOGIN_FRAME_SOURCE:
+    a camera index ("0"), a video file, or a directory of images (read in name order).
+    Files and directories let capture be tested and benchmarked without a camera.
+    """
+    spec = str(spec)
+    if spec.isdigit():
+        return camera_frames(int(spec))
+    if os.path.isdir(spec):
+        return image_dir_frames(spec)
+    if os.path.isfile(spec):
+        return video_frames(spec)
+    raise ValueError(f"Frame source {spec!r} is not a camera index, video file or image directory")
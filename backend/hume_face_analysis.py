@@ -1,9 +1,131 @@
 from logger import logger
+import asyncio
+import base64
+import contextlib
 import datetime
-from hume import AsyncHumeClient
-from hume.expression_measurement.stream import Config
-from hume.expression_measurement.stream.socket_client import StreamConnectOptions
-from hume.expression_measurement.stream.types import StreamFace
+
+from env_keys import get_hume_api_key
+from config import (
+    HUME_BATCH_MAX_FRAMES,
+    HUME_BATCH_WINDOW_S,
+    HUME_IDLE_TIMEOUT_S,
+    HUME_MAX_RETRIES,
+)
+from face_detection import face_detector
+from lazy_imports import lazy_from
+from upstream import UpstreamUnavailable, hume_face_upstream
+
+AsyncHumeClient = lazy_from("hume", "AsyncHumeClient")
+Config = lazy_from("hume.expression_measurement.stream", "Config")
+StreamConnectOptions = lazy_from("hume.expression_measurement.stream.socket_client", "StreamConnectOptions")
+StreamFace = lazy_from("hume.expression_measurement.stream.types", "StreamFace")
+
+
+class HumeStreamManager:
+    """
+    One long-lived Hume streaming socket per worker process, shared by every session.
+    Messages are serialized over the socket (it answers one payload at a time),
+    dropped connections are re-opened with exponential backoff and the socket
+    is closed after HUME_IDLE_TIMEOUT_S without traffic.
+    """
+
+    def __init__(self, model_config, idle_timeout=HUME_IDLE_TIMEOUT_S):
+        self.model_config = model_config  # factory, so the hume SDK is only imported on first connect
+        self.idle_timeout = idle_timeout
+        self._loop = None
+        self._lock = None
+        self._stack = None
+        self._socket = None
+        self._idle_task = None
+        self._last_used = 0.0
+
+    def _bind_loop(self):
+        # Login runs its own event loop; a socket cannot be shared across loops.
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._stack = None
+            self._socket = None
+            self._idle_task = None
+
+    async def _connect(self):
+        stack = contextlib.AsyncExitStack()
+        client = AsyncHumeClient(api_key=get_hume_api_key())
+        stream_options = StreamConnectOptions(config=self.model_config())
+        self._socket = await stack.enter_async_context(
+            client.expression_measurement.stream.connect(options=stream_options)
+        )
+        self._stack = stack
+        if self._idle_task is None or self._idle_task.done():
+            self._idle_task = asyncio.create_task(self._close_when_idle())
+        logger.info("Hume stream socket opened.")
+
+    async def _disconnect(self):
+        stack, self._stack, self._socket = self._stack, None, None
+        if stack is not None:
+            try:
+                await stack.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing Hume stream socket: {e}")
+            logger.info("Hume stream socket closed.")
+
+    def _abandon(self):
+        # Cancelled mid-message: its reply may still arrive and would answer the next payload, so drop the socket.
+        stack, self._stack, self._socket = self._stack, None, None
+        if stack is not None:
+            asyncio.ensure_future(stack.aclose())
+
+    async def _close_when_idle(self):
+        while self._socket is not None:
+            await asyncio.sleep(self.idle_timeout / 2)
+            if self._loop.time() - self._last_used >= self.idle_timeout:
+                async with self._lock:
+                    if self._loop.time() - self._last_used >= self.idle_timeout:
+                        await self._disconnect()
+
+    async def send_file(self, encoded_payload, upstream=None):
+        """
+        Send one base64 payload and return Hume's result, reconnecting with backoff on failure.
+        With an `upstream`, its timeout and breaker cover the send only: the clock starts once
+        the socket is ours, so time spent queued behind other payloads is never a Hume timeout.
+        """
+        self._bind_loop()
+        async with self._lock:
+            if upstream is not None:
+                return await upstream.call(self._send_locked, encoded_payload)
+            return await self._send_locked(encoded_payload)
+
+    async def _send_locked(self, encoded_payload):
+        for attempt in range(HUME_MAX_RETRIES):
+            try:
+                if self._socket is None:
+                    await self._connect()
+                result = await self._socket.send_file(encoded_payload)
+                self._last_used = self._loop.time()
+                return result
+            except asyncio.CancelledError:
+                self._abandon()
+                raise
+            except Exception as e:
+                logger.error(f"Hume stream error (attempt {attempt + 1}): {e}")
+                await self._disconnect()
+                if attempt < HUME_MAX_RETRIES - 1:
+                    await asyncio.sleep(2 ** attempt)
+        raise ConnectionError("Hume stream unavailable after retries")
+
+    async def close(self):
+        if self._lock is not None:
+            async with self._lock:
+                await self._disconnect()
+
+
+face_stream = HumeStreamManager(lambda: Config(face=StreamFace()))
+
+
+def _emotions_dict(prediction):
+    emotions_sorted = sorted(prediction.emotions or [], key=lambda e: e.score, reverse=True)
+    return {e.name: e.score for e in emotions_sorted}
 
 
 async def analyze_face_image(image_path: str) -> dict:
@@ -11,32 +133,127 @@ async def analyze_face_image(image_path: str) -> dict:
     Calls Hume's streaming API for face analysis on a single image.
     Returns {emotion_name: score, ...}
     """
-    try:
-        client = AsyncHumeClient(api_key=HUME_API_KEY)
-        model_config = Config(face=StreamFace())
-        stream_options = StreamConnectOptions(config=model_config)
+    return await analyze_face_bytes(encode_image(image_path))
 
-        async with client.expression_measurement.stream.connect(options=stream_options) as socket:
-            encoded_image = encode_image(image_path)
-            result = await socket.send_file(encoded_image)
 
-            if not result or not result.face or not result.face.predictions:
-                logger.warning("No face predictions from Hume.")
-                return {}
+async def analyze_face_bytes(encoded_image: str) -> dict:
+    """Same as analyze_face_image, for an image already in memory (base64 string)."""
+    try:
+        result = await face_stream.send_file(encoded_image, upstream=hume_face_upstream)
+
+        if not result or not result.face or not result.face.predictions:
+            logger.warning("No face predictions from Hume.")
+            return {}
 
-            face_predictions = result.face.predictions[0]  # first face
-            if not face_predictions or not face_predictions.emotions:
-                return {}
+        face_predictions = result.face.predictions[0]  # first face
+        if not face_predictions or not face_predictions.emotions:
+            return {}
 
-            emotions_sorted = sorted(face_predictions.emotions, key=lambda e: e.score, reverse=True)
-            return {e.name: e.score for e in emotions_sorted}
+        return _emotions_dict(face_predictions)
+    except UpstreamUnavailable as e:
+        hume_face_upstream.fallback(e)
+        return {}
     except Exception as e:
         logger.error(f"❌ Error analyzing face image with Hume: {e}")
         return {}
 
+
+def _tile_of(bbox, cols, tile):
+    """Index of the mosaic tile that fully contains `bbox` (1 px rounding slack), else None."""
+    col, row = max(0, int(bbox.x // tile)), max(0, int(bbox.y // tile))
+    x0, y0 = col * tile, row * tile
+    if (col >= cols or bbox.x < x0 - 1 or bbox.y < y0 - 1
+            or bbox.x + bbox.w > x0 + tile + 1 or bbox.y + bbox.h > y0 + tile + 1):
+        return None
+    return row * cols + col
+
+
+async def analyze_face_batch(crops):
+    """
+    Analyzes several face crops with a single Hume request.
+    The crops are tiled into one mosaic; a prediction is credited to a tile only if its bounding box
+    lies entirely inside that tile. The crops may belong to different sessions, so a box that straddles
+    tiles (or leaves the grid) is dropped rather than guessed.
+    Returns one {emotion_name: score} dict per crop ({} where Hume found no face).
+    """
+    results = [{} for _ in crops]
+    try:
+        mosaic = await face_detector.mosaic(crops)
+        if mosaic is None:
+            return results
+        mosaic_bytes, cols, tile = mosaic
+
+        result = await face_stream.send_file(base64.b64encode(mosaic_bytes).decode("utf-8"), upstream=hume_face_upstream)
+        if not result or not result.face or not result.face.predictions:
+            logger.warning("No face predictions from Hume for batch.")
+            return results
+
+        best_area = [0.0] * len(crops)
+        dropped = 0
+        for prediction in result.face.predictions:
+            if not prediction.bbox or not prediction.emotions:
+                continue
+            idx = _tile_of(prediction.bbox, cols, tile)
+            if idx is None or idx >= len(crops):
+                dropped += 1
+                continue
+            b = prediction.bbox
+            if b.w * b.h > best_area[idx]:
+                best_area[idx] = b.w * b.h
+                results[idx] = _emotions_dict(prediction)
+        if dropped:
+            logger.warning(f"Dropped {dropped} Hume face prediction(s) not inside a single mosaic tile.")
+        return results
+    except UpstreamUnavailable as e:
+        hume_face_upstream.fallback(e)
+        return results
+    except Exception as e:
+        logger.error(f"❌ Error analyzing face batch with Hume: {e}")
+        return results
+
+
+class FaceBatcher:
+    """
+    Collects face crops from all sessions for up to HUME_BATCH_WINDOW_S (or HUME_BATCH_MAX_FRAMES)
+    and analyzes them with one Hume request.
+    """
+
+    def __init__(self):
+        self._pending = []  # (crop_bytes, future)
+        self._timer = None
+
+    async def analyze(self, crop_bytes):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((crop_bytes, fut))
+        if len(self._pending) >= HUME_BATCH_MAX_FRAMES:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(HUME_BATCH_WINDOW_S, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        results = await analyze_face_batch([crop for crop, _ in batch])
+        logger.info(f"Hume analyzed {len(batch)} face(s) in one request.")
+        for (_, fut), emotions in zip(batch, results):
+            if not fut.done():
+                fut.set_result(emotions)
+
+
+face_batcher = FaceBatcher()
+
+
 def encode_image(path_):
     """
-    Helper to read the image and return raw bytes if needed for the streaming socket.
+    Helper to read the image and return it base64-encoded for the streaming socket.
     """
     with open(path_, "rb") as f:
-        return f.read()
+        return base64.b64encode(f.read()).decode("utf-8")
@@ -1,25 +1,63 @@
 import aiofiles
-import aiosqlite
 import asyncio
 import datetime
 import logging
 import os
+import time
 import uuid
-import cv2
+from collections import OrderedDict
 from aiohttp import web
 
-from hume_face_analysis import analyze_face_image
+from hume_face_analysis import face_batcher
+from face_detection import FaceDetection, face_detector
+from face_selection import BestFaceTracker
+from emotion_store import save_emotion_sample, top_emotions, vectorize
+from emotion_state import update_emotion_state
 from logger import logger
-from config import IMAGES_PER_BATCH, IMAGE_DIR, DB_FILE
-from session_helpers import get_last_session_id
+from config import CAPTURE_SESSION_IDLE_TTL_S, FACE_FLUSH_INTERVAL_S, IMAGE_DIR
+from write_behind import writer
+from replay import note_upload
+from capture_policy import capture_admission, capture_policy
 
 image_file_counter = 0
-images_batch_list = []  # Collect filenames here until we have 40 images.
+face_trackers = OrderedDict()  # session_id -> BestFaceTracker, least recently used first
+_last_frame = {}  # session_id -> time.monotonic() of its last frame
+
+
+def _touch(session_id):
+    """Mark the session as active and drop the face state of sessions idle for CAPTURE_SESSION_IDLE_TTL_S."""
+    now = time.monotonic()
+    _last_frame[session_id] = now
+    face_trackers.move_to_end(session_id)
+    while face_trackers:
+        oldest = next(iter(face_trackers))
+        if now - _last_frame[oldest] < CAPTURE_SESSION_IDLE_TTL_S:
+            break
+        tracker = face_trackers.popitem(last=False)[1]
+        if tracker.flush_handle is not None:
+            tracker.flush_handle.cancel()
+        del _last_frame[oldest]
+        capture_admission.forget(oldest)
+        logger.debug(f"Face state of idle session {oldest} dropped.")
+
 
 async def handle_image_upload(request):
     """
-    Once we get 40 images, run face detection, pick best face, analyze with Hume, store in DB, delete others.
+    Scores each frame in memory as it arrives and keeps only the running best frame.
+    The best face goes to Hume early (quality bar), after FACE_FLUSH_EVERY_N frames,
+    or FACE_FLUSH_INTERVAL_S after the window opened, whichever comes first.
     """
+    global image_file_counter
+
+    session_id = request["session_id"] or "unknown_session"
+    tracker = face_trackers.setdefault(session_id, BestFaceTracker())
+    _touch(session_id)
+
+    # Admission before the body is read: an excess frame costs a 429, not a decode.
+    policy = capture_policy(tracker)
+    retry_after = capture_admission.admit(session_id, policy)
+    if retry_after is not None:
+        return web.json_response(policy, status=429, headers={"Retry-After": str(max(1, round(retry_after)))})
 
     logger.info("📸 Received image upload request...")
     try:
@@ -30,100 +68,108 @@ async def handle_image_upload(request):
 
         original_filename = field.filename or f"image_{datetime.datetime.now().timestamp()}.jpg"
         unique_name = f"{uuid.uuid4()}_{original_filename}"
-        save_path = os.path.join(IMAGE_DIR, unique_name)
 
-        # Save image
-        async with aiofiles.open(save_path, "wb") as f:
-            while True:
-                chunk = await field.read_chunk()
-                if not chunk:
-                    break
-                await f.write(chunk)
-
-        image_file_counter += 1
-        images_batch_list.append(save_path)
+        # Frames stay in memory; only the winning face crop is ever written to disk.
+        data = await field.read()
+        await note_upload(request, original_filename, "image/jpeg", data)
 
-        logger.info(f"✅ Image saved: {save_path} (count in batch: {len(images_batch_list)})")
+        if tracker.is_satisfied():
+            # Early stop: a good face was already sent this window, skip detection.
+            return web.Response(text=f"✅ Image skipped: {unique_name}")
 
-        # If we reached 40 images, run face detection pipeline
-        if len(images_batch_list) >= IMAGES_PER_BATCH:
-            logger.info(f"🌟 We have {IMAGES_PER_BATCH} images. Processing face detection now.")
-            await process_face_images_batch()
+        image_file_counter += 1
+        try:
+            detection = await face_detector.detect(data, last_hash=tracker.last_hash, roi_box=tracker.track.roi())
+        except asyncio.TimeoutError:
+            logger.warning(f"Face detection timed out for {unique_name}. Skipping frame.")
+            detection = FaceDetection()
+
+        tracker.record_hash(detection)
+        if detection.duplicate:
+            # Same scene as the last analysed frame: reuse its scores so a still user keeps
+            # filling (and flushing) windows instead of stalling face-emotion updates.
+            logger.info(
+                f"✅ Near-duplicate image, reusing last detection: {unique_name} "
+                f"(hash hit ratio: {tracker.hash_hit_ratio:.0%} of {tracker.frames_hashed})"
+            )
+            detection = tracker.last_detection
+
+        good_enough = tracker.offer(
+            unique_name, detection.face_area, detection.frame_area, detection.sharpness, data, detection.box
+        )
+        logger.info(
+            f"✅ Image scored: {unique_name} (face area={detection.face_area}, "
+            f"frames in window: {tracker.frames_seen}, hash hit ratio: {tracker.hash_hit_ratio:.0%}, "
+            f"ROI ratio: {tracker.track.roi_ratio:.0%})"
+        )
+
+        if good_enough:
+            logger.info(f"🌟 Face in {unique_name} clears the quality bar. Flushing early.")
+            asyncio.create_task(flush_best_face(session_id, early_stop=True))
+        elif tracker.count_reached():
+            logger.info(f"🌟 {tracker.frames_seen} frames scored. Flushing best face.")
+            asyncio.create_task(flush_best_face(session_id))
+        elif tracker.flush_handle is None:
+            tracker.flush_handle = asyncio.get_running_loop().call_later(
+                FACE_FLUSH_INTERVAL_S,
+                lambda: asyncio.create_task(flush_best_face(session_id)),
+            )
 
         return web.Response(text=f"✅ Image uploaded: {unique_name}")
     except Exception as e:
         logger.error(f"Image upload error: {str(e)}")
         return web.Response(text=f"❌ Upload failed: {str(e)}", status=500)
 
-async def process_face_images_batch():
+async def handle_capture_policy(request):
+    """GET /capture_policy: frame interval, max size and JPEG quality the browser should capture with now."""
+    session_id = request["session_id"] or "unknown_session"
+    return web.json_response(capture_policy(face_trackers.get(session_id)))
+
+
+async def flush_best_face(session_id, early_stop=False):
     """
-    - Use OpenCV to detect largest face among the 40 images.
-    - Send best face image to Hume for face emotion analysis.
-    - Delete all other images.
-    - Store face emotion in DB, clear images_batch_list.
+    - Take the session's best frame and start a new selection window.
+    - Crop the face at full resolution; only that crop is written to disk and sent to Hume.
+    - Store face emotion in DB.
     """
+    tracker = face_trackers.get(session_id)
+    best = tracker.take_best(early_stop=early_stop) if tracker else None
+    if best is None:
+        logger.info("No face detected in this window. Nothing to analyze.")
+        return
 
-    if not images_batch_list:
-        logger.info("No images to process.")
+    best_name, best_frame, best_box, best_area = best
+    try:
+        best_crop = await face_detector.crop(best_frame, best_box)
+    except asyncio.TimeoutError:
+        best_crop = None
+    if best_crop is None:
+        logger.warning(f"Could not crop face from {best_name}. Skipping analysis.")
         return
 
-    best_image_path = None
-    best_area = 0
+    best_image_path = os.path.join(IMAGE_DIR, f"face_{best_name}")
+    async with aiofiles.open(best_image_path, "wb") as f:
+        await f.write(best_crop)
+    logger.info(f"Best face found in {best_name}, area={best_area}.")
 
-    face_cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    )
+    # Analyze best face with Hume (batched with other sessions' faces on the shared socket)
+    face_emotions = await face_batcher.analyze(best_crop)
+    logger.info(f"Face emotions from Hume: {face_emotions}")
+    update_emotion_state(session_id, "face", face_emotions)
 
-    for path_ in images_batch_list:
-        try:
-            img = cv2.imread(path_)
-            if img is None:
-                continue
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-            if len(faces) > 0:
-                (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])  # largest area
-                area = w * h
-                if area > best_area:
-                    best_area = area
-                    best_image_path = path_
-        except Exception as e:
-            logger.error(f"Error reading {path_} for face detection: {e}")
-
-    if best_image_path is None:
-        logger.warning("No face detected in these images. Deleting them all.")
-        for path_ in images_batch_list:
-            try:
-                os.remove(path_)
-            except:
-                pass
-        images_batch_list.clear()
-        return
+    save_face_analysis(session_id, os.path.basename(best_image_path), face_emotions)
 
-    logger.info(f"Best face found in {best_image_path}, area={best_area}. Deleting the rest.")
-    # Delete others
-    for path_ in images_batch_list:
-        if path_ != best_image_path:
-            try:
-                os.remove(path_)
-            except:
-                pass
-
-    images_batch_list.clear()
-    # Analyze best face with Hume
-    face_emotions = await analyze_face_image(best_image_path)
-    logger.info(f"Face emotions from Hume: {face_emotions}")
 
-    # Store in DB
-    async with aiosqlite.connect(DB_FILE) as db_conn:
-        session_id = await get_last_session_id(db_conn) or "unknown_session"
-        timestamp = datetime.datetime.now().isoformat()
-        face_file_name = os.path.basename(best_image_path)
-        face_emotions_str = ", ".join(f"{k}: {v:.2f}" for k, v in face_emotions.items())
-
-        await db_conn.execute('''
-            INSERT INTO face_analysis (timestamp, session_id, face_file_name, face_emotions)
-            VALUES (?, ?, ?, ?)
-        ''', (timestamp, session_id, face_file_name, face_emotions_str))
-        await db_conn.commit()
-        logger.info(f"Saved face analysis: {face_file_name} => {face_emotions_str}")
+def save_face_analysis(session_id, face_file_name, face_emotions, ts=None):
+    """
+    Queue (group-committed) the file reference in face_analysis and the scores in emotion_samples.
+    Both rows get the same timestamp, which is how the face export pairs them.
+    """
+    ts = ts if ts is not None else datetime.datetime.now().timestamp()
+    when = datetime.datetime.fromtimestamp(ts)
+    writer.submit('''
+        INSERT INTO face_analysis (timestamp, session_id, face_file_name)
+        VALUES (?, ?, ?)
+    ''', (when.isoformat(), session_id, face_file_name))
+    save_emotion_sample(session_id, "face", face_emotions, ts)
+    logger.info(f"Queued face analysis: {face_file_name} => {top_emotions(vectorize(face_emotions))}")
@@ -0,0 +1,68 @@
+import importlib
+import time
+
+from logger import logger
+
+# module name -> seconds its first import took (reported at startup and by warm-up)
+load_timings = {}
+_modules = {}
+
+
+def _load(name):
+    module = _modules.get(name)
+    if module is None:
+        t0 = time.perf_counter()
+        module = importlib.import_module(name)
+        load_timings[name] = time.perf_counter() - t0
+        _modules[name] = module
+        logger.info(f"Lazy import of {name} took {load_timings[name] * 1000:.0f} ms.")
+    return module
+
+
+class LazyModule:
+    """
+    Stands in for a heavy module; the real import happens on first attribute access.
+    (importlib.util.LazyLoader would import every parent package eagerly, e.g. all of `hume`.)
+    """
+
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        return getattr(_load(self._lazy_name), attr)
+
+
+class LazyAttribute:
+    """`from module import name`, resolved on first use: attribute access or call."""
+
+    def __init__(self, module_name, attr):
+        self._lazy_module = module_name
+        self._lazy_attr = attr
+
+    def _resolve(self):
+        return getattr(_load(self._lazy_module), self._lazy_attr)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+
+_registered = set()
+
+
+def lazy_import(name):
+    _registered.add(name)
+    return LazyModule(name)
+
+
+def lazy_from(module_name, attr):
+    _registered.add(module_name)
+    return LazyAttribute(module_name, attr)
+
+
+def load_all():
+    """Import every registered heavy module now (worker warm-up), so no request pays for it."""
+    for name in sorted(_registered):
+        _load(name)
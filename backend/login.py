@@ -1,31 +1,19 @@
 import os
 import sqlite3
-import cv2
 import time
-import base64
-import asyncio
-import pandas as pd
-import nest_asyncio
-from flask import Flask, render_template, request, redirect, session
+from flask import Flask, render_template, request, redirect, session, jsonify
 from datetime import datetime
-from pathlib import Path
-from PIL import Image
-from hume import AsyncHumeClient
-from hume.expression_measurement.stream import Config
-from hume.expression_measurement.stream.socket_client import StreamConnectOptions
-from hume.expression_measurement.stream.types import StreamFace
 import sys
-import os
 
 BASE_DIR = os.getenv("APP_BASE_DIR", "/app")  # Default to /app in Docker
 sys.path.append(BASE_DIR)
 
-from config import SECRET_KEY
-from env_keys import get_hume_api_key
-
-
-# Apply nest_asyncio for Flask async compatibility
-nest_asyncio.apply()
+from config import SECRET_KEY, DB_FILE, ADMIN_FILE, FRONTEND_ORIGIN
+from database import sync_connection
+from migrations import USERS_TABLE_SQL
+from session_helpers import touch_session_marker
+from login_capture import capture_worker
+from session_tokens import issue_token
 
 last_insert_time = 0
 
@@ -39,43 +27,31 @@ print("🚀 Application is starting...")
 
 # Load admin usernames from file
 def load_admin_usernames():
-    admin_file_path = os.path.join(os.getcwd(), '/Users/Parzon/Downloads/Artificial_Consciousness/InteractiveAvatarNextJSDemo-main/HeyGenPersonalised/backend/admin.txt')
-    if os.path.exists(admin_file_path):
-        with open(admin_file_path, 'r') as file:
+    if os.path.exists(ADMIN_FILE):
+        with open(ADMIN_FILE, 'r') as file:
             return [line.strip() for line in file if line.strip()]
     return []
 
-admin_usernames = load_admin_usernames()
-print(f"✅ Admin Usernames Loaded: {admin_usernames}")
-
-# Create SQLite database if it doesn't exist
-DB_PATH = "users.db"
-
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-c = conn.cursor()
-c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        login_timestamp TEXT,
-        initial_mood TEXT,
-        session_id TEXT,
-        UNIQUE(username, login_timestamp, session_id)
-    )
-''')
-conn.commit()
-print(f"✅ Database Initialized: {DB_PATH}")
-
-columns = ['Username', 'Initial Mood', 'Timestamp']
-columns = list(columns)  # Ensure it is a list, not an ndarray
-print(f"🛠 Debug: Columns type: {type(columns)}, Content: {columns}")
-
-try:
-    mood_df = pd.DataFrame(columns=columns)
-    print(f"✅ DataFrame initialized successfully. Shape: {mood_df.shape}")
-except Exception as e:
-    print(f"❌ DataFrame Initialization Error: {e}")
-    raise
+admin_usernames = []
+
+
+def init_login():
+    """Startup side effects (once per worker, not at import): admin list, users table, capture thread."""
+    admin_usernames[:] = load_admin_usernames()
+    print(f"✅ Admin Usernames Loaded: {admin_usernames}")
+
+    # Create SQLite database if it doesn't exist (per-thread WAL connections from database.py)
+    conn = sync_connection()
+    conn.execute(USERS_TABLE_SQL)
+    conn.commit()
+    print(f"✅ Database Initialized: {DB_FILE}")
+    capture_worker.start()
+
+
+def create_app():
+    """gunicorn entry point: 'login:create_app()'."""
+    init_login()
+    return app
 
 
 @app.route('/')
@@ -100,137 +76,79 @@ def login():
             current_time = time.time()
             if current_time - last_insert_time >= 3:
                 try:
+                    conn = sync_connection()
                     # Delete previous pending records
-                    c.execute("DELETE FROM users WHERE username = ? AND initial_mood = 'Pending'", (username,))
+                    conn.execute("DELETE FROM users WHERE username = ? AND initial_mood = 'Pending'", (username,))
                     conn.commit()
 
                     # Insert a new record with "Pending" mood
-                    c.execute("""
+                    conn.execute("""
                         INSERT INTO users (username, login_timestamp, initial_mood, session_id)
                         VALUES (?, ?, ?, ?)
                     """, (username, login_timestamp, 'Pending', session_id))
                     conn.commit()
+                    touch_session_marker()  # aiohttp workers drop their cached session ID
                     last_insert_time = current_time
                     print(f"✅ User {username} logged in at {login_timestamp} with Pending mood.")
                 except sqlite3.Error as e:
                     print(f"❌ Database Error: {e}")
 
-            # Capture face after inserting pending mood
-            capture_face(username)
+            # Capture and analyse the face in the background; this browser can poll /login/status/<job_id>
+            job = capture_worker.submit(username, session_id, login_timestamp)
+            session['login_job'] = job.job_id
 
-            return redirect("http://localhost:3000")  # Redirect to Next.js app
+            # Signed token: the frontend sends it with every upload so aiohttp knows the caller without a DB query.
+            # Kept in the (signed, HttpOnly) Flask session and handed out by /session_token, never put in a URL.
+            session['session_token'] = issue_token(session_id, username)
+            return redirect(f"{FRONTEND_ORIGIN}?login_job={job.job_id}")  # Redirect to Next.js app
         else:
             return "Invalid username. Please try again."
     
     return render_template('login.html')
 
 
-# Function to encode an image into base64
-def encode_image(image_path: str):
-    with open(image_path, 'rb') as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-
-# Function to process face with Hume AI
-async def process_face(image_path: str, username: str):
-    client = AsyncHumeClient(api_key=get_hume_api_key())
-    model_config = Config(face=StreamFace())
-    stream_options = StreamConnectOptions(config=model_config)
-
-    async with client.expression_measurement.stream.connect(options=stream_options) as socket:
-        encoded_image = encode_image(image_path)
-        result = await socket.send_file(encoded_image)
-
-        face_predictions = result.face.predictions if result.face else None
-        if face_predictions:
-            emotions_sorted = sorted(face_predictions[0].emotions, key=lambda e: e.score, reverse=True)
-            top_5_emotions = [(e.name, e.score) for e in emotions_sorted[:5]]
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            # Store mood in DataFrame
-            global mood_df
-            top_5_emotions_str = ', '.join([f"{name}: {score:.2f}" for name, score in top_5_emotions])
-            new_row = pd.DataFrame([{'Username': username, 'Initial Mood': top_5_emotions_str, 'Timestamp': timestamp}])
-            mood_df = pd.concat([mood_df, new_row], ignore_index=True)
-            print(f"✅ Emotions for {username}: {top_5_emotions_str}")
-
-        else:
-            print("❌ No face detected. Retrying...")
-
-        # Update database with mood
-        save_face_analysis_to_db(username, top_5_emotions_str)
-        return mood_df
-
-
-# Capture face using OpenCV
-def capture_face(username):
-    cap = cv2.VideoCapture(0)
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-
-    start_time = time.time()
-    timeout = 20  # Timeout in seconds
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("❌ Failed to capture frame.")
-            break
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5)
-
-        if len(faces) > 0:
-
-            # Ensure directory exists
-            os.makedirs("uploaded_images", exist_ok=True)
-
-            filename = "uploaded_images/captured_face.png"
-            cv2.imwrite(filename, frame)
-
-            # Verify file is actually saved
-            if not os.path.exists(filename):
-                print(f"❌ Error: Failed to save image at {filename}")
-            else:
-                print(f"✅ Face image successfully saved at {filename}")
-
-            print(f"✅ Face image saved: {filename}")
-
-            loop = asyncio.get_event_loop()
-            mood_df = loop.run_until_complete(process_face(filename, username))
-
-            if len(mood_df) > 0:
-                break
-        else:
-            print("🔄 No face detected. Retrying...")
-
-        if time.time() - start_time > timeout:
-            print("❌ Timeout: No face detected.")
-            break
-
-    cap.release()
-    cv2.destroyAllWindows()
-
-
-# Save mood analysis to database
-def save_face_analysis_to_db(username, initial_mood):
-    login_timestamp = session.get('login_timestamp')
-    session_id = session.get('session_id')
-
-    try:
-        c.execute("UPDATE users SET initial_mood = ? WHERE username = ? AND login_timestamp = ? AND session_id = ?",
-                  (initial_mood, username, login_timestamp, session_id))
-        conn.commit()
-        print(f"✅ Mood updated for {username}: {initial_mood}")
-
-        # Remove captured face image
-        file_path = 'uploaded_images/captured_face.png'
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"🗑 Deleted captured face image: {file_path}")
-
-    except sqlite3.Error as e:
-        print(f"❌ Error updating database: {e}")
+def frontend_only(response):
+    """Credentialed responses are readable by the Next.js app only, and never cached."""
+    response.headers['Access-Control-Allow-Origin'] = FRONTEND_ORIGIN
+    response.headers['Access-Control-Allow-Credentials'] = 'true'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/session_token', methods=['POST'])
+def session_token():
+    """The logged-in browser's session token, in the response body (credentialed fetch from FRONTEND_ORIGIN)."""
+    token = session.get('session_token')
+    if token:
+        response = jsonify({"token": token})
+    else:
+        response = jsonify({"error": "Not logged in"})
+        response.status_code = 401
+    return frontend_only(response)
+
+
+@app.route('/login/status/<job_id>')
+def login_status(job_id):
+    """Poll the login face capture job; only the browser that logged in (its Flask session) may read it."""
+    if job_id != session.get('login_job'):
+        return frontend_only(jsonify({"error": "Unknown login job"})), 404
+    job = capture_worker.get(job_id)
+    if job is not None:
+        payload = job.to_dict()
+    else:
+        # Job ran in another worker process (or was evicted): report from the users table.
+        row = sync_connection().execute(
+            "SELECT username, initial_mood FROM users WHERE session_id = ? ORDER BY login_timestamp DESC LIMIT 1",
+            (session.get('session_id'),),
+        ).fetchone()
+        if row is None:
+            return frontend_only(jsonify({"error": "Unknown login job"})), 404
+        done = row[1] != 'Pending'
+        payload = {"job_id": job_id, "username": row[0], "status": "done" if done else "pending",
+                   "initial_mood": row[1] if done else None}
+    return frontend_only(jsonify(payload))
 
 
 if __name__ == '__main__':
+    init_login()
     app.run(host='0.0.0.0', port=7000, debug=True)
@@ -0,0 +1,192 @@
+import asyncio
+import base64
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from config import (
+    FACE_CROP_MARGIN,
+    FACE_DETECT_MAX_WIDTH,
+    LOGIN_CAPTURE_TIMEOUT_S,
+    LOGIN_FRAME_SOURCE,
+    LOGIN_JOB_HISTORY,
+    MOOD_HISTORY_SIZE,
+)
+from database import sync_connection
+from emotion_store import INSERT_SAMPLE_SQL, sample_row
+from face_tracking import FaceTrack, find_face
+from frame_sources import open_frame_source
+from hume_face_analysis import analyze_face_bytes
+from lazy_imports import lazy_import
+from logger import logger
+
+cv2 = lazy_import("cv2")
+
+# Recent login moods for this process: {'Username', 'Initial Mood', 'Timestamp'}; oldest dropped first.
+mood_history = deque(maxlen=MOOD_HISTORY_SIZE)
+
+
+class LoginCaptureJob:
+    """One login's face capture + analysis. job_id is random: the session ID is guessable (epoch seconds)."""
+
+    def __init__(self, username, session_id, login_timestamp):
+        self.job_id = secrets.token_urlsafe(16)
+        self.username = username
+        self.session_id = session_id
+        self.login_timestamp = login_timestamp
+        self.status = "queued"  # queued -> capturing -> analyzing -> done | no_face | failed
+        self.initial_mood = None
+        self.error = None
+        self.frames_read = 0
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "username": self.username,
+            "status": self.status,
+            "initial_mood": self.initial_mood,
+            "error": self.error,
+            "frames_read": self.frames_read,
+            "elapsed_s": round((self.finished or time.time()) - self.created, 2),
+        }
+
+
+def find_face_crop(face_cascade, frame, track=None):
+    """
+    Largest face in a BGR frame (detected on a downscaled grayscale copy), JPEG-encoded with margin; None if none.
+    With a FaceTrack, only the area around the previous frame's face is searched while the track allows it.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    scale = 1.0
+    if gray.shape[1] > FACE_DETECT_MAX_WIDTH:
+        scale = FACE_DETECT_MAX_WIDTH / gray.shape[1]
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    roi_box = track.roi() if track is not None else None
+    roi = tuple(v * scale for v in roi_box) if roi_box is not None else None
+    face, used_roi = find_face(face_cascade, gray, roi, scale_factor=1.1, min_neighbors=5)
+    box = tuple(int(v / scale) for v in face) if face is not None else None
+    if track is not None:
+        track.update(box, used_roi)
+    if box is None:
+        return None
+
+    x, y, w, h = box
+    mx, my = int(w * FACE_CROP_MARGIN), int(h * FACE_CROP_MARGIN)
+    crop = frame[max(0, y - my):y + h + my, max(0, x - mx):x + w + mx]
+    ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes() if ok else None
+
+
+def save_face_analysis_to_db(job, initial_mood, face_emotions):
+    """Replace the login's 'Pending' mood and store the full score vector as a 'login' emotion sample."""
+    try:
+        conn = sync_connection()
+        conn.execute("UPDATE users SET initial_mood = ? WHERE username = ? AND login_timestamp = ? AND session_id = ?",
+                     (initial_mood, job.username, job.login_timestamp, job.session_id))
+        conn.execute(INSERT_SAMPLE_SQL, sample_row(job.session_id, 'login', face_emotions))
+        conn.commit()
+        logger.info(f"✅ Mood updated for {job.username}: {initial_mood}")
+    except sqlite3.Error as e:
+        logger.error(f"❌ Error updating database: {e}")
+
+
+class LoginCaptureWorker:
+    """
+    Runs login face capture and Hume analysis off the Flask request path.
+    One daemon thread per process with its own event loop, so the shared Hume socket
+    stays open between logins; jobs run one at a time because they share the camera.
+    """
+
+    def __init__(self, source_spec=LOGIN_FRAME_SOURCE, timeout=LOGIN_CAPTURE_TIMEOUT_S):
+        self.source_spec = source_spec
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # job_id -> LoginCaptureJob, at most LOGIN_JOB_HISTORY
+        self._lock = threading.Lock()
+        self._thread = None
+        self._face_cascade = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="login-capture", daemon=True)
+                self._thread.start()
+                logger.info(f"Login capture worker started (frame source: {self.source_spec}).")
+
+    def submit(self, username, session_id, login_timestamp):
+        """Queue a capture for this login and return the job immediately."""
+        self.start()
+        job = LoginCaptureJob(username, session_id, login_timestamp)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > LOGIN_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        while True:
+            job = self._queue.get()
+            try:
+                loop.run_until_complete(self._process(job))
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+                logger.error(f"❌ Login capture for {job.username} failed: {e}")
+            finally:
+                job.finished = time.time()
+
+    async def _process(self, job):
+        """
+        1) Read frames until one has a face (or the timeout passes).
+        2) Send the face crop to Hume; if it finds no emotions, keep capturing.
+        3) Record the top 5 emotions as the login's initial mood.
+        """
+        job.status = "capturing"
+        deadline = time.time() + self.timeout
+        frames = open_frame_source(self.source_spec)
+        track = FaceTrack()
+        try:
+            for frame in frames:
+                job.frames_read += 1
+                crop = find_face_crop(self._face_cascade, frame, track)
+                if crop is not None:
+                    job.status = "analyzing"
+                    face_emotions = await analyze_face_bytes(base64.b64encode(crop).decode("utf-8"))
+                    if face_emotions:
+                        self._record_mood(job, face_emotions)
+                        return
+                    job.status = "capturing"
+                if time.time() > deadline:
+                    break
+        finally:
+            frames.close()
+
+        job.status = "no_face"
+        logger.warning(f"❌ No face analysed for {job.username} after {job.frames_read} frames.")
+
+    def _record_mood(self, job, face_emotions):
+        top_5_emotions = list(face_emotions.items())[:5]
+        job.initial_mood = ', '.join(f"{name}: {score:.2f}" for name, score in top_5_emotions)
+        mood_history.append({
+            'Username': job.username,
+            'Initial Mood': job.initial_mood,
+            'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        save_face_analysis_to_db(job, job.initial_mood, face_emotions)
+        job.status = "done"
+
+
+capture_worker = LoginCaptureWorker()
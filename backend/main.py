@@ -1,27 +1,43 @@
-import os
+import time
+_import_started = time.perf_counter()
+
 import asyncio
 import logging
 from aiohttp import web
 import aiohttp_cors
 
-from config import UPLOAD_DIR, PROCESSED_DIR, IMAGE_DIR
-from database import initialize_db
+from config import LOOP_LAG_MONITOR, WORKER_WARMUP
+from database import db, initialize_db
+from write_behind import writer
 from audio_handling import handle_audio_upload
-from image_handling import handle_image_upload
+from image_handling import handle_capture_policy, handle_image_upload
+from face_detection import face_detector
+from hume_face_analysis import face_stream
+from export import handle_export_conversations, handle_export_face_analysis
+from session_tokens import SESSION_EXEMPT_PREFIXES, session_middleware
+from replay import install_recording_hooks, recorder, recorder_middleware
+from openai_configs import close_http_session, fallback_replies
+from startup import first_request_middleware, prepare_worker, report_ready, warm_up
+from diagnostics import handle_loop_lag, handle_profile, loop_monitor
+from upstream import handle_upstream_stats
 
-# main.py
-import aiosqlite
-from aiohttp import web
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
-DB_FILE = "/Users/Parzon/Downloads/Artificial_Consciousness/InteractiveAvatarNextJSDemo-main/HeyGenPersonalised/users.db"
+# main.py
 
 async def get_latest_ai_response(request):
     """
-    Returns the most recent AI response as JSON.
+    Returns the caller's most recent AI response as JSON (or the fallback reply of a turn GPT could not answer).
+    Waits for queued conversation writes to commit first, so a fresh reply is never missed.
     """
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.execute(
-            "SELECT ai_response FROM conversation ORDER BY id DESC LIMIT 1"
+    fallback = fallback_replies.get(request["session_id"])
+    if fallback:
+        return web.json_response({"ai_response": fallback})
+    await writer.sync()
+    async with db.connection() as db_conn:
+        async with db_conn.execute(
+            "SELECT ai_response FROM conversation WHERE session_id = ? ORDER BY id DESC LIMIT 1",
+            (request["session_id"],),
         ) as cursor:
             row = await cursor.fetchone()
             if row:
@@ -29,16 +45,36 @@ async def get_latest_ai_response(request):
             else:
                 return web.json_response({"ai_response": ""})  # Ensure key always exists
 
-# Ensure directories exist
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(PROCESSED_DIR, exist_ok=True)
-os.makedirs(IMAGE_DIR, exist_ok=True)
-
 # -------------------- Server Setup --------------------
 
+async def stop_face_detector(app):
+    await face_stream.close()
+    face_detector.shutdown()
+
+async def close_db(app):
+    await writer.close()
+    await db.close()
+    recorder.close()
+
 async def init_app():
+    started = time.perf_counter()
+    prepare_worker()
+    await db.open()
     await initialize_db()
-    app = web.Application()
+    writer.start()
+    face_detector.start()
+    if recorder.enabled:
+        install_recording_hooks()
+    startup_seconds = time.perf_counter() - started
+    report_ready(IMPORT_SECONDS, startup_seconds, await warm_up() if WORKER_WARMUP else {})
+
+    app = web.Application(middlewares=[first_request_middleware, session_middleware, recorder_middleware])
+    if LOOP_LAG_MONITOR:
+        loop_monitor.start()
+        app.on_cleanup.append(loop_monitor.stop)
+    app.on_cleanup.append(stop_face_detector)
+    app.on_cleanup.append(close_http_session)
+    app.on_cleanup.append(close_db)
 
     # CORS
     cors = aiohttp_cors.setup(app, defaults={
@@ -52,12 +88,19 @@ async def init_app():
 
     app.router.add_post("/upload_audio", handle_audio_upload)
     app.router.add_post("/upload_image", handle_image_upload)
+    app.router.add_get("/capture_policy", handle_capture_policy)
     # Inside init_app() or wherever you define your routes:
     app.router.add_get("/latest_ai_response", get_latest_ai_response)
+    app.router.add_get("/export/conversations", handle_export_conversations)
+    app.router.add_get("/export/face_analysis", handle_export_face_analysis)
+    app.router.add_get("/debug/profile", handle_profile)
+    app.router.add_get("/debug/loop_lag", handle_loop_lag)
+    app.router.add_get("/debug/upstreams", handle_upstream_stats)
 
-    # Enable CORS for all routes
+    # Enable CORS for the browser-facing routes; admin routes are for operators, not other origins
     for route in list(app.router.routes()):
-        cors.add(route)
+        if not route.resource.canonical.startswith(SESSION_EXEMPT_PREFIXES):
+            cors.add(route)
 
     return app
 
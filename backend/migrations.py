@@ -0,0 +1,199 @@
+from typing import Callable, NamedTuple
+
+from logger import logger
+
+
+class DataMigration(NamedTuple):
+    """
+    A migration step that needs Python: rows of `select_sql` go through `transform` and are
+    inserted with `insert_sql`, in the same transaction as the rest of the migration.
+    Skipped when `table` has no `column` (databases created after that column was dropped).
+    """
+    table: str
+    column: str
+    select_sql: str
+    transform: Callable
+    insert_sql: str
+
+
+def _legacy_emotion_samples(source):
+    def transform(rows):
+        from emotion_store import legacy_sample_rows  # emotion_store -> write_behind -> database -> migrations
+        return legacy_sample_rows(rows, source)
+    return transform
+
+
+_INSERT_LEGACY_SAMPLE_SQL = "INSERT INTO emotion_samples (session_id, timestamp, source, scores) VALUES (?, ?, ?, ?)"
+
+# Shared by the Flask login app and initialize_db so both create the same table.
+USERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        login_timestamp TEXT,
+        initial_mood TEXT,
+        session_id TEXT,
+        UNIQUE(username, login_timestamp, session_id)
+    )
+'''
+
+# Base tables, created by initialize_db and again (IF NOT EXISTS) by migration 1, whose indexes need them:
+# sync runners (conversation_search.py rebuild, CLI tools) migrate databases initialize_db never saw.
+CONVERSATION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS conversation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        session_id TEXT,
+        transcription TEXT,
+        ai_response TEXT,
+        chunk_range TEXT
+    )
+'''
+
+FACE_ANALYSIS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS face_analysis (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        session_id TEXT,
+        face_file_name TEXT,
+        face_emotions TEXT
+    )
+'''
+
+# One row per speech turn
+PROSODY_ANALYSIS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS prosody_analysis (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        session_id TEXT,
+        chunk_range TEXT,
+        complete INTEGER
+    )
+'''
+
+# Emotion time series: one float32 vector (emotion_store.EMOTION_NAMES order) per reading.
+EMOTION_SAMPLES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS emotion_samples (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        timestamp REAL,
+        source TEXT,
+        scores BLOB
+    )
+'''
+
+# Ordered schema migrations. Entry i brings the database to PRAGMA user_version i + 1.
+# Only ever append; never edit a migration that has shipped.
+MIGRATIONS = [
+    # 1: indexes for the access patterns the handlers actually use
+    [
+        USERS_TABLE_SQL,
+        CONVERSATION_TABLE_SQL,
+        FACE_ANALYSIS_TABLE_SQL,
+        PROSODY_ANALYSIS_TABLE_SQL,
+        "CREATE INDEX IF NOT EXISTS idx_users_login_timestamp ON users (login_timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_users_session_id ON users (session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_conversation_session_id ON conversation (session_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_face_analysis_session_id ON face_analysis (session_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_prosody_analysis_session_id ON prosody_analysis (session_id, id)",
+    ],
+    # 2: full-text index over transcripts and AI responses, kept in sync by triggers
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)",
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversation_fts USING fts5(
+            transcription, ai_response,
+            content='conversation', content_rowid='id',
+            tokenize='porter unicode61'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS conversation_fts_insert AFTER INSERT ON conversation BEGIN
+            INSERT INTO conversation_fts (rowid, transcription, ai_response)
+            VALUES (new.id, new.transcription, new.ai_response);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS conversation_fts_delete AFTER DELETE ON conversation BEGIN
+            INSERT INTO conversation_fts (conversation_fts, rowid, transcription, ai_response)
+            VALUES ('delete', old.id, old.transcription, old.ai_response);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS conversation_fts_update AFTER UPDATE ON conversation BEGIN
+            INSERT INTO conversation_fts (conversation_fts, rowid, transcription, ai_response)
+            VALUES ('delete', old.id, old.transcription, old.ai_response);
+            INSERT INTO conversation_fts (rowid, transcription, ai_response)
+            VALUES (new.id, new.transcription, new.ai_response);
+        END
+        ''',
+        # Index the rows that existed before the triggers
+        "INSERT INTO conversation_fts (conversation_fts) VALUES ('rebuild')",
+    ],
+    # 3: per-file progress of reprocess.py, so an interrupted batch resumes where it stopped
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS reprocess_checkpoint (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            kind TEXT,
+            status TEXT,
+            error TEXT,
+            finished_at REAL
+        )
+        ''',
+    ],
+    # 4: string-encoded emotions written before emotion_samples existed, copied into emotion_samples
+    #    so warm starts and emotion windows see older sessions too
+    [
+        EMOTION_SAMPLES_TABLE_SQL,
+        DataMigration(
+            "face_analysis", "face_emotions",
+            "SELECT session_id, timestamp, face_emotions FROM face_analysis WHERE face_emotions IS NOT NULL",
+            _legacy_emotion_samples("face"), _INSERT_LEGACY_SAMPLE_SQL,
+        ),
+        DataMigration(
+            "prosody_analysis", "voice_emotions",
+            "SELECT session_id, timestamp, voice_emotions FROM prosody_analysis WHERE voice_emotions IS NOT NULL",
+            _legacy_emotion_samples("prosody"), _INSERT_LEGACY_SAMPLE_SQL,
+        ),
+    ],
+]
+
+
+def apply_migrations_sync(conn):
+    """Apply pending migrations on a plain sqlite3 connection (login app, benchmarks, CLI tools)."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for i, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for sql in statements:
+            if not isinstance(sql, DataMigration):
+                conn.execute(sql)
+                continue
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({sql.table})").fetchall()]
+            if sql.column in columns:
+                rows = sql.transform(conn.execute(sql.select_sql).fetchall())
+                conn.executemany(sql.insert_sql, rows)
+                logger.info(f"Migration {i}: copied {len(rows)} rows from {sql.table}.{sql.column}.")
+        conn.execute(f"PRAGMA user_version = {i}")
+        conn.commit()
+        logger.info(f"Applied schema migration {i}.")
+
+
+async def apply_migrations(db_conn):
+    """Apply pending migrations on an aiosqlite connection."""
+    async with db_conn.execute("PRAGMA user_version") as cursor:
+        version = (await cursor.fetchone())[0]
+    for i, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for sql in statements:
+            if not isinstance(sql, DataMigration):
+                await db_conn.execute(sql)
+                continue
+            columns = [row[1] for row in await db_conn.execute_fetchall(f"PRAGMA table_info({sql.table})")]
+            if sql.column in columns:
+                rows = sql.transform(await db_conn.execute_fetchall(sql.select_sql))
+                await db_conn.executemany(sql.insert_sql, rows)
+                logger.info(f"Migration {i}: copied {len(rows)} rows from {sql.table}.{sql.column}.")
+        await db_conn.execute(f"PRAGMA user_version = {i}")
+        await db_conn.commit()
+        logger.info(f"Applied schema migration {i}.")
@@ -1,86 +1,152 @@
 import os
 import aiofiles
-import aiosqlite
 import aiohttp
 import datetime
 from logger import logger
-from openai import OpenAI
+from lazy_imports import lazy_from
 from env_keys import get_openai_api_key, get_hume_api_key
-from config import DB_FILE
+from database import db
+from write_behind import writer
+from conversation_memory import load_memory, render_memory, remember_turn
 from session_helpers import retrieve_face_emotions
+from emotion_state import describe_emotion_state
+from config import UPSTREAM_FALLBACK_REPLY
+from upstream import UpstreamError, UpstreamUnavailable, llm_upstream, whisper_upstream
 
-OPENAI_API_KEY = get_openai_api_key()
-HUME_API_KEY = get_hume_api_key()
+AsyncOpenAI = lazy_from("openai", "AsyncOpenAI")
 
-async def transcribe_audio(audio_file_path):
-    """Use OpenAI Whisper to transcribe. Return text or ''."""
+# Resolved by load_api_keys() at worker startup, not at import.
+OPENAI_API_KEY = None
+HUME_API_KEY = None
+_openai_client = None  # one client (and connection pool) per worker
+_http_session = None   # shared keep-alive session for Whisper uploads
+
+# session_id -> canned reply shown by /latest_ai_response until the session's next real turn.
+# Never saved as a turn, so it is not fed back to GPT as part of the conversation.
+fallback_replies = {}
+
+
+def show_fallback_reply(session_id):
+    """GPT gave no reply: show the canned one instead of silence, without storing a turn."""
+    fallback_replies[session_id] = UPSTREAM_FALLBACK_REPLY
+    logger.warning(f"No AI reply for session {session_id}; showing the fallback reply.")
+
+
+def load_api_keys():
+    global OPENAI_API_KEY, HUME_API_KEY, _openai_client
+    OPENAI_API_KEY = get_openai_api_key()
+    HUME_API_KEY = get_hume_api_key()
+    _openai_client = None
+
+
+def get_openai_client():
+    global _openai_client
+    if OPENAI_API_KEY is None:
+        load_api_keys()
+    if _openai_client is None:
+        # Retries and timeouts are upstream.py's job (hedging, circuit breaker).
+        _openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _openai_client
+
+
+def get_http_session():
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession()
+    return _http_session
+
+
+async def close_http_session(app=None):
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+
+async def whisper_transcribe(audio_file_path):
+    """One Whisper request. Raises on any failure (upstream.py decides about retries)."""
+    if OPENAI_API_KEY is None:
+        load_api_keys()
+    url = 'https://api.openai.com/v1/audio/transcriptions'
+    headers = {'Authorization': f'Bearer {OPENAI_API_KEY}'}
+    form_data = aiohttp.FormData()
+    async with aiofiles.open(audio_file_path, 'rb') as f:
+        audio_data = await f.read()
+        form_data.add_field('file', audio_data, filename=os.path.basename(audio_file_path), content_type='audio/wav')
+    form_data.add_field('model', 'whisper-1')
+    form_data.add_field('response_format', 'text')
+
+    async with get_http_session().post(url, headers=headers, data=form_data) as resp:
+        if resp.status != 200:
+            raise UpstreamError(f"Transcription failed {resp.status}: {await resp.text()}")
+        return (await resp.text()).strip()
+
+
+async def chat_completion(prompt):
+    """One GPT request. Raises on any failure."""
+    completion = await get_openai_client().chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=150,
+    )
+    return (completion.choices[0].message.content or "").strip()
+
+
+async def transcribe_audio(audio_file_path, deadline=None):
+    """Use OpenAI Whisper to transcribe, within `deadline` (event loop time). Return text or ''."""
     if not audio_file_path or not os.path.exists(audio_file_path):
         return ""
 
     try:
-        url = 'https://api.openai.com/v1/audio/transcriptions'
-        headers = {'Authorization': f'Bearer {OPENAI_API_KEY}'}
-        form_data = aiohttp.FormData()
-        async with aiofiles.open(audio_file_path, 'rb') as f:
-            audio_data = await f.read()
-            form_data.add_field('file', audio_data, filename=os.path.basename(audio_file_path), content_type='audio/wav')
-        form_data.add_field('model', 'whisper-1')
-        form_data.add_field('response_format', 'text')
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=form_data) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    logger.info(f"Transcription success: {audio_file_path} => {text.strip()}")
-                    return text.strip()
-                else:
-                    err = await resp.text()
-                    logger.error(f"Transcription failed {resp.status}: {err}")
-                    return ""
-    except Exception as e:
-        logger.error(f"Error transcribing {audio_file_path}: {e}")
+        text = await whisper_upstream.call(whisper_transcribe, audio_file_path, deadline=deadline)
+    except UpstreamUnavailable as e:
+        whisper_upstream.fallback(e)
         return ""
+    logger.info(f"Transcription success: {audio_file_path} => {text}")
+    return text
 
-async def generate_openai_response(prompt):
-    """Basic GPT call."""
+async def generate_openai_response(prompt, deadline=None):
+    """Basic GPT call, within `deadline` (event loop time). Return text or ''."""
     try:
-        client = OpenAI()
-        client.api_key = OPENAI_API_KEY
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150,
-        )
-        response_text = completion.choices[0].message.content
-        logger.info("OpenAI response generated.")
-        return response_text.strip()
-    except Exception as e:
-        logger.error(f"OpenAI error: {e}")
+        response_text = await llm_upstream.call(chat_completion, prompt, deadline=deadline)
+    except UpstreamUnavailable as e:
+        llm_upstream.fallback(e)
         return ""
+    logger.info("OpenAI response generated.")
+    return response_text
 
 
 async def handle_conversation_starter(session_id):
     """
     If we detect 2 consecutive silent chunks, create a conversation starter based on face emotions.
     """
-    async with aiosqlite.connect(DB_FILE) as db_conn:
-        face_emotions = await retrieve_face_emotions(db_conn)
-        prompt = f"User has been silent for a while. Face emotions: {face_emotions}. Start a friendly conversation."
-        ai_reply = await generate_openai_response(prompt)
-        await save_conversation_data(db_conn, session_id, "Conversation Starter", ai_reply)
-        logger.info(f"Conversation starter generated: {ai_reply}")
-
+    face_emotions = describe_emotion_state(session_id, "face")
+    if not face_emotions:
+        async with db.connection() as db_conn:
+            face_emotions = await retrieve_face_emotions(db_conn, session_id)
+    await load_memory(session_id)
+    prompt = (
+        f"{render_memory(session_id)}\n"
+        f"User has been silent for a while. Face emotions: {face_emotions}. Start a friendly conversation."
+    )
+    ai_reply = await generate_openai_response(prompt)
+    if not ai_reply:
+        show_fallback_reply(session_id)
+        return
+    save_conversation_data(session_id, "Conversation Starter", ai_reply)
+    logger.info(f"Conversation starter generated: {ai_reply}")
 
-async def save_conversation_data(db_conn, session_id, transcription, ai_response, chunk_range):
 
+def save_conversation_data(session_id, transcription, ai_response, chunk_range=None):
+    """Queue a conversation row on the write-behind writer; returns its commit future."""
+    fallback_replies.pop(session_id, None)
     ts = datetime.datetime.now().isoformat()
-    await db_conn.execute('''
+    fut = writer.submit('''
         INSERT INTO conversation (timestamp, session_id, transcription, ai_response, chunk_range)
         VALUES (?, ?, ?, ?, ?)
     ''', (ts, session_id, transcription, ai_response, str(chunk_range)))
-    await db_conn.commit()
-    logger.info("Conversation data saved to DB.")
+    remember_turn(session_id, transcription, ai_response)
+    logger.info("Conversation data queued for DB.")
+    return fut
 
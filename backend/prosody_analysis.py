@@ -0,0 +1,121 @@
+import asyncio
+import datetime
+
+from env_keys import get_hume_api_key
+from emotion_store import save_emotion_sample
+from write_behind import writer
+from config import PROSODY_GRACE_S
+from lazy_imports import lazy_from
+from logger import logger
+
+AsyncHumeClient = lazy_from("hume", "AsyncHumeClient")
+Config = lazy_from("hume.expression_measurement.stream", "Config")
+StreamConnectOptions = lazy_from("hume.expression_measurement.stream.socket_client", "StreamConnectOptions")
+
+
+class ProsodyTurn:
+    """
+    Voice emotion scores for one speech turn.
+    Chunks are folded in as Hume answers them, so whatever arrived before
+    the deadline is still usable when the turn is cut short.
+    """
+
+    def __init__(self, total_chunks):
+        self.total_chunks = total_chunks
+        self.analyzed_chunks = 0
+        self._sums = {}
+        self._count = 0
+
+    @property
+    def complete(self):
+        return self.analyzed_chunks >= self.total_chunks
+
+    def add_predictions(self, predictions):
+        for prediction in predictions or []:
+            for e in prediction.emotions or []:
+                self._sums[e.name] = self._sums.get(e.name, 0.0) + e.score
+            self._count += 1
+
+    def scores(self):
+        """Mean score per emotion over every prediction received so far."""
+        if not self._count:
+            return {}
+        return {name: total / self._count for name, total in self._sums.items()}
+
+    def summary(self, top_n=5):
+        scores = self.scores()
+        if not scores:
+            return "Unavailable"
+        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+        text = ", ".join(f"{name}: {score:.2f}" for name, score in top)
+        if not self.complete:
+            text += f" (partial, {self.analyzed_chunks}/{self.total_chunks} chunks)"
+        return text
+
+
+async def _stream_chunks(chunk_files, turn):
+    """
+    Sends each 5s speech chunk over one Hume prosody socket.
+    Hume's streaming API caps audio at 5s per message, which is exactly our chunk size.
+    """
+    client = AsyncHumeClient(api_key=get_hume_api_key())
+    stream_options = StreamConnectOptions(config=Config(prosody={}))
+
+    try:
+        async with client.expression_measurement.stream.connect(options=stream_options) as socket:
+            for chunk_path in chunk_files:
+                result = await socket.send_file(chunk_path)
+                if result and result.prosody and result.prosody.predictions:
+                    turn.add_predictions(result.prosody.predictions)
+                turn.analyzed_chunks += 1
+    except Exception as e:
+        logger.error(f"❌ Error analyzing prosody with Hume: {e}")
+
+
+async def analyze_prosody_chunks(chunk_files, deadline, until=None):
+    """
+    1) Streams the turn's speech chunks to Hume prosody in the background.
+    2) Stops at the shared turn `deadline` (event loop time), or PROSODY_GRACE_S
+       after the `until` task (transcription) finishes, whichever comes first.
+    3) Returns a ProsodyTurn, partial if it was cut short.
+    """
+    loop = asyncio.get_running_loop()
+    turn = ProsodyTurn(len(chunk_files))
+    if not chunk_files:
+        return turn
+
+    work = asyncio.ensure_future(_stream_chunks(chunk_files, turn))
+    until_done_at = None
+
+    while not work.done():
+        if until is not None and until.done() and until_done_at is None:
+            until_done_at = loop.time()
+
+        cutoff = deadline
+        if until_done_at is not None:
+            cutoff = min(cutoff, until_done_at + PROSODY_GRACE_S)
+        remaining = cutoff - loop.time()
+        if remaining <= 0:
+            break
+
+        waiters = {work} if until is None or until.done() else {work, until}
+        await asyncio.wait(waiters, timeout=remaining)
+
+    if not work.done():
+        work.cancel()
+        logger.warning(
+            f"Prosody missed its deadline after {turn.analyzed_chunks}/{turn.total_chunks} chunks. "
+            "Using partial result."
+        )
+    return turn
+
+
+def save_prosody_analysis(session_id, chunk_range, turn, ts=None):
+    """Queue one turn's voice emotions (vector in emotion_samples) next to its conversation row."""
+    when = datetime.datetime.fromtimestamp(ts) if ts is not None else datetime.datetime.now()
+    writer.submit('''
+        INSERT INTO prosody_analysis (timestamp, session_id, chunk_range, complete)
+        VALUES (?, ?, ?, ?)
+    ''', (when.isoformat(), session_id, str(chunk_range), int(turn.complete)))
+    save_emotion_sample(session_id, "prosody", turn.scores(), ts)
+    logger.info(f"Prosody analysis queued: {turn.summary()}")
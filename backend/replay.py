@@ -0,0 +1,253 @@
+"""
+Record-and-replay of real session traffic (see benchmarks/replay_traffic.py for the replayer).
+
+Recording is opt-in: with REPLAY_RECORD_DIR set, every session request is logged to a bundle:
+
+    <REPLAY_RECORD_DIR>/events-<pid>.ndjson   one JSON event per line (requests and upstream results)
+    <REPLAY_RECORD_DIR>/blobs/<sha256>        upload payloads, content-addressed (a repeated frame is stored once)
+
+Upstream results are keyed so a replay can serve them from the recording instead of calling the APIs:
+Whisper, Hume prosody and face by a hash of their input; GPT by (session, purpose, n-th call of that purpose),
+because its prompt carries time-varying text (mood age, memory, recall) that never hashes the same twice.
+File hashing and blob writes run in a thread, off the event loop.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import time
+import zipfile
+from collections import defaultdict
+
+from aiohttp import web
+
+from config import REPLAY_RECORD_DIR
+from logger import logger
+
+# Paths that are not session traffic and are never recorded.
+REPLAY_SKIP_PREFIXES = ("/export", "/debug")
+
+# Session of the request being handled; copied into the tasks it spawns (audio processing).
+recording_session = contextvars.ContextVar("recording_session", default=None)
+
+# What a GPT call is for. Background calls set their own, so their timing never shifts the reply numbering.
+llm_purpose = contextvars.ContextVar("llm_purpose", default="reply")
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_sha256(path):
+    with open(path, "rb") as f:
+        return sha256(f.read())
+
+
+def files_key(paths):
+    """Key of several files (a turn's prosody chunks): hash of their concatenated digests. Blocking."""
+    return sha256(b"".join(bytes.fromhex(_file_sha256(p)) for p in paths))
+
+
+async def file_key(path):
+    return await asyncio.to_thread(_file_sha256, path)
+
+
+_llm_calls = defaultdict(int)  # (session, purpose) -> GPT calls made for it in this process
+
+
+def next_llm_key():
+    """'<session>:<purpose>#<n>' for the n-th GPT call of that purpose: the same on record and replay, unlike its prompt."""
+    counter = (recording_session.get(), llm_purpose.get())
+    n = _llm_calls[counter]
+    _llm_calls[counter] += 1
+    return f"{counter[0]}:{counter[1]}#{n}"
+
+
+class ReplayRecorder:
+    """Appends events and blobs to a bundle directory. Disabled (every call a no-op) without a directory."""
+
+    def __init__(self, directory=REPLAY_RECORD_DIR):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self._events = None
+
+    def open(self):
+        """Create the bundle directory and events file (on the event loop, before any blob is written)."""
+        if self._events is not None:
+            return
+        os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+        self._events = open(os.path.join(self.directory, f"events-{os.getpid()}.ndjson"), "a", buffering=1)
+        logger.info(f"Recording session traffic to {self.directory}.")
+
+    def store_blob(self, data):
+        """Content-addressed write of one payload; blocking, called through asyncio.to_thread."""
+        digest = sha256(data)
+        path = os.path.join(self.directory, "blobs", digest)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        return digest
+
+    def write_event(self, event):
+        self.open()
+        event["t"] = round(time.time(), 4)  # wall clock: events from several workers are merged on replay
+        event.setdefault("session", recording_session.get())
+        self._events.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def close(self):
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+
+
+recorder = ReplayRecorder()
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def note_upload(request, filename, content_type, data=None, path=None):
+    """Called by the upload handlers: attach the payload (bytes or saved file) to the request's replay event."""
+    if not recorder.enabled:
+        return
+    recorder.open()
+    if data is None:
+        data = await asyncio.to_thread(_read_file, path)
+    digest = await asyncio.to_thread(recorder.store_blob, data)
+    request["replay_upload"] = {"blob": digest, "filename": filename, "content_type": content_type}
+
+
+@web.middleware
+async def recorder_middleware(request, handler):
+    """
+    Logs method, path, relative time, status and duration of each session request (plus its upload, if any).
+    The request's session is always put in `recording_session` (also when not recording): replay keys GPT
+    calls by it.
+    """
+    if request.method == "OPTIONS" or request.path.startswith(REPLAY_SKIP_PREFIXES):
+        return await handler(request)
+
+    token = recording_session.set(request.get("session_id"))
+    if not recorder.enabled:
+        try:
+            return await handler(request)
+        finally:
+            recording_session.reset(token)
+
+    started = time.monotonic()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        recording_session.reset(token)
+        event = {"type": "request", "session": request.get("session_id"), "method": request.method,
+                 "path": request.path_qs, "status": status, "duration_s": round(time.monotonic() - started, 4)}
+        event.update(request.get("replay_upload", {}))
+        recorder.write_event(event)
+
+
+def install_recording_hooks():
+    """Wrap the upstream calls so their results are recorded under their replay keys."""
+    import audio_handling
+    import hume_face_analysis
+    import openai_configs
+    import prosody_analysis
+
+    transcribe_audio = audio_handling.transcribe_audio
+    generate_openai_response = openai_configs.generate_openai_response
+    stream_chunks = prosody_analysis._stream_chunks
+    analyze_face_batch = hume_face_analysis.analyze_face_batch
+
+    async def recorded_transcribe_audio(audio_file_path, deadline=None):
+        key = await file_key(audio_file_path) if audio_file_path and os.path.exists(audio_file_path) else None
+        started = time.monotonic()
+        text = await transcribe_audio(audio_file_path, deadline=deadline)
+        recorder.write_event({"type": "upstream", "kind": "stt", "key": key, "result": text,
+                              "duration_s": round(time.monotonic() - started, 4)})
+        return text
+
+    async def recorded_generate_openai_response(prompt, deadline=None):
+        key = next_llm_key()
+        started = time.monotonic()
+        text = await generate_openai_response(prompt, deadline=deadline)
+        recorder.write_event({"type": "upstream", "kind": "llm", "key": key, "result": text,
+                              "prompt_sha256": sha256(prompt.encode()),
+                              "duration_s": round(time.monotonic() - started, 4)})
+        return text
+
+    async def recorded_stream_chunks(chunk_files, turn):
+        key = await asyncio.to_thread(files_key, chunk_files)
+        started = time.monotonic()
+        try:
+            await stream_chunks(chunk_files, turn)
+        finally:
+            # Also when the turn deadline cancels the stream: the partial result is what the turn used.
+            recorder.write_event({"type": "upstream", "kind": "prosody", "key": key,
+                                  "result": {"sums": turn._sums, "count": turn._count, "chunks": turn.analyzed_chunks},
+                                  "duration_s": round(time.monotonic() - started, 4)})
+
+    async def recorded_analyze_face_batch(crops):
+        started = time.monotonic()
+        results = await analyze_face_batch(crops)
+        duration = round(time.monotonic() - started, 4)
+        for crop, emotions in zip(crops, results):
+            recorder.write_event({"type": "upstream", "kind": "face", "key": sha256(crop), "result": emotions,
+                                  "duration_s": duration, "session": None})
+        return results
+
+    audio_handling.transcribe_audio = recorded_transcribe_audio
+    audio_handling.generate_openai_response = recorded_generate_openai_response
+    openai_configs.generate_openai_response = recorded_generate_openai_response
+    prosody_analysis._stream_chunks = recorded_stream_chunks
+    hume_face_analysis.analyze_face_batch = recorded_analyze_face_batch
+
+
+# -------------------- Reading bundles --------------------
+
+class ReplayBundle:
+    """A recorded bundle, from its directory or from a zip made by pack_bundle()."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        names = self._zip.namelist() if self._zip else os.listdir(path)
+        self.events = []
+        for name in sorted(n for n in names if os.path.basename(n).startswith("events-")):
+            for line in self._read(name).decode().splitlines():
+                if line.strip():
+                    self.events.append(json.loads(line))
+        self.events.sort(key=lambda e: e["t"])
+
+    def _read(self, name):
+        if self._zip:
+            return self._zip.read(name)
+        with open(os.path.join(self.path, name), "rb") as f:
+            return f.read()
+
+    def blob(self, digest):
+        return self._read(f"blobs/{digest}")
+
+    def requests(self):
+        return [e for e in self.events if e["type"] == "request"]
+
+    def upstream(self):
+        return [e for e in self.events if e["type"] == "upstream"]
+
+
+def pack_bundle(directory, out_path):
+    """Zip a recording directory: events deflated, blobs (already compressed media) stored as-is."""
+    with zipfile.ZipFile(out_path, "w") as zf:
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("events-"):
+                zf.write(os.path.join(directory, name), name, compress_type=zipfile.ZIP_DEFLATED)
+        for name in sorted(os.listdir(os.path.join(directory, "blobs"))):
+            zf.write(os.path.join(directory, "blobs", name), f"blobs/{name}", compress_type=zipfile.ZIP_STORED)
+    logger.info(f"Packed {directory} into {out_path} ({os.path.getsize(out_path) / 1024 ** 2:.1f} MB).")
@@ -0,0 +1,299 @@
+"""
+Batch reprocessing of archived recordings and face images into the live schema.
+
+    python reprocess.py uploaded_audio/ uploaded_images/ --workers 8 --concurrency 16
+
+Audio files (.wav/.webm/...) are decoded to 16 kHz mono in a process pool, cut into CHUNK_SIZE_MS
+chunks and silence-filtered with the same VAD as live uploads. Each run of consecutive speech
+chunks is one turn: its prosody goes to prosody_analysis + emotion_samples. Images go through the
+face detection pool; the face crop is analysed by Hume (batched like live faces) and stored in
+face_analysis + emotion_samples. Rows are timestamped with the file's mtime.
+
+At most --concurrency Hume calls are in flight. Every finished file is recorded in
+reprocess_checkpoint in the same transaction as its results, so a crashed or interrupted run
+resumes where it stopped: files already 'done' (or 'no_face') with the same size and mtime are
+skipped, 'failed' ones are retried. Throughput is logged every REPROCESS_PROGRESS_S and at the end.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from config import (
+    CHUNK_SIZE_MS,
+    FACE_DETECT_WORKERS,
+    MIN_AUDIO_DURATION_MS,
+    MIN_SILENCE_LEN,
+    REPROCESS_BATCH_ROWS,
+    REPROCESS_CONCURRENCY,
+    REPROCESS_PROGRESS_S,
+    REPROCESS_PROSODY_TIMEOUT_S,
+    SILENCE_THRESHOLD,
+    WRITE_BEHIND_FLUSH_MS,
+)
+from database import db, initialize_db
+from face_detection import face_detector
+from hume_face_analysis import face_batcher, face_stream
+from image_handling import save_face_analysis
+from lazy_imports import lazy_from
+from logger import logger
+from prosody_analysis import analyze_prosody_chunks, save_prosody_analysis
+from write_behind import writer
+
+AudioSegment = lazy_from("pydub", "AudioSegment")
+pydub_detect_silence = lazy_from("pydub.silence", "detect_silence")
+
+AUDIO_EXTENSIONS = (".wav", ".webm", ".mp3", ".m4a", ".ogg", ".flac")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+SESSION_IN_NAME = re.compile(r"_session_(.+?)_chunk_")  # live chunk names: <base>_session_<id>_chunk_<ts>.wav
+FINAL_STATUSES = ("done", "no_face")
+
+CHECKPOINT_SQL = '''
+    INSERT OR REPLACE INTO reprocess_checkpoint (path, size, mtime, kind, status, error, finished_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class ArchivedFile:
+    def __init__(self, path, kind, session_id):
+        stat = os.stat(path)
+        self.path = path
+        self.kind = kind  # 'audio' | 'image'
+        self.session_id = session_id
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+
+def session_for(path, default=None):
+    """Session ID from a live chunk name, else `default`, else the name of the file's directory."""
+    match = SESSION_IN_NAME.search(os.path.basename(path))
+    if match:
+        return match.group(1)
+    return default or os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+
+def discover(paths, kinds, default_session=None):
+    """Every audio/image file under `paths` (files or directories, recursive), in path order."""
+    found = []
+    for root in paths:
+        if os.path.isfile(root):
+            candidates = [root]
+        else:
+            candidates = sorted(os.path.join(d, name) for d, _, names in os.walk(root) for name in names)
+        for path in candidates:
+            ext = os.path.splitext(path)[1].lower()
+            kind = "audio" if ext in AUDIO_EXTENSIONS else "image" if ext in IMAGE_EXTENSIONS else None
+            if kind in kinds:
+                found.append(ArchivedFile(os.path.abspath(path), kind, session_for(path, default_session)))
+    return found
+
+
+def prepare_audio(path, out_dir):
+    """
+    Runs in a pool worker: decode to 16 kHz mono, cut CHUNK_SIZE_MS chunks and drop silent ones.
+    Returns (turns, audio_seconds), each turn a list of (chunk index, chunk WAV path) of consecutive speech.
+    """
+    audio = AudioSegment.from_file(path).set_frame_rate(16000).set_channels(1)
+    stem = os.path.join(out_dir, uuid.uuid4().hex)
+    turns, current = [], []
+    for i, start in enumerate(range(0, len(audio), CHUNK_SIZE_MS), start=1):
+        chunk = audio[start:start + CHUNK_SIZE_MS]
+        if len(chunk) < MIN_AUDIO_DURATION_MS:
+            continue
+        if pydub_detect_silence(chunk, min_silence_len=MIN_SILENCE_LEN, silence_thresh=SILENCE_THRESHOLD):
+            if current:
+                turns.append(current)
+                current = []
+            continue
+        chunk_path = f"{stem}_{i}.wav"
+        chunk.export(chunk_path, format="wav")
+        current.append((i, chunk_path))
+    if current:
+        turns.append(current)
+    return turns, len(audio) / 1000
+
+
+class ThroughputReport:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.statuses = Counter()
+        self.files = Counter()
+        self.audio_seconds = 0.0
+        self.turns = 0
+        self.local_s = 0.0
+        self.upstream_s = 0.0
+
+    def line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        done = sum(self.files.values())
+        return (f"{done} files in {elapsed:.0f} s ({done / elapsed:.2f} files/s; "
+                f"audio {self.files['audio']}, images {self.files['image']}), "
+                f"{self.audio_seconds / 60:.1f} min of audio ({self.audio_seconds / elapsed:.1f}x realtime), "
+                f"{self.turns} speech turns, status {dict(self.statuses)}; "
+                f"busy local {self.local_s:.0f} s, upstream {self.upstream_s:.0f} s")
+
+
+class Reprocessor:
+    def __init__(self, workers, concurrency):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.upstream = asyncio.Semaphore(concurrency)
+        self.report = ThroughputReport()
+        self._pool = None
+        self._chunk_dir = None
+
+    async def run(self, files):
+        self._chunk_dir = tempfile.mkdtemp(prefix="reprocess-")
+        if any(f.kind == "audio" for f in files):
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        pending = iter(files)
+        progress = asyncio.create_task(self._log_progress())
+
+        async def consume():
+            for archived in pending:
+                await self.process(archived)
+
+        try:
+            # Enough consumers to keep both the local pool and the upstream slots busy.
+            await asyncio.gather(*(consume() for _ in range(self.workers + self.concurrency)))
+        finally:
+            progress.cancel()
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+            shutil.rmtree(self._chunk_dir, ignore_errors=True)
+        logger.info(f"✅ Reprocessing finished: {self.report.line()}")
+
+    async def _log_progress(self):
+        while True:
+            await asyncio.sleep(REPROCESS_PROGRESS_S)
+            logger.info(f"Reprocess progress: {self.report.line()}")
+
+    async def process(self, archived):
+        try:
+            if archived.kind == "audio":
+                status, error, results = await self._process_audio(archived)
+            else:
+                status, error, results = await self._process_image(archived)
+        except Exception as e:
+            status, error, results = "failed", f"{type(e).__name__}: {e}", []
+            logger.error(f"❌ Reprocessing {archived.path} failed: {error}")
+
+        # One write-behind unit: the results and the checkpoint commit together (also when a failed
+        # batch is retried row by row), so a crash or a bad row never records half a file.
+        with writer.unit():
+            for save, args in results:
+                save(*args)
+            writer.submit(CHECKPOINT_SQL, (archived.path, archived.size, archived.mtime, archived.kind,
+                                           status, error, time.time()))
+        self.report.files[archived.kind] += 1
+        self.report.statuses[status] += 1
+
+    async def _process_audio(self, archived):
+        loop = asyncio.get_running_loop()
+        t0 = time.monotonic()
+        turns, seconds = await loop.run_in_executor(self._pool, prepare_audio, archived.path, self._chunk_dir)
+        self.report.local_s += time.monotonic() - t0
+        self.report.audio_seconds += seconds
+
+        results, missing = [], 0
+        try:
+            for turn_chunks in turns:
+                chunk_files = [path for _, path in turn_chunks]
+                t0 = time.monotonic()
+                async with self.upstream:
+                    prosody = await analyze_prosody_chunks(
+                        chunk_files, loop.time() + REPROCESS_PROSODY_TIMEOUT_S
+                    )
+                self.report.upstream_s += time.monotonic() - t0
+                if not prosody.complete:
+                    missing += prosody.total_chunks - prosody.analyzed_chunks
+                    continue
+                chunk_range = [i for i, _ in turn_chunks]
+                results.append((save_prosody_analysis, (archived.session_id, chunk_range, prosody, archived.mtime)))
+                self.report.turns += 1
+        finally:
+            for turn_chunks in turns:
+                for _, path in turn_chunks:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        if missing:
+            # Nothing is stored for a partly analysed file; the next run retries it whole.
+            return "failed", f"prosody missing for {missing} chunk(s)", []
+        return "done", None, results
+
+    async def _process_image(self, archived):
+        with open(archived.path, "rb") as f:
+            data = f.read()
+        t0 = time.monotonic()
+        detection = await face_detector.detect(data)
+        crop = await face_detector.crop(data, detection.box) if detection.box else None
+        self.report.local_s += time.monotonic() - t0
+        if crop is None:
+            return "no_face", None, []
+
+        t0 = time.monotonic()
+        async with self.upstream:
+            face_emotions = await face_batcher.analyze(crop)
+        self.report.upstream_s += time.monotonic() - t0
+        if not face_emotions:
+            return "failed", "no face emotions from Hume", []
+        return "done", None, [
+            (save_face_analysis, (archived.session_id, os.path.basename(archived.path), face_emotions, archived.mtime))
+        ]
+
+
+async def load_checkpoints():
+    async with db.connection() as db_conn:
+        async with db_conn.execute("SELECT path, size, mtime, status FROM reprocess_checkpoint") as cursor:
+            return {path: (size, mtime, status) for path, size, mtime, status in await cursor.fetchall()}
+
+
+async def reprocess(args):
+    await db.open()
+    await initialize_db()
+    face_detector.workers = args.workers
+    writer.max_rows = args.batch_rows
+    writer.flush_interval_s = max(WRITE_BEHIND_FLUSH_MS / 1000, 1.0)
+    try:
+        files = discover(args.paths, set(args.kinds.split(",")), args.session_id)
+        checkpoints = await load_checkpoints()
+        todo = [
+            f for f in files
+            if not (f.path in checkpoints and checkpoints[f.path][:2] == (f.size, f.mtime)
+                    and checkpoints[f.path][2] in FINAL_STATUSES)
+        ]
+        if args.limit:
+            todo = todo[:args.limit]
+        logger.info(f"Reprocessing {len(todo)} of {len(files)} files ({len(files) - len(todo)} already checkpointed).")
+        if todo:
+            await Reprocessor(args.workers, args.concurrency).run(todo)
+    finally:
+        await writer.close()
+        await face_stream.close()
+        face_detector.shutdown()
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="audio/image files or directories (searched recursively)")
+    parser.add_argument("--kinds", default="audio,image", help="comma-separated subset of audio,image")
+    parser.add_argument("--workers", type=int, default=FACE_DETECT_WORKERS, help="processes for decode/VAD/detection")
+    parser.add_argument("--concurrency", type=int, default=REPROCESS_CONCURRENCY, help="Hume calls in flight")
+    parser.add_argument("--batch-rows", type=int, default=REPROCESS_BATCH_ROWS, help="rows per insert transaction")
+    parser.add_argument("--session-id", help="session for files whose name does not carry one "
+                                             "(default: their directory name)")
+    parser.add_argument("--limit", type=int, help="process at most this many files this run")
+    asyncio.run(reprocess(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,85 @@
 import aiosqlite
 import datetime
+import os
+import time
 from logger import logger
+from config import FACE_EMOTION_WINDOW_S, SESSION_MARKER_FILE
+from database import db
+from emotion_store import read_emotion_window, top_emotions
 
-async def get_last_session_id(db_conn):
-    """Retrieve the last session ID from the 'users' table."""
-    async with db_conn.execute("SELECT session_id FROM users ORDER BY login_timestamp DESC LIMIT 1") as cursor:
-        row = await cursor.fetchone()
-        session_id = row[0] if row else None
+
+def touch_session_marker():
+    """Called by login: bumps the marker file's mtime so every worker's SessionResolver re-reads."""
+    with open(SESSION_MARKER_FILE, "a"):
+        os.utime(SESSION_MARKER_FILE, None)
+
+
+class SessionResolver:
+    """
+    In-process cache of the latest login's session ID.
+    Logins happen in the Flask process, so invalidation goes through SESSION_MARKER_FILE:
+    a hit costs one stat() and no query.
+    """
+
+    def __init__(self, marker=SESSION_MARKER_FILE):
+        self.marker = marker
+        self._session_id = None
+        self._version = None
+
+    def _marker_version(self):
+        try:
+            return os.stat(self.marker).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def invalidate(self):
+        self._session_id = None
+
+    async def resolve(self, db_conn=None):
+        version = self._marker_version()
+        if self._session_id is not None and version == self._version:
+            return self._session_id
+
+        if db_conn is None:
+            async with db.connection() as db_conn:
+                session_id = await self._query(db_conn)
+        else:
+            session_id = await self._query(db_conn)
+        self._session_id, self._version = session_id, version
         logger.info(f"Session ID found: {session_id}")
         return session_id
 
-async def retrieve_face_emotions(db_conn):
+    async def _query(self, db_conn):
+        async with db_conn.execute("SELECT session_id FROM users ORDER BY login_timestamp DESC LIMIT 1") as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+
+session_resolver = SessionResolver()
+
+
+async def get_last_session_id(db_conn=None):
+    """Retrieve the last session ID from the 'users' table (cached until the next login)."""
+    return await session_resolver.resolve(db_conn)
+
+async def retrieve_face_emotions(db_conn, session_id=None):
     """
-    Example logic. You might read from 'face_analysis' or 'users' depending on your schema.
-    Currently reading from 'users.initial_mood' to keep consistent with older code.
+    Mean face emotion vector of the session over the last FACE_EMOTION_WINDOW_S, formatted for the prompt.
+    Falls back to the session's 'users.initial_mood' (login capture) when it has no face samples yet.
+    Prompt building prefers emotion_state.describe_emotion_state, which needs no query at all.
     """
-    async with db_conn.execute("SELECT initial_mood FROM users ORDER BY login_timestamp DESC LIMIT 1") as cursor:
+    if session_id:
+        _, scores = await read_emotion_window(
+            db_conn, session_id, start=time.time() - FACE_EMOTION_WINDOW_S, source="face"
+        )
+        if len(scores):
+            mood = top_emotions(scores.mean(axis=0))
+            logger.info(f"Face emotions over last {FACE_EMOTION_WINDOW_S}s: {mood}")
+            return mood
+
+    async with db_conn.execute(
+        "SELECT initial_mood FROM users WHERE session_id = ? ORDER BY login_timestamp DESC LIMIT 1", (session_id,)
+    ) as cursor:
         result = await cursor.fetchone()
         mood = result[0] if result else "Neutral"
         logger.info(f"Latest face emotions from DB: {mood}")
@@ -0,0 +1,115 @@
+"""
+Signed session tokens: login (Flask) issues one, the aiohttp service verifies it without touching the DB.
+
+Format: base64url("session_id|username|expires") + "." + base64url(HMAC-SHA256(SECRET_KEY, payload)[:16])
+The token travels only in the X-Session-Token header and JSON bodies, never in URLs (access logs, Referer).
+"""
+import base64
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+
+from config import SECRET_KEY, SESSION_TOKEN_CACHE_SIZE, SESSION_TOKEN_TTL_S, SESSION_TOKENS_REQUIRED
+from export import check_admin_token
+from logger import logger
+from session_helpers import get_last_session_id
+
+TOKEN_HEADER = "X-Session-Token"
+# Admin routes (export and debug): not tied to a user session, they need the admin token instead.
+# CORS preflight is skipped by method.
+SESSION_EXEMPT_PREFIXES = ("/export", "/debug")
+
+if not SECRET_KEY:
+    raise RuntimeError("SECRET_KEY is not set; export a long random value (the same one for login and aiohttp).")
+_KEY = SECRET_KEY.encode()
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return hmac.new(_KEY, payload, hashlib.sha256).digest()[:16]
+
+
+def issue_token(session_id, username, ttl=SESSION_TOKEN_TTL_S):
+    payload = f"{session_id}|{username}|{int(time.time() + ttl)}".encode()
+    return f"{_b64(payload)}.{_b64(_sign(payload))}"
+
+
+class TokenVerifier:
+    """
+    Verifies tokens and remembers the last SESSION_TOKEN_CACHE_SIZE good ones (LRU),
+    so a repeat upload costs a dict lookup instead of an HMAC.
+    """
+
+    def __init__(self, cache_size=SESSION_TOKEN_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # token -> (session_id, username, expires)
+
+    def verify(self, token):
+        """(session_id, username) for a valid, unexpired token; None otherwise."""
+        entry = self._cache.get(token)
+        if entry is None:
+            entry = self._check(token)
+            if entry is None:
+                return None
+            self._cache[token] = entry
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(token)
+
+        session_id, username, expires = entry
+        if expires < time.time():
+            self._cache.pop(token, None)
+            return None
+        return session_id, username
+
+    def _check(self, token):
+        try:
+            payload_b64, sig_b64 = token.split(".", 1)
+            payload = _unb64(payload_b64)
+            if not hmac.compare_digest(_sign(payload), _unb64(sig_b64)):
+                return None
+            session_id, username, expires = payload.decode().rsplit("|", 2)
+            return session_id, username, int(expires)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+
+token_verifier = TokenVerifier()
+
+
+@web.middleware
+async def session_middleware(request, handler):
+    """
+    Attaches request["session_id"] / request["username"] from the X-Session-Token header.
+    Without a token the request is refused, unless SESSION_TOKENS_REQUIRED=0 (latest login fallback).
+    """
+    if request.method == "OPTIONS":
+        return await handler(request)
+    if request.path.startswith(SESSION_EXEMPT_PREFIXES):
+        check_admin_token(request)  # fail closed for every admin route, even one whose handler forgets
+        return await handler(request)
+
+    token = request.headers.get(TOKEN_HEADER)
+    if token:
+        verified = token_verifier.verify(token)
+        if verified is None:
+            raise web.HTTPUnauthorized(text="Invalid or expired session token")
+        request["session_id"], request["username"] = verified
+    elif SESSION_TOKENS_REQUIRED:
+        raise web.HTTPUnauthorized(text="Missing session token")
+    else:
+        # Legacy clients without a token
+        request["session_id"], request["username"] = await get_last_session_id(), None
+        logger.debug("Request without session token; using the latest login's session.")
+    return await handler(request)
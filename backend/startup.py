@@ -0,0 +1,103 @@
+import os
+import time
+
+from aiohttp import web
+
+from config import UPLOAD_DIR, PROCESSED_DIR, IMAGE_DIR
+from database import db
+from face_detection import face_detector
+from lazy_imports import load_all, load_timings
+from logger import logger
+from openai_configs import get_http_session, load_api_keys
+
+# Hot read queries, run once on every pooled connection during warm-up (fills statement and page caches).
+WARM_UP_QUERIES = [
+    ("SELECT session_id FROM users ORDER BY login_timestamp DESC LIMIT 1", ()),
+    ("SELECT ai_response FROM conversation WHERE session_id = ? ORDER BY id DESC LIMIT 1", ("",)),
+    ("SELECT COUNT(*) FROM face_analysis WHERE session_id = ?", ("",)),
+]
+
+OPENAI_WARM_UP_URL = "https://api.openai.com/v1/models"
+
+
+def process_started_at():
+    """Wall-clock time this process was started (from /proc when available, else now)."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_STARTED = process_started_at()
+
+
+def prepare_worker():
+    """Side effects that used to run at import: upload directories and API keys."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    load_api_keys()
+
+
+async def _warm_http():
+    # DNS + TLS handshake for the OpenAI host, so the first Whisper upload reuses a pooled connection.
+    async with get_http_session().head(OPENAI_WARM_UP_URL) as response:
+        await response.read()
+
+
+async def warm_up():
+    """
+    Pay every first-use cost before the worker accepts traffic:
+    heavy imports, face detection workers (decoder + cascade), DB connections and the HTTP pool.
+    Returns {step: seconds}.
+    """
+    timings = {}
+
+    t0 = time.perf_counter()
+    load_all()
+    timings["imports"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    workers = await face_detector.warm_up()
+    timings["face_detection"] = time.perf_counter() - t0
+    logger.info(f"Face detection warm: {workers}/{face_detector.workers} workers ready.")
+
+    t0 = time.perf_counter()
+    await db.warm_up(WARM_UP_QUERIES)
+    timings["database"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    try:
+        await _warm_http()
+    except Exception as e:
+        logger.warning(f"⚠️ HTTP warm-up failed (first upstream call will connect): {e}")
+    timings["http"] = time.perf_counter() - t0
+    return timings
+
+
+def report_ready(import_s, startup_s, warm_up_timings):
+    steps = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in warm_up_timings.items())
+    lazy = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in sorted(load_timings.items()))
+    logger.info(f"🚀 Worker {os.getpid()} ready {time.time() - PROCESS_STARTED:.2f} s after process start "
+                f"(imports {import_s * 1000:.0f} ms, startup {startup_s * 1000:.0f} ms"
+                f"{', warm-up: ' + steps if steps else ''}).")
+    if lazy:
+        logger.info(f"Heavy modules loaded so far: {lazy}.")
+
+
+_first_request_seen = False
+
+
+@web.middleware
+async def first_request_middleware(request, handler):
+    """Logs time-to-first-request (since process start) once per worker."""
+    global _first_request_seen
+    if not _first_request_seen:
+        _first_request_seen = True
+        logger.info(f"⏱️ Worker {os.getpid()} first request ({request.path}) "
+                    f"{time.time() - PROCESS_STARTED:.2f} s after process start.")
+    return await handler(request)
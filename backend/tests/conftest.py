@@ -0,0 +1,15 @@
+"""
+Backend test suite: python -m pytest backend/tests (needs backend/requirements.txt installed).
+
+Modules are imported the way the services import them (flat, from backend/), with a throwaway
+SECRET_KEY and DB_FILE so nothing touches a real database or key.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="backend-tests-"), "users.db"))
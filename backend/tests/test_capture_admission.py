@@ -0,0 +1,69 @@
+import pytest
+
+import capture_policy
+from capture_policy import CaptureAdmission, TokenBucket
+from config import CAPTURE_ADMIT_SLACK, CAPTURE_BUCKET_BURST, CAPTURE_SHED_LOAD
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(capture_policy.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def load(monkeypatch):
+    """Detection pool load seen by the admission check (jobs per worker)."""
+    value = {"load": 0.0}
+    monkeypatch.setattr(capture_policy.face_detector, "load", lambda: value["load"])
+    return value
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take()
+    assert not bucket.take()
+
+
+def test_bucket_never_exceeds_its_burst(clock):
+    bucket = TokenBucket(rate=10.0, burst=2)
+    clock.now += 60
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+
+
+def test_admission_follows_the_policy_rate(clock, load):
+    admission = CaptureAdmission()
+    policy = {"interval_ms": 1000}
+    results = [admission.admit("s1", policy) for _ in range(CAPTURE_BUCKET_BURST + 1)]
+    assert results[:-1] == [None] * CAPTURE_BUCKET_BURST
+    assert results[-1] == pytest.approx(1 / CAPTURE_ADMIT_SLACK)
+    assert admission.admit("s2", policy) is None  # buckets are per session
+    clock.now += 1 / CAPTURE_ADMIT_SLACK + 0.01
+    assert admission.admit("s1", policy) is None
+    assert (admission.admitted, admission.rejected) == (CAPTURE_BUCKET_BURST + 2, 1)
+
+
+def test_admission_sheds_everything_under_load(clock, load):
+    admission = CaptureAdmission()
+    load["load"] = CAPTURE_SHED_LOAD + 1
+    assert admission.admit("s1", {"interval_ms": 3000}) == 3.0
+
+
+def test_forget_drops_the_session_bucket(clock, load):
+    admission = CaptureAdmission()
+    admission.admit("s1", {"interval_ms": 1000})
+    admission.forget("s1")
+    admission.forget("unknown")
+    assert "s1" not in admission._buckets
@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+import emotion_state
+from database import Database
+from emotion_state import (
+    EmotionState,
+    describe_emotion_state,
+    session_states,
+    update_emotion_state,
+    warm_start_emotion_state,
+)
+from emotion_store import INSERT_SAMPLE_SQL, sample_row, vectorize
+from migrations import EMOTION_SAMPLES_TABLE_SQL
+
+
+@pytest.fixture(autouse=True)
+def fresh_states():
+    session_states.clear()
+    emotion_state._last_used.clear()
+    emotion_state._warm_started.clear()
+    yield
+    session_states.clear()
+
+
+@pytest.fixture
+def samples_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "emotions.db")
+    conn = sqlite3.connect(path)
+    conn.execute(EMOTION_SAMPLES_TABLE_SQL)
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(emotion_state, "db", Database(path, size=1))
+    return path
+
+
+def test_ema_tracks_dominant_and_rising_emotion():
+    state = EmotionState()
+    now = time.time()
+    state.update(vectorize({"Calmness": 0.9, "Joy": 0.1}), now - 600)
+    state.update(vectorize({"Calmness": 0.2, "Joy": 0.9}), now - 60)
+    assert state.dominant() == "Joy"
+    assert state.rising() == "Joy"
+    assert "trending up: Joy" in state.describe(now)
+    assert "stale" not in state.describe(now)
+    assert "stale" in state.describe(now + emotion_state.EMOTION_STALE_S)
+
+
+def test_describe_is_none_before_any_reading():
+    assert describe_emotion_state("s1", "face") is None
+    update_emotion_state("s1", "login", {"Joy": 0.5})  # login readings seed the face state
+    assert "dominant: Joy" in describe_emotion_state("s1", "face")
+
+
+def test_idle_sessions_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(emotion_state.time, "monotonic", lambda: now[0])
+    update_emotion_state("old", "face", {"Joy": 0.5})
+    now[0] += emotion_state.EMOTION_STATE_IDLE_TTL_S + 1
+    update_emotion_state("new", "face", {"Joy": 0.5})
+    assert list(session_states) == ["new"]
+
+
+def test_warm_start_replays_history_after_a_live_update(samples_db):
+    now = time.time()
+    conn = sqlite3.connect(samples_db)
+    conn.executemany(INSERT_SAMPLE_SQL, [
+        sample_row("s1", "login", {"Sadness": 0.9}, now - 120),
+        sample_row("s1", "prosody", {"Calmness": 0.8}, now - 60),
+    ])
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        update_emotion_state("s1", "face", {"Joy": 0.9}, now)  # live update creates the session first
+        await warm_start_emotion_state("s1")
+        await emotion_state.db.close()
+
+    asyncio.run(scenario())
+    face = session_states["s1"]["face"]
+    assert face.updated_at == now  # history first, then the live reading
+    assert face.slow[vectorize({"Sadness": 1.0}).argmax()] > 0  # the login history was replayed
+    assert "Calmness" in describe_emotion_state("s1", "prosody")
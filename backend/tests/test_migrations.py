@@ -0,0 +1,81 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from conversation_search import rebuild_index
+from migrations import MIGRATIONS, apply_migrations_sync
+
+REPO_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "users.db")
+
+# Schema of a database written before migrations existed: no prosody_analysis, emotions as text.
+LEGACY_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, login_timestamp TEXT,
+        initial_mood TEXT, session_id TEXT, UNIQUE(username, login_timestamp, session_id))''',
+    '''CREATE TABLE conversation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, session_id TEXT,
+        transcription TEXT, ai_response TEXT, chunk_range TEXT)''',
+    '''CREATE TABLE face_analysis (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, session_id TEXT,
+        face_file_name TEXT, face_emotions TEXT)''',
+]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    for sql in LEGACY_SCHEMA:
+        conn.execute(sql)
+    conn.execute("INSERT INTO users (username, login_timestamp, initial_mood, session_id) VALUES "
+                 "('parzon', '2025-01-01 10:00:00', 'Joy', '1735725600')")
+    conn.execute("INSERT INTO conversation (timestamp, session_id, transcription, ai_response) VALUES "
+                 "('2025-01-01T10:01:00', '1735725600', 'I planted tomatoes in my garden', 'Lovely!')")
+    conn.executemany("INSERT INTO face_analysis (timestamp, session_id, face_file_name, face_emotions) VALUES (?, ?, ?, ?)", [
+        ("2025-01-01T10:02:00", "1735725600", "a.jpg", "Joy: 0.80, Calmness: 0.15"),
+        ("2025-01-01T10:03:00", "1735725600", "b.jpg", "Unavailable"),
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_legacy_database_migrates_to_latest(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    apply_migrations_sync(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"prosody_analysis", "conversation_fts", "reprocess_checkpoint", "emotion_samples"} <= tables
+    # Rows that existed before the FTS triggers are indexed too.
+    assert conn.execute("SELECT rowid FROM conversation_fts WHERE conversation_fts MATCH 'garden'").fetchall() == [(1,)]
+    # Only the parseable legacy string becomes a sample.
+    assert conn.execute("SELECT session_id, source FROM emotion_samples").fetchall() == [("1735725600", "face")]
+    conn.close()
+
+
+def test_migrations_are_applied_once(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    apply_migrations_sync(conn)
+    apply_migrations_sync(conn)
+    assert conn.execute("SELECT COUNT(*) FROM emotion_samples").fetchone()[0] == 1
+    conn.close()
+
+
+def test_rebuild_index_on_legacy_database(legacy_db):
+    rebuild_index(legacy_db)
+    conn = sqlite3.connect(legacy_db)
+    assert conn.execute("SELECT COUNT(*) FROM conversation_fts WHERE conversation_fts MATCH 'tomatoes'").fetchone()[0] == 1
+    conn.close()
+
+
+@pytest.mark.skipif(not os.path.exists(REPO_DB), reason="no users.db in the repository")
+def test_rebuild_index_on_repository_database(tmp_path):
+    path = str(tmp_path / "users.db")
+    shutil.copy(REPO_DB, path)
+    rebuild_index(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    conn.close()
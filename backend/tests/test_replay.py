@@ -0,0 +1,44 @@
+import asyncio
+import contextvars
+
+import pytest
+
+import replay
+from replay import files_key, llm_purpose, next_llm_key, recording_session
+
+
+@pytest.fixture(autouse=True)
+def fresh_counters():
+    replay._llm_calls.clear()
+    yield
+    replay._llm_calls.clear()
+
+
+def keys_in(session, purpose=None, count=2):
+    def take():
+        recording_session.set(session)
+        if purpose:
+            llm_purpose.set(purpose)
+        return [next_llm_key() for _ in range(count)]
+    return contextvars.copy_context().run(take)
+
+
+def test_llm_keys_count_per_session():
+    assert keys_in("s1") == ["s1:reply#0", "s1:reply#1"]
+    assert keys_in("s2") == ["s2:reply#0", "s2:reply#1"]
+    assert keys_in("s1", count=1) == ["s1:reply#2"]
+
+
+def test_summary_calls_do_not_shift_reply_numbering():
+    assert keys_in("s1", count=1) == ["s1:reply#0"]
+    assert keys_in("s1", "summary") == ["s1:summary#0", "s1:summary#1"]
+    assert keys_in("s1", count=1) == ["s1:reply#1"]
+
+
+def test_files_key_depends_on_content_and_order(tmp_path):
+    a, b = tmp_path / "a.wav", tmp_path / "b.wav"
+    a.write_bytes(b"first")
+    b.write_bytes(b"second")
+    assert files_key([str(a), str(b)]) == files_key([str(a), str(b)])
+    assert files_key([str(a), str(b)]) != files_key([str(b), str(a)])
+    assert asyncio.run(replay.file_key(str(a))) == replay.sha256(b"first")
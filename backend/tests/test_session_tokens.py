@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import export
+from session_tokens import TokenVerifier, issue_token, session_middleware
+
+
+def test_issued_token_verifies():
+    token = issue_token("1735725600", "parzon")
+    assert TokenVerifier().verify(token) == ("1735725600", "parzon")
+
+
+def test_tampered_token_is_rejected():
+    payload, sig = issue_token("1735725600", "parzon").split(".")
+    other_payload = issue_token("1735725601", "parzon").split(".")[0]
+    verifier = TokenVerifier()
+    assert verifier.verify(f"{other_payload}.{sig}") is None
+    assert verifier.verify(f"{payload}.{sig[:-2]}AA") is None
+    assert verifier.verify("not-a-token") is None
+
+
+def test_expired_token_is_rejected():
+    assert TokenVerifier().verify(issue_token("1735725600", "parzon", ttl=-1)) is None
+
+
+def test_cached_token_still_expires(monkeypatch):
+    verifier = TokenVerifier()
+    token = issue_token("1735725600", "parzon", ttl=60)
+    assert verifier.verify(token) is not None
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert verifier.verify(token) is None
+
+
+def test_cache_is_bounded():
+    verifier = TokenVerifier(cache_size=2)
+    tokens = [issue_token(str(i), "parzon") for i in range(3)]
+    for token in tokens:
+        verifier.verify(token)
+    assert list(verifier._cache) == tokens[1:]
+
+
+def _get(path, headers=None):
+    """Status and body of one request through session_middleware (the handler echoes the session)."""
+    async def echo(request):
+        return web.Response(text=request.get("session_id") or "")
+
+    async def run():
+        app = web.Application(middlewares=[session_middleware])
+        app.router.add_get("/latest_ai_response", echo)
+        app.router.add_get("/debug/upstreams", echo)
+        async with TestClient(TestServer(app)) as client:
+            resp = await client.get(path, headers=headers or {})
+            return resp.status, await resp.text()
+
+    return asyncio.run(run())
+
+
+def test_middleware_requires_a_valid_token():
+    assert _get("/latest_ai_response")[0] == 401
+    assert _get("/latest_ai_response", {"X-Session-Token": "forged.token"})[0] == 401
+    token = issue_token("1735725600", "parzon")
+    assert _get("/latest_ai_response", {"X-Session-Token": token}) == (200, "1735725600")
+
+
+def test_token_in_query_string_is_ignored():
+    token = issue_token("1735725600", "parzon")
+    assert _get(f"/latest_ai_response?token={token}")[0] == 401
+
+
+def test_admin_routes_fail_closed(monkeypatch):
+    monkeypatch.setattr(export, "ADMIN_TOKEN", None)
+    assert _get("/debug/upstreams")[0] == 404
+    monkeypatch.setattr(export, "ADMIN_TOKEN", "admin-secret")
+    assert _get("/debug/upstreams", {"X-Admin-Token": "wrong"})[0] == 403
+    assert _get("/debug/upstreams", {"X-Admin-Token": "admin-secret"})[0] == 200
@@ -0,0 +1,121 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import write_behind
+from database import Database
+from write_behind import WriteBehindWriter
+
+INSERT_SQL = "INSERT INTO items (name) VALUES (?)"
+INSERT_OTHER_SQL = "INSERT INTO other (name) VALUES (?)"
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "writer.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    conn.execute("CREATE TABLE other (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(write_behind, "db", Database(path, size=1))
+    return path
+
+
+def rows(path, table="items"):
+    conn = sqlite3.connect(path)
+    try:
+        return [name for (name,) in conn.execute(f"SELECT name FROM {table} ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def run(coro):
+    async def with_pool():
+        try:
+            return await coro
+        finally:
+            await write_behind.db.close()
+    return asyncio.run(with_pool())
+
+
+def test_rows_are_group_committed(db_path):
+    async def scenario():
+        writer = WriteBehindWriter(flush_interval_s=60)
+        futures = [writer.submit(INSERT_SQL, (f"row{i}",)) for i in range(5)]
+        futures.append(writer.submit(INSERT_OTHER_SQL, ("other",)))
+        await writer.flush()
+        await asyncio.gather(*futures)
+        await writer.close()
+
+    run(scenario())
+    assert rows(db_path) == [f"row{i}" for i in range(5)]
+    assert rows(db_path, "other") == ["other"]
+
+
+def test_max_rows_wakes_the_writer(db_path):
+    async def scenario():
+        writer = WriteBehindWriter(flush_interval_s=60, max_rows=3)
+        futures = [writer.submit(INSERT_SQL, (f"row{i}",)) for i in range(3)]
+        await asyncio.wait_for(asyncio.gather(*futures), 5)
+        await writer.close()
+
+    run(scenario())
+    assert rows(db_path) == ["row0", "row1", "row2"]
+
+
+def test_failed_batch_is_retried_row_by_row(db_path):
+    async def scenario():
+        writer = WriteBehindWriter(flush_interval_s=60)
+        good = writer.submit(INSERT_SQL, ("a",))
+        bad = writer.submit(INSERT_SQL, ("a",))  # UNIQUE violation fails the group commit
+        other = writer.submit(INSERT_SQL, ("b",))
+        await writer.flush()
+        await good
+        await other
+        with pytest.raises(sqlite3.IntegrityError):
+            await bad
+        await writer.close()
+
+    run(scenario())
+    assert rows(db_path) == ["a", "b"]
+
+
+def test_unit_is_retried_as_one_transaction(db_path):
+    async def scenario():
+        writer = WriteBehindWriter(flush_interval_s=60)
+        alone = writer.submit(INSERT_SQL, ("a",))
+        with writer.unit():
+            in_unit = [writer.submit(INSERT_OTHER_SQL, ("result",)), writer.submit(INSERT_SQL, ("a",))]
+        await writer.flush()
+        await alone
+        for fut in in_unit:
+            with pytest.raises(sqlite3.IntegrityError):
+                await fut
+        await writer.close()
+
+    run(scenario())
+    assert rows(db_path) == ["a"]
+    assert rows(db_path, "other") == []  # the unit's good row was rolled back with the bad one
+
+
+def test_close_flushes_pending_rows(db_path):
+    async def scenario():
+        writer = WriteBehindWriter(flush_interval_s=60)
+        writer.submit(INSERT_SQL, ("late",))
+        await writer.close()
+
+    run(scenario())
+    assert rows(db_path) == ["late"]
+
+
+def test_sync_waits_for_submitted_rows(db_path):
+    async def scenario():
+        writer = WriteBehindWriter(flush_interval_s=0.01)
+        writer.submit(INSERT_SQL, ("x",))
+        await writer.sync()
+        assert rows(db_path) == ["x"]
+        await writer.close()
+
+    run(scenario())
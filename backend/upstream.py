@@ -0,0 +1,214 @@
+"""
+Deadline, hedging and circuit breaking for upstream AI calls (Whisper, GPT, Hume face).
+
+Upstream.call(fn, *args, deadline=...) runs one raw call (a coroutine function that raises on
+failure) within min(its own timeout, what is left of the turn's deadline):
+- if the first attempt is still running past the upstream's recent p95, a second identical
+  request is sent and the first answer wins (the loser is cancelled);
+- if the first attempt fails fast, the second request is sent right away instead;
+- after UPSTREAM_BREAKER_FAILURES failed calls in a row the circuit opens and calls fail
+  immediately for UPSTREAM_BREAKER_COOLDOWN_S, then a single trial call decides.
+Every failure raises UpstreamUnavailable; the public wrappers turn that into their fallback.
+GET /debug/upstreams shows latency percentiles, hedge and breaker counters per upstream.
+"""
+import asyncio
+import os
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+from config import (
+    UPSTREAM_BREAKER_COOLDOWN_S,
+    UPSTREAM_BREAKER_FAILURES,
+    UPSTREAM_HEDGE_MIN_DELAY_S,
+    UPSTREAM_HEDGE_MIN_SAMPLES,
+    UPSTREAM_HUME_FACE_TIMEOUT_S,
+    UPSTREAM_LATENCY_WINDOW,
+    UPSTREAM_LLM_TIMEOUT_S,
+    UPSTREAM_STT_TIMEOUT_S,
+)
+from export import check_admin_token
+from logger import logger
+
+
+class UpstreamError(Exception):
+    """A raw upstream call got an unusable answer (e.g. a non-200 status)."""
+
+
+class UpstreamUnavailable(UpstreamError):
+    """The call failed, timed out, had no turn budget left, or the circuit is open."""
+
+
+class LatencyWindow:
+    def __init__(self, size=UPSTREAM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, p):
+        if len(self._samples) < UPSTREAM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def to_dict(self):
+        values = {f"p{p}_ms": self.percentile(p) for p in (50, 95, 99)}
+        return {"samples": len(self._samples),
+                **{k: round(v * 1000, 1) if v is not None else None for k, v in values.items()}}
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` failed calls in a row; open -> half_open after `cooldown_s`."""
+
+    def __init__(self, name, failures=UPSTREAM_BREAKER_FAILURES, cooldown_s=UPSTREAM_BREAKER_COOLDOWN_S):
+        self.name = name
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._trial_started = 0.0
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown_s:
+            self.state = "half_open"
+            self._trial_running = False
+        if self.state == "closed":
+            return True
+        # One trial call while half open (another if the trial was abandoned, e.g. its turn was cancelled).
+        if self.state == "half_open" and (
+            not self._trial_running or time.monotonic() - self._trial_started > self.cooldown_s
+        ):
+            self._trial_running = True
+            self._trial_started = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"✅ {self.name} circuit closed again.")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                logger.warning(f"⚠️ {self.name} circuit opened after {self.consecutive_failures} failures; "
+                               f"failing fast for {self.cooldown_s:.0f} s.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def to_dict(self):
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class Upstream:
+    def __init__(self, name, timeout_s, hedge=True):
+        self.name = name
+        self.timeout_s = timeout_s
+        self.hedge = hedge
+        self.attempt_latency = LatencyWindow()  # one request, drives the hedge delay
+        self.call_latency = LatencyWindow()     # what the caller waited, hedging included
+        self.breaker = CircuitBreaker(name)
+        self.counts = Counter()
+
+    def hedge_delay(self):
+        p95 = self.attempt_latency.percentile(95) if self.hedge else None
+        return None if p95 is None else max(p95, UPSTREAM_HEDGE_MIN_DELAY_S)
+
+    async def call(self, fn, *args, deadline=None):
+        """fn(*args) within the budget; returns its result or raises UpstreamUnavailable."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        budget = self.timeout_s if deadline is None else min(self.timeout_s, deadline - started)
+        if budget <= 0:
+            self.counts["no_budget"] += 1
+            raise UpstreamUnavailable(f"{self.name}: turn deadline already passed")
+        if not self.breaker.allow():
+            self.counts["short_circuited"] += 1
+            raise UpstreamUnavailable(f"{self.name}: circuit open")
+
+        self.counts["calls"] += 1
+        end = started + budget
+        hedge_at = self.hedge_delay()
+        attempts = {asyncio.ensure_future(fn(*args)): started}  # task -> its start time
+        primary = next(iter(attempts))
+        hedged = False
+        error = None
+        try:
+            while attempts:
+                now = loop.time()
+                if now >= end:
+                    break
+                wake = end
+                if not hedged and hedge_at is not None:
+                    wake = min(wake, started + hedge_at)
+                done, _ = await asyncio.wait(attempts, timeout=max(0.0, wake - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt_started = attempts.pop(task)
+                    if task.cancelled():
+                        error = asyncio.CancelledError()
+                    elif task.exception() is None:
+                        finished = loop.time()
+                        self.attempt_latency.add(finished - attempt_started)
+                        self.call_latency.add(finished - started)
+                        self.breaker.record_success()
+                        self.counts["ok"] += 1
+                        if task is not primary:
+                            self.counts["hedge_wins"] += 1
+                        return task.result()
+                    else:
+                        error = task.exception()
+
+                # Second request: the first is slower than p95, or it already failed.
+                slow = not done and hedge_at is not None and loop.time() >= started + hedge_at
+                if not hedged and self.hedge and (slow or not attempts) and loop.time() < end:
+                    hedged = True
+                    self.counts["hedged" if slow else "retried"] += 1
+                    attempts[asyncio.ensure_future(fn(*args))] = loop.time()
+        finally:
+            for task in attempts:
+                task.cancel()
+
+        if attempts:
+            self.counts["timeouts"] += 1
+            error = asyncio.TimeoutError(f"no answer within {budget:.1f} s")
+        self.counts["failed"] += 1
+        self.breaker.record_failure()
+        raise UpstreamUnavailable(f"{self.name}: {error!r}") from error
+
+    def fallback(self, error):
+        """Called by a public wrapper that answers with its fallback instead of a result."""
+        self.counts["fallbacks"] += 1
+        logger.error(f"❌ {error}; using fallback.")
+
+    def to_dict(self):
+        return {
+            "timeout_s": self.timeout_s,
+            "hedge_after_ms": round(self.hedge_delay() * 1000, 1) if self.hedge_delay() else None,
+            "breaker": self.breaker.to_dict(),
+            "attempt_latency": self.attempt_latency.to_dict(),
+            "call_latency": self.call_latency.to_dict(),
+            **self.counts,
+        }
+
+
+whisper_upstream = Upstream("whisper", UPSTREAM_STT_TIMEOUT_S)
+llm_upstream = Upstream("llm", UPSTREAM_LLM_TIMEOUT_S)
+# No hedging: face requests share one serialized Hume socket, a second copy would only queue behind the first.
+hume_face_upstream = Upstream("hume_face", UPSTREAM_HUME_FACE_TIMEOUT_S, hedge=False)
+
+UPSTREAMS = (whisper_upstream, llm_upstream, hume_face_upstream)
+
+
+async def handle_upstream_stats(request):
+    """GET /debug/upstreams: per-upstream latency percentiles, hedge, fallback and breaker state."""
+    check_admin_token(request)
+    return web.json_response({"pid": os.getpid(), **{u.name: u.to_dict() for u in UPSTREAMS}})
@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+
+from config import WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_ROWS
+from database import db
+from logger import logger
+
+
+class WriteBehindWriter:
+    """
+    Group-commit writer for INSERTs from every session in this worker.
+    Rows are queued and written in one transaction every WRITE_BEHIND_FLUSH_MS
+    or as soon as WRITE_BEHIND_MAX_ROWS are waiting, so N rows cost one fsync instead of N.
+
+    submit() returns a future that resolves once the row is committed; callers that need
+    read-your-writes await it (or sync()), everyone else fires and forgets.
+    Rows submitted inside unit() commit or fail together, also when a failed batch is retried row by row.
+    """
+
+    def __init__(self, flush_interval_s=WRITE_BEHIND_FLUSH_MS / 1000, max_rows=WRITE_BEHIND_MAX_ROWS):
+        self.flush_interval_s = flush_interval_s
+        self.max_rows = max_rows
+        self._pending = []        # (sql, params, future, unit)
+        self._unit = None         # unit() block being submitted, if any
+        self._units = 0
+        self._last_future = None  # future of the most recently submitted row
+        self._wake = None
+        self._stop = None
+        self._lock = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._stop = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"Write-behind writer started (every {self.flush_interval_s * 1000:.0f}ms or {self.max_rows} rows)."
+            )
+
+    def submit(self, sql, params):
+        """Queue one row. Returns a future resolved after commit (or failed with the DB error)."""
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((sql, params, fut, self._unit))
+        self._last_future = fut
+        if len(self._pending) >= self.max_rows:
+            self._wake.set()
+        return fut
+
+    @contextlib.contextmanager
+    def unit(self):
+        """Rows submitted in the block (which must not await) are retried as one transaction, never split."""
+        self._units += 1
+        self._unit = self._units
+        try:
+            yield
+        finally:
+            self._unit = None
+
+    async def sync(self):
+        """Wait until everything submitted so far is committed (read-your-writes barrier)."""
+        fut = self._last_future
+        if fut is not None and not fut.done():
+            try:
+                await asyncio.shield(fut)
+            except Exception:
+                pass  # the submitter sees the error; the barrier only waits
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+
+            # Group consecutive rows with the same statement into one executemany.
+            groups = []
+            for sql, params, _, _ in batch:
+                if groups and groups[-1][0] == sql:
+                    groups[-1][1].append(params)
+                else:
+                    groups.append((sql, [params]))
+
+            try:
+                await self._commit(groups)
+            except Exception as e:
+                logger.error(f"Write-behind flush of {len(batch)} rows failed: {e}; retrying row by row.")
+                await self._commit_each(batch)
+                return
+
+            for _, _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_result(None)
+            logger.debug(f"Write-behind committed {len(batch)} rows in {len(groups)} statements.")
+
+    async def _commit(self, groups):
+        """One transaction for all (sql, rows) groups; rolled back and re-raised on any error."""
+        async with db.connection() as db_conn:
+            try:
+                for sql, rows in groups:
+                    await db_conn.executemany(sql, rows)
+                await db_conn.commit()
+            except Exception:
+                await db_conn.rollback()
+                raise
+
+    async def _commit_each(self, batch):
+        """After a failed group commit: one transaction per row (or per unit), so only the bad ones fail."""
+        transactions = []
+        for sql, params, fut, unit in batch:
+            if unit is not None and transactions and transactions[-1][0] == unit:
+                transactions[-1][1].append((sql, params, fut))
+            else:
+                transactions.append((unit, [(sql, params, fut)]))
+
+        failed = 0
+        for _, rows in transactions:
+            try:
+                await self._commit([(sql, [params]) for sql, params, _ in rows])
+            except Exception as e:
+                failed += len(rows)
+                logger.error(f"Write-behind retry of {len(rows)} row(s) failed: {e}")
+                for _, _, fut in rows:
+                    if not fut.done():
+                        fut.set_exception(e)
+                        fut.exception()  # mark retrieved for fire-and-forget callers
+                continue
+            for _, _, fut in rows:
+                if not fut.done():
+                    fut.set_result(None)
+        logger.info(f"Write-behind retry committed {len(batch) - failed} of {len(batch)} rows.")
+
+    async def close(self):
+        """
+        Stop the background loop and flush whatever is still queued (called on shutdown).
+        The loop is not cancelled: it finishes the flush it may be in, so no swapped-out batch is lost.
+        """
+        if self._task is not None:
+            self._stop.set()
+            self._wake.set()
+            await self._task
+            self._task = None
+            await self.flush()
+            logger.info("Write-behind writer flushed and stopped.")
+
+
+writer = WriteBehindWriter()
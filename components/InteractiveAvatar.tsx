@@ -33,6 +33,52 @@ import InteractiveAvatarTextInput from "./InteractiveAvatarTextInput";
 
 import { AVATARS, STT_LANGUAGE_LIST } from "@/app/lib/constants";
 
+// Signed session token issued at login, kept for this tab. It is fetched from the login
+// service's response body (never passed in a URL) and sent with every backend call in the
+// X-Session-Token header so the server knows which session it belongs to.
+const LOGIN_SERVICE_URL = "http://localhost:7000";
+
+const loadSessionToken = async (): Promise<void> => {
+  if (typeof window === "undefined" || sessionStorage.getItem("sessionToken")) return;
+  try {
+    const res = await fetch(`${LOGIN_SERVICE_URL}/session_token`, {
+      method: "POST",
+      credentials: "include",
+    });
+
+    if (!res.ok) return;
+    const { token } = await res.json();
+
+    if (token) sessionStorage.setItem("sessionToken", token);
+  } catch (error) {
+    console.error("Error fetching session token:", error);
+  }
+};
+
+const getSessionHeaders = (): Record<string, string> => {
+  if (typeof window === "undefined") return {};
+  const token = sessionStorage.getItem("sessionToken");
+
+  return token ? { "X-Session-Token": token } : {};
+};
+
+// How the server wants frames captured right now (GET /capture_policy, also sent with a 429).
+interface CapturePolicy {
+  interval_ms: number;
+  max_width: number;
+  max_height: number;
+  jpeg_quality: number;
+  refresh_ms: number;
+}
+
+const DEFAULT_CAPTURE_POLICY: CapturePolicy = {
+  interval_ms: 1500,
+  max_width: 640,
+  max_height: 480,
+  jpeg_quality: 0.8,
+  refresh_ms: 5000,
+};
+
 const InteractiveAvatar = () => {
   // ---------------------- AI RESPONSE POLLING (UNCHANGED) ----------------------
   const [latestAIResponse, setLatestAIResponse] = useState<string>("");
@@ -41,12 +87,18 @@ const InteractiveAvatar = () => {
     ai_response: string | null;
   }
 
+  // Session token for all backend calls, handed out by the login service
+  useEffect(() => {
+    loadSessionToken();
+  }, []);
+
   // Poll the backend every 3s for latest AI response
   useEffect(() => {
     const intervalId = setInterval(async () => {
       try {
         const res = await axios.get<AIResponse>(
           "http://localhost:8000/latest_ai_response",
+          { headers: getSessionHeaders() },
         );
 
         if (res.data.ai_response) {
@@ -91,6 +143,7 @@ const InteractiveAvatar = () => {
   const videoRef = useRef<HTMLVideoElement | null>(null);
   const canvasRef = useRef<HTMLCanvasElement | null>(null);
   const [imageCounter, setImageCounter] = useState(1);
+  const capturePolicyRef = useRef<CapturePolicy>(DEFAULT_CAPTURE_POLICY);
 
   // 1) AFTER user finishes selecting fields and clicks "Start session",
   //    we initiate the audio logic.
@@ -193,6 +246,7 @@ const InteractiveAvatar = () => {
         {
           headers: {
             "Content-Type": "multipart/form-data",
+            ...getSessionHeaders(),
           },
         },
       );
@@ -204,48 +258,92 @@ const InteractiveAvatar = () => {
     }
   };
 
-  // ---------------------- IMAGE-RELATED FUNCTIONS (unchanged) ----------------------
+  // ---------------------- IMAGE-RELATED FUNCTIONS ----------------------
+  const fetchCapturePolicy = async () => {
+    try {
+      const res = await axios.get<CapturePolicy>(
+        "http://localhost:8000/capture_policy",
+        { headers: getSessionHeaders() },
+      );
+
+      capturePolicyRef.current = res.data;
+    } catch (err) {
+      console.error("Error fetching capture policy:", err);
+    }
+  };
+
+  // Frame rate, size and quality follow the server's capture policy.
   const startCapturingImages = () => {
     let imagesCaptured = 0;
     const maxImages = 20;
-    const captureIntervalMS = 1500; // capture one image every 1.5s
+    let policyFetchedAt = 0;
 
-    const captureInterval = setInterval(() => {
+    const captureNext = async () => {
       if (imagesCaptured >= maxImages) {
-        clearInterval(captureInterval);
-        console.log("✅ Stopped image capture after 40 images.");
+        console.log(`✅ Stopped image capture after ${maxImages} images.`);
 
         return;
       }
-      captureAndSendImage();
-      imagesCaptured++;
-    }, captureIntervalMS);
+      if (Date.now() - policyFetchedAt > capturePolicyRef.current.refresh_ms) {
+        policyFetchedAt = Date.now();
+        await fetchCapturePolicy();
+      }
+      if (await captureAndSendImage()) imagesCaptured++;
+      setTimeout(captureNext, capturePolicyRef.current.interval_ms);
+    };
+
+    setTimeout(captureNext, capturePolicyRef.current.interval_ms);
   };
 
-  const captureAndSendImage = async () => {
-    if (!videoRef.current || !canvasRef.current) return;
+  const captureAndSendImage = async (): Promise<boolean> => {
+    if (!videoRef.current || !canvasRef.current) return false;
     const ctx = canvasRef.current.getContext("2d");
 
-    if (!ctx) return;
+    if (!ctx) return false;
 
-    // Copy current video frame
-    canvasRef.current.width = videoRef.current.videoWidth;
-    canvasRef.current.height = videoRef.current.videoHeight;
-    ctx.drawImage(videoRef.current, 0, 0);
+    // Copy current video frame, scaled down to the policy's max size
+    const policy = capturePolicyRef.current;
+    const { videoWidth, videoHeight } = videoRef.current;
+
+    if (!videoWidth || !videoHeight) return false;
+    const scale = Math.min(
+      1,
+      policy.max_width / videoWidth,
+      policy.max_height / videoHeight,
+    );
+
+    canvasRef.current.width = Math.round(videoWidth * scale);
+    canvasRef.current.height = Math.round(videoHeight * scale);
+    ctx.drawImage(
+      videoRef.current,
+      0,
+      0,
+      canvasRef.current.width,
+      canvasRef.current.height,
+    );
 
     const blob = await new Promise<Blob | null>((resolve) =>
-      canvasRef.current!.toBlob(resolve, "image/jpeg", 0.95),
+      canvasRef.current!.toBlob(resolve, "image/jpeg", policy.jpeg_quality),
     );
 
-    if (!blob) return;
+    if (!blob) return false;
 
     const filename = `${Date.now()}_${imageCounter}_image.jpg`;
 
     try {
       await sendImage(blob, filename);
       setImageCounter((prev) => prev + 1);
+
+      return true;
     } catch (err) {
-      console.error("Error uploading image:", err);
+      if (axios.isAxiosError(err) && err.response?.status === 429) {
+        // Frame refused by admission control; the body is the policy to follow now.
+        capturePolicyRef.current = err.response.data as CapturePolicy;
+      } else {
+        console.error("Error uploading image:", err);
+      }
+
+      return false;
     }
   };
 
@@ -258,7 +356,10 @@ const InteractiveAvatar = () => {
       "http://localhost:8000/upload_image",
       formData,
       {
-        headers: { "Content-Type": "multipart/form-data" },
+        headers: {
+          "Content-Type": "multipart/form-data",
+          ...getSessionHeaders(),
+        },
       },
     );
 